@@ -0,0 +1,332 @@
+# -*- coding: utf-8 -*-
+"""
+常驻预热浏览器守护进程
+守护进程启动并保持一个或多个已登录的 Chrome 实例（通过远程调试端口暴露），定期做健康检查；
+每次定时运行时通过远程调试地址接入空闲实例，打开新标签页使用，结束后关闭标签页并释放实例，
+省去 uc.Chrome 冷启动、补丁 chromedriver 和两次加载首页设置 Cookie 的开销。
+只有健康检查或会话检查失败时才重建实例；没有可用实例时回退到冷启动。
+
+用法：
+    python browser_daemon.py serve     # 启动守护进程
+    python browser_daemon.py status    # 查看实例状态
+"""
+import contextlib
+import fcntl
+import json
+import os
+import signal
+import sys
+import time
+import urllib.request
+
+from selenium import webdriver
+from selenium.webdriver.chrome.service import Service
+
+from browser_manager import managed_driver, kill_tree, teardown_driver, driver_pids
+from browser_memory import over_ceiling, sample_memory
+from network_capture import enable_capture
+from metrics import counter, gauge, inc, set_gauge, start_metrics_server
+from session_probe import EXPIRED, cookie_header_from_driver, probe_session
+
+STATE_PATH = os.environ.get("NS_DAEMON_STATE", ".browser_daemon.json")
+LOCK_PATH = STATE_PATH + ".lock"
+INSTANCES = int(os.environ.get("NS_DAEMON_INSTANCES", "1"))
+HEALTH_INTERVAL = float(os.environ.get("NS_DAEMON_HEALTH_INTERVAL", "60"))
+# 是否在运行时优先接入守护进程的预热实例
+USE_DAEMON = os.environ.get("NS_BROWSER_DAEMON", "false").lower() == "true"
+
+
+@contextlib.contextmanager
+def _locked_state():
+    """加锁读写实例状态文件"""
+    with open(LOCK_PATH, 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            state = {"daemon": None, "instances": []}
+            if os.path.exists(STATE_PATH):
+                try:
+                    with open(STATE_PATH, encoding='utf-8') as f:
+                        state = json.load(f)
+                except ValueError:
+                    pass
+            yield state
+            with open(STATE_PATH, 'w', encoding='utf-8') as f:
+                json.dump(state, f, ensure_ascii=False, indent=2)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _pid_alive(pid):
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def devtools_alive(debugger_address, timeout=3):
+    """远程调试端口是否正常响应"""
+    try:
+        with urllib.request.urlopen(f"http://{debugger_address}/json/version", timeout=timeout) as response:
+            return response.status == 200
+    except Exception:
+        return False
+
+
+def session_alive(driver):
+    """
+    页面可执行脚本，且用浏览器当前的 Cookie 探测登录状态没有确定失效
+    探测结果无法判断（网络错误、被防护页面拦截）时不重建实例
+    """
+    try:
+        driver.execute_script("return document.readyState")
+        status, reason = probe_session(cookie_header_from_driver(driver))
+    except Exception:
+        return False
+    if status == EXPIRED:
+        print(f"预热实例登录状态已失效：{reason}")
+        return False
+    return True
+
+
+def _instance_record(index, driver):
+    """根据守护进程持有的浏览器生成实例记录"""
+    debugger_address = driver.capabilities.get("goog:chromeOptions", {}).get("debuggerAddress")
+    patcher = getattr(driver, "patcher", None)
+    driver_path = getattr(patcher, "executable_path", None) or driver.service.path
+    return {
+        "id": index,
+        "debugger_address": debugger_address,
+        "driver_path": driver_path,
+        "pids": driver_pids(driver),
+        "leased_by": None,
+        "leased_at": None,
+        "healthy": True,
+        "created_at": time.time(),
+    }
+
+
+class WarmLease:
+    """接入预热实例得到的浏览器会话"""
+
+    def __init__(self, instance_id, driver, home_handle):
+        self.instance_id = instance_id
+        self.driver = driver
+        self.home_handle = home_handle
+
+
+def attach_warm_driver():
+    """
+    接入一个空闲且健康的预热实例并打开新标签页，没有可用实例时返回 None
+    """
+    if not os.path.exists(STATE_PATH):
+        return None
+    with _locked_state() as state:
+        if not _pid_alive(state.get("daemon")):
+            return None
+        chosen = None
+        for instance in state["instances"]:
+            # 持有者已退出的租约视为已释放
+            if instance["leased_by"] and not _pid_alive(instance["leased_by"]):
+                instance["leased_by"] = None
+            if instance["leased_by"] or not instance.get("healthy"):
+                continue
+            if devtools_alive(instance["debugger_address"]):
+                chosen = instance
+                break
+        if chosen is None:
+            return None
+        chosen["leased_by"] = os.getpid()
+        chosen["leased_at"] = time.time()
+
+    try:
+        options = webdriver.ChromeOptions()
+        options.debugger_address = chosen["debugger_address"]
+        enable_capture(options)
+        driver = webdriver.Chrome(service=Service(chosen["driver_path"]), options=options)
+        home_handle = driver.current_window_handle
+        driver.switch_to.new_window('tab')
+        print(f"已接入预热浏览器实例 {chosen['id']}（{chosen['debugger_address']}）")
+        return WarmLease(chosen["id"], driver, home_handle)
+    except Exception as e:
+        print(f"接入预热浏览器实例失败：{str(e)}")
+        _release(chosen["id"], healthy=False)
+        return None
+
+
+def _release(instance_id, healthy=True):
+    with _locked_state() as state:
+        for instance in state["instances"]:
+            if instance["id"] == instance_id and instance["leased_by"] == os.getpid():
+                instance["leased_by"] = None
+                instance["leased_at"] = None
+                # 标记为不健康的实例由守护进程重建
+                instance["healthy"] = instance.get("healthy", True) and healthy
+
+
+def release_warm_driver(lease):
+    """关闭本次打开的标签页，只停止本地 chromedriver，不关闭浏览器"""
+    healthy = True
+    try:
+        lease.driver.close()
+        lease.driver.switch_to.window(lease.home_handle)
+    except Exception as e:
+        print(f"关闭预热实例标签页出错：{str(e)}")
+        healthy = False
+    try:
+        lease.driver.service.stop()
+    except Exception:
+        pass
+    _release(lease.instance_id, healthy=healthy)
+    print(f"已释放预热浏览器实例 {lease.instance_id}")
+
+
+@contextlib.contextmanager
+def warm_or_cold_driver(factory):
+    """
+    NS_BROWSER_DAEMON=true 时优先接入预热实例，否则或没有可用实例时用 factory 冷启动
+    """
+    lease = attach_warm_driver() if USE_DAEMON else None
+    if lease is None:
+        if USE_DAEMON:
+            print("没有可用的预热浏览器实例，冷启动浏览器")
+        with managed_driver(factory) as driver:
+            yield driver
+        return
+    try:
+        yield lease.driver
+    finally:
+        release_warm_driver(lease)
+
+
+def _reap_previous_daemon():
+    """清理上一个已退出的守护进程遗留的浏览器"""
+    if not os.path.exists(STATE_PATH):
+        return
+    with _locked_state() as state:
+        if _pid_alive(state.get("daemon")) and state.get("daemon") != os.getpid():
+            print(f"守护进程 {state['daemon']} 仍在运行")
+            sys.exit(1)
+        for instance in state.get("instances", []):
+            for pid in instance.get("pids", []):
+                if _pid_alive(pid):
+                    kill_tree(pid)
+        state["daemon"] = None
+        state["instances"] = []
+
+
+DAEMON_READY = gauge("nodeseek_daemon_ready_instances", "Warm browser instances currently ready")
+DAEMON_REBUILDS = counter("nodeseek_daemon_rebuilds_total", "Warm instances rebuilt after a failed health check")
+
+
+def serve():
+    """启动并维护预热实例，直到收到 SIGTERM / SIGINT"""
+    # 延迟导入，避免客户端接入时加载整个评论脚本
+    from nodeseek_daily import setup_driver_and_cookies
+
+    _reap_previous_daemon()
+    drivers = {}
+
+    def _shutdown(signum, frame):
+        raise SystemExit(0)
+
+    signal.signal(signal.SIGTERM, _shutdown)
+    # NS_METRICS_PORT 非 0 时提供 /metrics，最近一次运行写入的 textfile 在 /metrics/run
+    start_metrics_server()
+
+    def _start(index):
+        driver = setup_driver_and_cookies()
+        if driver is None:
+            print(f"预热实例 {index} 启动失败，稍后重试")
+            return None
+        drivers[index] = driver
+        print(f"预热实例 {index} 已就绪")
+        return _instance_record(index, driver)
+
+    try:
+        with _locked_state() as state:
+            state["daemon"] = os.getpid()
+            state["instances"] = []
+        for index in range(INSTANCES):
+            record = _start(index)
+            if record:
+                with _locked_state() as state:
+                    state["instances"].append(record)
+        set_gauge(DAEMON_READY, len(drivers))
+
+        while True:
+            time.sleep(HEALTH_INTERVAL)
+            for index in range(INSTANCES):
+                # 在锁内确认实例空闲并标记为不可用，检查和重建期间运行中的脚本不会接入该实例
+                with _locked_state() as state:
+                    record = next((i for i in state["instances"] if i["id"] == index), None)
+                    if record and record["leased_by"] and _pid_alive(record["leased_by"]):
+                        continue
+                    was_healthy = record is not None and record.get("healthy", True)
+                    if record:
+                        record["leased_by"] = None
+                        record["healthy"] = False
+                driver = drivers.get(index)
+                healthy = (
+                    was_healthy
+                    and driver is not None
+                    and devtools_alive(record["debugger_address"])
+                    and session_alive(driver)
+                    # 租用期间的页面会留在浏览器中，超过内存上限时同样重建
+                    and not over_ceiling(sample_memory(driver))
+                )
+                if healthy:
+                    with _locked_state() as state:
+                        for instance in state["instances"]:
+                            if instance["id"] == index:
+                                instance["healthy"] = True
+                    continue
+                print(f"预热实例 {index} 健康检查失败，重建实例")
+                inc(DAEMON_REBUILDS)
+                if driver is not None:
+                    teardown_driver(driver)
+                    drivers.pop(index, None)
+                new_record = _start(index)
+                with _locked_state() as state:
+                    state["instances"] = [i for i in state["instances"] if i["id"] != index]
+                    if new_record:
+                        state["instances"].append(new_record)
+                set_gauge(DAEMON_READY, len(drivers))
+    finally:
+        for driver in drivers.values():
+            teardown_driver(driver)
+        with _locked_state() as state:
+            state["daemon"] = None
+            state["instances"] = []
+        print("守护进程已退出，预热实例已关闭")
+
+
+def status():
+    if not os.path.exists(STATE_PATH):
+        print("守护进程未运行")
+        return False
+    with _locked_state() as state:
+        running = _pid_alive(state.get("daemon"))
+        print(f"守护进程: {state.get('daemon')}（{'运行中' if running else '未运行'}）")
+        for instance in state.get("instances", []):
+            alive = devtools_alive(instance["debugger_address"])
+            leased = f"被 {instance['leased_by']} 使用" if instance["leased_by"] else "空闲"
+            print(f"  实例 {instance['id']}: {instance['debugger_address']} {'✓' if alive else '✗'} {leased}")
+    return running
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "status"
+    if command == "serve":
+        serve()
+        success = True
+    elif command == "status":
+        success = status()
+    else:
+        print(__doc__)
+        success = False
+    sys.exit(0 if success else 1)
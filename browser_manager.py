@@ -0,0 +1,331 @@
+# -*- coding: utf-8 -*-
+"""
+浏览器生命周期管理
+- managed_driver 上下文管理器保证无论正常结束、异常还是收到 SIGTERM 都会关闭浏览器并清理整个进程树
+- 启动时清理之前崩溃的运行遗留的 Chrome / chromedriver 进程
+- 后台采样浏览器进程树的 RSS，记录峰值
+
+进程信息通过 /proc 读取，非 Linux 系统上进程清理和内存采样为空操作
+"""
+import atexit
+import contextlib
+import json
+import os
+import signal
+import threading
+import time
+
+PIDFILE = os.environ.get("NS_BROWSER_PIDFILE", ".browser_pids.json")
+RSS_SAMPLE_INTERVAL = float(os.environ.get("NS_RSS_SAMPLE_INTERVAL", "5"))
+# 启动浏览器前写入环境变量的标记，chromedriver 和 Chrome 继承后据此识别本脚本启动的进程
+OWNER_ENV = "NS_BROWSER_OWNER"
+
+BROWSER_STATS = {"peak_rss": 0, "last_rss": 0, "reaped": 0}
+
+_PROC = "/proc"
+# 当前托管上下文的重启函数，供内存超限时重建浏览器
+_restart_hooks = []
+_page_size = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def _proc_available():
+    return os.path.isdir(_PROC)
+
+
+def _read_stat(pid):
+    """返回 (进程名, 父进程 pid, 状态)，进程不存在时返回 None"""
+    try:
+        with open(f"{_PROC}/{pid}/stat", encoding='utf-8', errors='replace') as f:
+            data = f.read()
+    except OSError:
+        return None
+    # 进程名在括号内，可能包含空格
+    name = data[data.index("(") + 1:data.rindex(")")]
+    fields = data[data.rindex(")") + 2:].split()
+    return name, int(fields[1]), fields[0]
+
+
+def _cmdline(pid):
+    try:
+        with open(f"{_PROC}/{pid}/cmdline", 'rb') as f:
+            return f.read().replace(b"\0", b" ").decode('utf-8', errors='replace')
+    except OSError:
+        return ""
+
+
+def _all_pids():
+    if not _proc_available():
+        return []
+    return [int(p) for p in os.listdir(_PROC) if p.isdigit()]
+
+
+def process_tree(root_pid):
+    """返回以 root_pid 为根的进程树中所有 pid（含根）"""
+    children = {}
+    for pid in _all_pids():
+        stat = _read_stat(pid)
+        if stat:
+            children.setdefault(stat[1], []).append(pid)
+    tree, stack = [], [root_pid]
+    while stack:
+        pid = stack.pop()
+        if not _alive_not_zombie(pid):
+            continue
+        tree.append(pid)
+        stack.extend(children.get(pid, ()))
+    return tree
+
+
+def tree_rss(root_pids):
+    """统计若干进程树的 RSS 总和（字节）"""
+    seen, total = set(), 0
+    for root in root_pids:
+        for pid in process_tree(root):
+            if pid in seen:
+                continue
+            seen.add(pid)
+            try:
+                with open(f"{_PROC}/{pid}/statm") as f:
+                    total += int(f.read().split()[1]) * _page_size
+            except (OSError, ValueError, IndexError):
+                continue
+    return total
+
+
+def kill_tree(root_pid, timeout=5):
+    """先 SIGTERM 再 SIGKILL 终止整个进程树"""
+    pids = process_tree(root_pid)
+    for sig in (signal.SIGTERM, signal.SIGKILL):
+        for pid in pids:
+            try:
+                os.kill(pid, sig)
+            except (ProcessLookupError, PermissionError):
+                continue
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            pids = [pid for pid in pids if _alive_not_zombie(pid)]
+            if not pids:
+                return
+            time.sleep(0.1)
+
+
+def _alive_not_zombie(pid):
+    stat = _read_stat(pid)
+    return stat is not None and stat[2] != "Z"
+
+
+def child_pids():
+    """当前进程的所有后代进程"""
+    return set(process_tree(os.getpid())) - {os.getpid()}
+
+
+def kill_spawned_since(snapshot):
+    """清理快照之后新启动的子进程，用于浏览器初始化失败时回收半启动的实例"""
+    for pid in child_pids() - snapshot:
+        kill_tree(pid)
+
+
+def driver_pids(driver):
+    """取得浏览器和 chromedriver 的 pid"""
+    pids = []
+    browser_pid = getattr(driver, "browser_pid", None)
+    if browser_pid:
+        pids.append(browser_pid)
+    try:
+        pids.append(driver.service.process.pid)
+    except AttributeError:
+        pass
+    return pids
+
+
+def _write_pidfile(pids):
+    try:
+        with open(PIDFILE, 'w', encoding='utf-8') as f:
+            json.dump({"owner": os.getpid(), "pids": pids, "time": time.time()}, f)
+    except OSError as e:
+        print(f"写入浏览器 pid 文件出错：{str(e)}")
+
+
+def _remove_pidfile():
+    try:
+        os.remove(PIDFILE)
+    except OSError:
+        pass
+
+
+def _owner_tag(pid):
+    """读取进程环境变量中的启动者标记，没有标记或无权读取时返回 None"""
+    try:
+        with open(f"{_PROC}/{pid}/environ", 'rb') as f:
+            environ = f.read().split(b"\0")
+    except OSError:
+        return None
+    prefix = f"{OWNER_ENV}=".encode()
+    for item in environ:
+        if item.startswith(prefix):
+            try:
+                return int(item[len(prefix):])
+            except ValueError:
+                return None
+    return None
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def reap_stale_browsers():
+    """
+    清理之前崩溃的运行遗留的进程：pid 文件中记录的浏览器进程树，
+    以及带有本脚本启动标记、且启动它的脚本进程已退出的孤儿 chromedriver 进程
+    （同一主机上其他程序的 chromedriver 没有该标记，不会被清理）
+    返回清理的进程树数量
+    """
+    if not _proc_available():
+        return 0
+    reaped = 0
+    if os.path.exists(PIDFILE):
+        try:
+            with open(PIDFILE, encoding='utf-8') as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            record = {}
+        owner = record.get("owner")
+        if owner and owner != os.getpid() and _pid_alive(owner):
+            print(f"浏览器 pid 文件属于仍在运行的进程 {owner}，不清理")
+        else:
+            for pid in record.get("pids", []):
+                cmd = _cmdline(pid)
+                if _pid_alive(pid) and ("chrome" in cmd or "chromium" in cmd):
+                    print(f"清理遗留的浏览器进程 {pid}")
+                    kill_tree(pid)
+                    reaped += 1
+            _remove_pidfile()
+    for pid in _all_pids():
+        stat = _read_stat(pid)
+        if not (stat and stat[1] == 1 and "chromedriver" in stat[0]):
+            continue
+        owner = _owner_tag(pid)
+        if owner and owner != os.getpid() and not _pid_alive(owner):
+            print(f"清理遗留的 chromedriver 进程 {pid}")
+            kill_tree(pid)
+            reaped += 1
+    BROWSER_STATS["reaped"] += reaped
+    return reaped
+
+
+class _RssSampler(threading.Thread):
+    """后台定期采样浏览器进程树 RSS，记录峰值"""
+
+    def __init__(self, pids):
+        super().__init__(daemon=True, name="browser-rss")
+        self.pids = pids
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            sample_browser_rss(self.pids)
+            self.stopped.wait(RSS_SAMPLE_INTERVAL)
+
+
+def sample_browser_rss(pids):
+    """采样一次进程树 RSS 并更新峰值，返回字节数"""
+    rss = tree_rss(pids)
+    BROWSER_STATS["last_rss"] = rss
+    BROWSER_STATS["peak_rss"] = max(BROWSER_STATS["peak_rss"], rss)
+    return rss
+
+
+def teardown_driver(driver):
+    """关闭浏览器并确保进程树全部退出"""
+    pids = driver_pids(driver)
+    try:
+        driver.quit()
+    except Exception as e:
+        print(f"关闭浏览器出错：{str(e)}")
+    for pid in pids:
+        if _proc_available() and _pid_alive(pid):
+            kill_tree(pid)
+    _remove_pidfile()
+
+
+def restart_driver(driver):
+    """
+    关闭 driver 并用当前托管上下文的 factory 重建浏览器，返回新的 driver
+    不在 managed_driver 上下文中或重建失败时返回原 driver
+    """
+    if not _restart_hooks:
+        print("当前浏览器不受托管，无法重启")
+        return driver
+    return _restart_hooks[-1](driver)
+
+
+def _raise_on_sigterm(signum, frame):
+    raise SystemExit(128 + signum)
+
+
+@contextlib.contextmanager
+def managed_driver(factory):
+    """
+    调用 factory() 创建浏览器，退出上下文时（包括异常和 SIGTERM）保证关闭浏览器及其进程树
+    factory 返回 None 时产出 None
+    """
+    reap_stale_browsers()
+    os.environ[OWNER_ENV] = str(os.getpid())
+    previous_handler = signal.signal(signal.SIGTERM, _raise_on_sigterm)
+    driver = None
+    sampler = None
+    torn_down = []
+
+    def _teardown():
+        if driver is not None and not torn_down:
+            torn_down.append(True)
+            if sampler:
+                sampler.stopped.set()
+                sample_browser_rss(sampler.pids)
+            teardown_driver(driver)
+
+    def _track(new_driver):
+        nonlocal sampler
+        pids = driver_pids(new_driver)
+        _write_pidfile(pids)
+        if _proc_available() and pids:
+            sampler = _RssSampler(pids)
+            sampler.start()
+
+    def _restart(old_driver):
+        nonlocal driver, sampler
+        # 先建好新浏览器再关闭旧的，重建失败时旧浏览器仍可继续使用
+        new_driver = factory()
+        if new_driver is None:
+            print("重建浏览器失败，继续使用原浏览器")
+            return old_driver
+        if sampler:
+            sampler.stopped.set()
+            sampler = None
+        teardown_driver(old_driver)
+        driver = new_driver
+        _track(driver)
+        return driver
+
+    # 兜底：解释器正常退出时也执行清理
+    atexit.register(_teardown)
+    _restart_hooks.append(_restart)
+    try:
+        driver = factory()
+        if driver is not None:
+            _track(driver)
+        yield driver
+    finally:
+        _restart_hooks.remove(_restart)
+        _teardown()
+        atexit.unregister(_teardown)
+        signal.signal(signal.SIGTERM, previous_handler)
+        if driver is not None:
+            print(f"浏览器已关闭，进程树 RSS 峰值: {BROWSER_STATS['peak_rss'] / 1024 / 1024:.1f} MB")
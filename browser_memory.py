@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+浏览器内存配置与运行时内存监控
+- NS_BROWSER_PROFILE=low_memory 时为 Chrome 追加低内存启动参数：限制渲染进程数、
+  关闭后台网络、扩展和用不到的功能、缩小 JS 堆、不加载图片
+- 每处理完一个帖子通过 CDP Performance.getMetrics 和进程树 RSS 采样内存，
+  定期把标签页重置为 about:blank，超过内存上限时重启浏览器
+"""
+import os
+
+from browser_manager import driver_pids, restart_driver, tree_rss
+
+PROFILE = os.environ.get("NS_BROWSER_PROFILE", "default")
+RENDERER_LIMIT = int(os.environ.get("NS_RENDERER_LIMIT", "2"))
+JS_HEAP_MB = int(os.environ.get("NS_JS_HEAP_MB", "256"))
+# 浏览器进程树 RSS 上限（MB），0 表示不限制
+MEMORY_CEILING_MB = float(os.environ.get("NS_BROWSER_MEMORY_CEILING", "0"))
+# 每处理多少个帖子把标签页重置为 about:blank，0 表示不重置；低内存配置下默认每个帖子都重置
+BLANK_RESET_EVERY = int(os.environ.get("NS_BLANK_RESET_EVERY", "1" if PROFILE == "low_memory" else "0"))
+
+LOW_MEMORY_ARGS = [
+    f"--renderer-process-limit={RENDERER_LIMIT}",
+    "--process-per-site",
+    "--disable-background-networking",
+    "--disable-extensions",
+    "--disable-component-extensions-with-background-pages",
+    "--disable-component-update",
+    "--disable-default-apps",
+    "--disable-sync",
+    "--disable-translate",
+    "--no-first-run",
+    "--mute-audio",
+    "--disable-features=Translate,OptimizationHints,MediaRouter,BackForwardCache,AutofillServerCommunication",
+    f"--js-flags=--max-old-space-size={JS_HEAP_MB}",
+    "--blink-settings=imagesEnabled=false",
+]
+
+MEMORY_STATS = {"samples": 0, "peak_js_heap": 0, "peak_rss": 0, "resets": 0, "restarts": 0}
+
+_posts_since_reset = 0
+_metrics_enabled = set()
+
+
+def apply_browser_profile(options):
+    """按 NS_BROWSER_PROFILE 为 ChromeOptions 追加启动参数"""
+    if PROFILE == "low_memory":
+        for arg in LOW_MEMORY_ARGS:
+            options.add_argument(arg)
+        print(f"使用低内存浏览器配置（渲染进程上限 {RENDERER_LIMIT}，JS 堆 {JS_HEAP_MB} MB）")
+    return options
+
+
+def sample_memory(driver):
+    """
+    采样一次浏览器内存，返回 {"js_heap": 字节, "nodes": DOM 节点数, "rss": 字节}
+    CDP 不可用时 js_heap / nodes 为 0
+    """
+    sample = {"js_heap": 0, "nodes": 0, "rss": 0}
+    try:
+        if id(driver) not in _metrics_enabled:
+            driver.execute_cdp_cmd("Performance.enable", {})
+            _metrics_enabled.add(id(driver))
+        metrics = driver.execute_cdp_cmd("Performance.getMetrics", {}).get("metrics", [])
+        values = {m["name"]: m["value"] for m in metrics}
+        sample["js_heap"] = int(values.get("JSHeapUsedSize", 0))
+        sample["nodes"] = int(values.get("Nodes", 0))
+    except Exception as e:
+        print(f"读取 CDP 内存指标出错：{str(e)}")
+    sample["rss"] = tree_rss(driver_pids(driver))
+    MEMORY_STATS["samples"] += 1
+    MEMORY_STATS["peak_js_heap"] = max(MEMORY_STATS["peak_js_heap"], sample["js_heap"])
+    MEMORY_STATS["peak_rss"] = max(MEMORY_STATS["peak_rss"], sample["rss"])
+    return sample
+
+
+def over_ceiling(sample):
+    return MEMORY_CEILING_MB > 0 and sample["rss"] > MEMORY_CEILING_MB * 1024 * 1024
+
+
+def after_post(driver):
+    """
+    每处理完一个帖子调用：按需重置标签页、采样内存，超过上限时重启浏览器
+    返回之后应继续使用的 driver（可能是重启后的新实例）
+    """
+    global _posts_since_reset
+    _posts_since_reset += 1
+    # 先在刚处理完的帖子页面上采样，重置为空白页后再采样就看不到峰值了
+    sample = sample_memory(driver)
+    print(
+        f"浏览器内存：RSS {sample['rss'] / 1024 / 1024:.1f} MB，"
+        f"JS 堆 {sample['js_heap'] / 1024 / 1024:.1f} MB，DOM 节点 {sample['nodes']}"
+    )
+    if BLANK_RESET_EVERY and _posts_since_reset >= BLANK_RESET_EVERY:
+        try:
+            driver.get("about:blank")
+            MEMORY_STATS["resets"] += 1
+        except Exception as e:
+            print(f"重置标签页出错：{str(e)}")
+        _posts_since_reset = 0
+
+    if not over_ceiling(sample):
+        return driver
+    print(f"浏览器内存超过上限 {MEMORY_CEILING_MB:.0f} MB，重启浏览器")
+    new_driver = restart_driver(driver)
+    if new_driver is not driver:
+        MEMORY_STATS["restarts"] += 1
+        _posts_since_reset = 0
+    return new_driver
+
+
+def memory_stats_summary():
+    """返回本次运行的浏览器内存统计"""
+    return (
+        f"浏览器内存：采样 {MEMORY_STATS['samples']} 次，RSS 峰值 {MEMORY_STATS['peak_rss'] / 1024 / 1024:.1f} MB，"
+        f"JS 堆峰值 {MEMORY_STATS['peak_js_heap'] / 1024 / 1024:.1f} MB，"
+        f"重置标签页 {MEMORY_STATS['resets']} 次，超限重启 {MEMORY_STATS['restarts']} 次"
+    )
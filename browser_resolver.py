@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+浏览器和 ChromeDriver 版本解析缓存
+首次解析时查找浏览器、读取版本、找到主版本匹配的 chromedriver，把路径、版本和校验和写入清单文件；
+之后的运行只对浏览器二进制做一次 stat，mtime 和大小不变时直接使用清单，
+浏览器更新后才重新解析。chromedriver 被 undetected-chromedriver 就地打补丁后只重新计算校验和。
+
+用法：
+    python diagnose.py --refresh   # 强制重新解析并写入清单
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import time
+
+MANIFEST_PATH = os.environ.get("NS_BROWSER_MANIFEST", ".browser_manifest.json")
+
+CHROME_CANDIDATES = [
+    os.environ.get("NS_CHROME_PATH"),
+    '/usr/bin/google-chrome',
+    '/opt/hostedtoolcache/setup-chrome/chromium/stable/x64/chrome',
+    '/usr/bin/chromium',
+    '/usr/bin/chromium-browser',
+]
+
+DRIVER_CANDIDATES = [
+    os.environ.get("NS_CHROMEDRIVER_PATH"),
+    '/usr/local/bin/chromedriver',
+    shutil.which('chromedriver'),
+]
+
+
+def _stat(path):
+    st = os.stat(path)
+    return {"mtime": st.st_mtime, "size": st.st_size}
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _version(path):
+    """运行 --version，返回 (版本字符串, 主版本号)"""
+    output = subprocess.run([path, '--version'], capture_output=True, text=True, timeout=10).stdout.strip()
+    match = re.search(r'(\d+)(?:\.\d+)+', output)
+    return (match.group(0), int(match.group(1))) if match else (output, None)
+
+
+def find_browser():
+    for path in CHROME_CANDIDATES:
+        if path and os.path.exists(path):
+            return path
+    return None
+
+
+def _driver_entry(path):
+    version, major = _version(path)
+    return {"driver_path": path, "driver_version": version, "driver_major": major,
+            "driver_stat": _stat(path), "driver_sha256": _sha256(path)}
+
+
+def _find_driver(browser_major, allow_download):
+    """优先使用本地主版本匹配的 chromedriver，找不到时可选用 webdriver_manager 下载"""
+    fallback = None
+    for path in DRIVER_CANDIDATES:
+        if not path or not os.path.exists(path):
+            continue
+        entry = _driver_entry(path)
+        if entry["driver_major"] == browser_major:
+            return entry
+        fallback = fallback or entry
+    if allow_download:
+        try:
+            from webdriver_manager.chrome import ChromeDriverManager
+            print("本地没有匹配的 ChromeDriver，使用 webdriver_manager 获取...")
+            return _driver_entry(ChromeDriverManager().install())
+        except Exception as e:
+            print(f"webdriver_manager 获取驱动失败：{str(e)}")
+    return fallback
+
+
+def _load_manifest():
+    if not os.path.exists(MANIFEST_PATH):
+        return None
+    try:
+        with open(MANIFEST_PATH, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _save_manifest(manifest):
+    try:
+        with open(MANIFEST_PATH, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+    except OSError as e:
+        print(f"写入浏览器清单出错：{str(e)}")
+
+
+def _full_resolve(allow_download):
+    browser_path = find_browser()
+    if not browser_path:
+        print("✗ 未找到 Chrome 浏览器")
+        return None
+    version, major = _version(browser_path)
+    manifest = {
+        "browser_path": browser_path,
+        "browser_version": version,
+        "browser_major": major,
+        "browser_stat": _stat(browser_path),
+        "driver_path": None,
+        "resolved_at": time.time(),
+    }
+    driver = _find_driver(major, allow_download)
+    if driver:
+        manifest.update(driver)
+        if driver["driver_major"] != major:
+            print(f"✗ ChromeDriver {driver['driver_version']} 与 Chrome {version} 主版本不一致")
+    _save_manifest(manifest)
+    return manifest
+
+
+def resolve(refresh=False, allow_download=False):
+    """
+    返回浏览器清单：browser_path / browser_version / browser_major / driver_path / driver_version / driver_sha256 等
+    清单有效时不启动任何子进程；找不到浏览器时返回 None
+    allow_download: 本地没有匹配的 chromedriver 时允许用 webdriver_manager 下载
+    """
+    manifest = None if refresh else _load_manifest()
+    try:
+        if manifest is None or not os.path.exists(manifest["browser_path"]) \
+                or _stat(manifest["browser_path"]) != manifest["browser_stat"]:
+            return _full_resolve(allow_download)
+        driver_path = manifest.get("driver_path")
+        if not driver_path or not os.path.exists(driver_path):
+            return _full_resolve(allow_download)
+        if _stat(driver_path) != manifest["driver_stat"]:
+            # 驱动文件被替换或打过补丁，只重新检查驱动
+            manifest.update(_driver_entry(driver_path))
+            _save_manifest(manifest)
+        return manifest
+    except (OSError, KeyError, subprocess.SubprocessError) as e:
+        print(f"解析浏览器版本出错：{str(e)}")
+        return None
+
+
+def describe(manifest):
+    if not manifest:
+        return "未解析到浏览器"
+    return (
+        f"Chrome {manifest['browser_version']}（{manifest['browser_path']}），"
+        f"ChromeDriver {manifest.get('driver_version') or '未找到'}（{manifest.get('driver_path') or '-'}）"
+    )
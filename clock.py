@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+可注入的时钟
+评论节奏、配额、会话探测等调度相关的等待和时间读取统一经过这里，默认使用真实时间；
+模拟模式安装 VirtualClock 后 sleep 立即返回并推进虚拟时间，一整天的评论流程几秒钟即可跑完。
+浏览器进程管理、诊断采集预算等衡量真实开销的代码仍直接使用 time 模块。
+"""
+import time as _time
+
+
+class RealClock:
+    def time(self):
+        return _time.time()
+
+    def sleep(self, seconds):
+        _time.sleep(seconds)
+
+
+class VirtualClock:
+    """sleep 只推进虚拟时间，并把等待和标记的事件记录到时间线"""
+
+    def __init__(self, start=None):
+        self.now = _time.time() if start is None else start
+        self.start = self.now
+        self.slept = 0.0
+        self.timeline = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        seconds = max(0.0, float(seconds))
+        self.now += seconds
+        self.slept += seconds
+
+    def advance(self, seconds):
+        """模拟耗时操作（页面加载、大模型调用等）占用的时间，不计入等待"""
+        self.now += max(0.0, float(seconds))
+
+    def mark(self, event, detail=""):
+        self.timeline.append((self.now - self.start, event, detail))
+
+
+_clock = RealClock()
+
+
+def install(clock):
+    """替换当前时钟，返回之前的时钟以便恢复"""
+    global _clock
+    previous, _clock = _clock, clock
+    return previous
+
+
+def current():
+    return _clock
+
+
+def now():
+    return _clock.time()
+
+
+def sleep(seconds):
+    _clock.sleep(seconds)
+
+
+def ctime():
+    return _time.ctime(now())
+
+
+def today():
+    return _time.strftime("%Y-%m-%d", _time.localtime(now()))
+
+
+def mark(event, detail=""):
+    """在虚拟时钟的时间线上记录事件，真实时钟下不做任何事"""
+    if isinstance(_clock, VirtualClock):
+        _clock.mark(event, detail)
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""
+评论提交确认
+点击发布前在页面内安装 MutationObserver，并拦截 fetch / XMLHttpRequest 的 POST 响应；
+提交后新增或由当前登录用户发布的评论节点（不含主帖）包含我们的回复内容时判定为成功，
+出现匹配错误文案的提示或评论提交接口返回错误状态时判定为失败。
+只有确认成功的评论才计入每日配额，被拒绝或限流的提交不会占用等待时间。
+"""
+import os
+import re
+
+from metrics import COMMENTS, inc
+
+CONFIRM_TIMEOUT = float(os.environ.get("NS_CONFIRM_TIMEOUT", "15"))
+
+# 提交评论的接口，只有这些 POST 请求的错误状态才算作评论被拒绝
+COMMENT_ENDPOINT = os.environ.get("NS_COMMENT_ENDPOINT", r"comment")
+
+# 页面内共用的函数：评论节点是否为本次提交新增或由当前登录用户发布
+_ITEM_HELPERS = """
+function textOf(node) { return (node.innerText || node.textContent || '').trim(); }
+function spaceId(a) {
+    var m = a && (a.getAttribute('href') || '').match(/\\/space\\/(\\d+)/);
+    return m ? m[1] : null;
+}
+function isOurs(item, beforeCount) {
+    var items = Array.prototype.slice.call(document.querySelectorAll('.content-item'));
+    var index = items.indexOf(item);
+    // 第一个节点是主帖，正文里可能就包含要求回复的内容
+    if (index <= 0) return false;
+    var me = spaceId(document.querySelector('header a[href*="/space/"]'));
+    var author = item.querySelector('.author-name');
+    if (me !== null && spaceId(author && author.closest('a')) === me) return true;
+    return index >= beforeCount;
+}
+"""
+
+INSTALL_SCRIPT = """
+var expected = arguments[0].replace(/\\s+/g, '');
+var errorPattern = new RegExp(arguments[1], 'i');
+var endpoint = new RegExp(arguments[2], 'i');
+var state = window.__nsConfirm = {status: null, detail: '', http_status: null, start: Date.now(), latency: null};
+""" + _ITEM_HELPERS + """
+state.beforeCount = document.querySelectorAll('.content-item').length;
+
+function finish(status, detail) {
+    if (state.status) return;
+    state.status = status;
+    state.detail = detail || '';
+    state.latency = Date.now() - state.start;
+    if (state.observer) state.observer.disconnect();
+}
+
+function inspect(node) {
+    if (node.nodeType !== 1) return;
+    var items = node.matches('.content-item') ? [node] : Array.prototype.slice.call(node.querySelectorAll('.content-item'));
+    for (var i = 0; i < items.length; i++) {
+        if (isOurs(items[i], state.beforeCount) && textOf(items[i]).replace(/\\s+/g, '').indexOf(expected) !== -1) {
+            finish('confirmed', '');
+            return;
+        }
+    }
+    // 只有匹配错误文案的提示才算失败，“评论成功”之类的提示忽略
+    var selector = '.msc-confirm, .toast, .message, [class*="toast"], [class*="notice"]';
+    var toast = node.matches(selector) ? node : node.querySelector(selector);
+    if (toast && errorPattern.test(textOf(toast))) {
+        finish('error', textOf(toast).slice(0, 200));
+    }
+}
+
+state.observer = new MutationObserver(function (mutations) {
+    mutations.forEach(function (m) { Array.prototype.forEach.call(m.addedNodes, inspect); });
+});
+state.observer.observe(document.body, {childList: true, subtree: true});
+
+function onResponse(method, status, url) {
+    if ((method || 'GET').toUpperCase() !== 'POST' || !endpoint.test(url || '')) return;
+    state.http_status = status;
+    if (status >= 400) finish('error', 'HTTP ' + status);
+}
+
+if (!window.__nsFetchHooked) {
+    window.__nsFetchHooked = true;
+    var originalFetch = window.fetch;
+    window.fetch = function (input, init) {
+        var method = (init && init.method) || (input && input.method);
+        var url = typeof input === 'string' ? input : (input && input.url);
+        return originalFetch.apply(this, arguments).then(function (response) {
+            if (window.__nsOnResponse) window.__nsOnResponse(method, response.status, url);
+            return response;
+        });
+    };
+    var originalOpen = XMLHttpRequest.prototype.open;
+    XMLHttpRequest.prototype.open = function (method, url) {
+        this.addEventListener('loadend', function () {
+            if (window.__nsOnResponse) window.__nsOnResponse(method, this.status, String(url));
+        });
+        return originalOpen.apply(this, arguments);
+    };
+}
+window.__nsOnResponse = onResponse;
+return state.beforeCount;
+"""
+
+WAIT_SCRIPT = """
+var timeoutMs = arguments[0];
+var done = arguments[arguments.length - 1];
+var started = Date.now();
+(function poll() {
+    var state = window.__nsConfirm;
+    if (!state) { done({status: 'timeout', detail: '确认脚本未安装'}); return; }
+    if (state.status) {
+        done({status: state.status, detail: state.detail, http_status: state.http_status, latency: state.latency});
+        return;
+    }
+    if (Date.now() - started > timeoutMs) {
+        if (state.observer) state.observer.disconnect();
+        done({status: 'timeout', detail: '', http_status: state.http_status, latency: Date.now() - state.start});
+        return;
+    }
+    setTimeout(poll, 100);
+})();
+"""
+
+# 提交后页面整体刷新时监听会丢失，超时后直接在页面中查找我们的评论（跳过主帖和提交前已有的评论）
+PRESENT_SCRIPT = """
+var expected = arguments[0].replace(/\\s+/g, ''), beforeCount = arguments[1];
+""" + _ITEM_HELPERS + """
+return Array.prototype.some.call(document.querySelectorAll('.content-item'), function (item) {
+    return isOurs(item, beforeCount) && textOf(item).replace(/\\s+/g, '').indexOf(expected) !== -1;
+});
+"""
+
+# 错误提示文本对应的原因
+ERROR_PATTERNS = (
+    ("too_fast", re.compile(r'太快|频繁|稍后|冷却|too fast|rate.?limit', re.I)),
+    ("captcha", re.compile(r'验证码|人机|captcha|verify', re.I)),
+)
+
+CONFIRM_STATS = {"confirmed": 0, "rejected": 0, "timeout": 0}
+
+# 最近一次确认结果，供调用方读取失败原因和提交耗时
+last_confirmation = {}
+# 安装监听时页面上已有的评论节点数（含主帖）
+_before_count = 0
+
+
+def classify_error(detail, http_status=None):
+    """把错误提示归类为 too_fast / captcha / rate_limited / forbidden / error"""
+    if http_status == 429:
+        return "rate_limited"
+    for reason, pattern in ERROR_PATTERNS:
+        if pattern.search(detail or ""):
+            return reason
+    if http_status == 403:
+        return "forbidden"
+    return "error"
+
+
+def install_confirmation(driver, input_text):
+    """点击发布前调用，安装评论确认监听"""
+    global _before_count
+    error_source = "|".join(pattern.pattern for _, pattern in ERROR_PATTERNS)
+    _before_count = driver.execute_script(INSTALL_SCRIPT, input_text, error_source, COMMENT_ENDPOINT) or 0
+
+
+def wait_confirmation(driver, input_text, timeout=None):
+    """
+    点击发布后调用，等待评论出现或错误提示，返回
+    {"status": confirmed/error/timeout, "reason", "detail", "http_status", "latency"}
+    """
+    global last_confirmation
+    timeout = CONFIRM_TIMEOUT if timeout is None else timeout
+    try:
+        driver.set_script_timeout(max(30, timeout + 5))
+        result = driver.execute_async_script(WAIT_SCRIPT, int(timeout * 1000))
+    except Exception as e:
+        result = {"status": "timeout", "detail": f"等待确认出错：{str(e)}"}
+    result = dict(result or {"status": "timeout"})
+    result["latency"] = (result.get("latency") or 0) / 1000
+    if result["status"] == "timeout":
+        try:
+            if driver.execute_script(PRESENT_SCRIPT, input_text, _before_count):
+                result["status"] = "confirmed"
+        except Exception:
+            pass
+    if result["status"] == "confirmed":
+        CONFIRM_STATS["confirmed"] += 1
+        result["reason"] = None
+    elif result["status"] == "error":
+        CONFIRM_STATS["rejected"] += 1
+        result["reason"] = classify_error(result.get("detail"), result.get("http_status"))
+    else:
+        CONFIRM_STATS["timeout"] += 1
+        result["reason"] = "timeout"
+    inc(COMMENTS, outcome=result["status"])
+    last_confirmation = result
+    return result
+
+
+def confirm_stats_summary():
+    """返回评论确认的统计"""
+    return (
+        f"评论确认：成功 {CONFIRM_STATS['confirmed']} 条，被拒绝 {CONFIRM_STATS['rejected']} 条，"
+        f"超时未确认 {CONFIRM_STATS['timeout']} 条"
+    )
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+跨进程共享的评论记录
+每日定时任务和抽奖监听进程共用一份加锁的状态文件：
+- 当天的评论配额和已评论数，两边的评论都计入同一个配额
+- 已评论过的帖子 URL，任一进程评论过的帖子另一边不再评论
+- 下一次评论不早于的时间点，以及正在评论的进程占位，保证两边的评论之间同样遵守间隔
+评论成功或提交未确认后只记录下一次评论的时间点，不在评论后阻塞等待
+"""
+import contextlib
+import fcntl
+import json
+import os
+import random
+
+import clock
+
+LEDGER_PATH = os.environ.get("NS_COMMENT_LEDGER", "comment_ledger.json")
+LOCK_PATH = LEDGER_PATH + ".lock"
+# 每日评论配额的随机区间，当天第一次使用时确定
+DAILY_MIN_COMMENTS = 20
+DAILY_MAX_COMMENTS = 25
+# 已评论 URL 的保留天数
+URL_KEEP_DAYS = 7
+# 评论占位超过该秒数仍未释放时视为持有进程已卡住
+SLOT_TIMEOUT = 600
+# 其他进程正在评论时的重试间隔
+SLOT_RETRY = 30
+
+
+@contextlib.contextmanager
+def _locked_ledger():
+    """加锁读写评论记录，换天时重新确定配额并清理过期的 URL"""
+    with open(LOCK_PATH, 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            state = {"day": None, "limit": 0, "count": 0, "urls": {}, "not_before": 0, "holder": None, "held_at": None}
+            if os.path.exists(LEDGER_PATH):
+                try:
+                    with open(LEDGER_PATH, encoding='utf-8') as f:
+                        state.update(json.load(f))
+                except ValueError:
+                    pass
+            today = clock.today()
+            if state["day"] != today:
+                state["day"] = today
+                state["limit"] = random.randint(DAILY_MIN_COMMENTS, DAILY_MAX_COMMENTS)
+                state["count"] = 0
+                cutoff = clock.now() - URL_KEEP_DAYS * 86400
+                state["urls"] = {url: ts for url, ts in state["urls"].items() if ts >= cutoff}
+            yield state
+            with open(LEDGER_PATH, 'w', encoding='utf-8') as f:
+                json.dump(state, f, ensure_ascii=False, indent=2)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _pid_alive(pid):
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def daily_quota():
+    """返回 (今日配额, 今日已评论数)"""
+    with _locked_ledger() as state:
+        return state["limit"], state["count"]
+
+
+def recent_commented_urls():
+    """返回近几天内任一进程评论过的帖子 URL 集合"""
+    with _locked_ledger() as state:
+        return set(state["urls"])
+
+
+def _slot_wait(state):
+    if state["count"] >= state["limit"]:
+        return None
+    holder = state["holder"]
+    if holder and holder != os.getpid() and _pid_alive(holder) and clock.now() - (state["held_at"] or 0) < SLOT_TIMEOUT:
+        return max(SLOT_RETRY, state["not_before"] - clock.now())
+    return max(0, state["not_before"] - clock.now())
+
+
+def slot_wait():
+    """距离可以评论还需等待的秒数，0 表示现在可以评论，今日配额已用完时返回 None"""
+    with _locked_ledger() as state:
+        return _slot_wait(state)
+
+
+def acquire_slot():
+    """
+    可以评论时占住评论位并返回 0，其他进程释放前不会开始评论；
+    否则返回需要等待的秒数，今日配额已用完时返回 None
+    """
+    with _locked_ledger() as state:
+        wait = _slot_wait(state)
+        if wait == 0:
+            state["holder"] = os.getpid()
+            state["held_at"] = clock.now()
+        return wait
+
+
+def wait_for_slot():
+    """阻塞直到占住评论位，今日配额已用完时返回 False"""
+    while True:
+        wait = acquire_slot()
+        if wait is None:
+            return False
+        if wait <= 0:
+            return True
+        print(f"距离上一次评论不足间隔，等待 {wait/60:.1f} 分钟...")
+        clock.sleep(wait)
+
+
+def release_slot(url=None, wait=0):
+    """
+    释放评论位；url 非空表示该帖子评论成功，计入配额和已评论记录
+    wait 为下一次评论前至少间隔的秒数，0 表示本次没有提交，不影响间隔
+    """
+    with _locked_ledger() as state:
+        if state["holder"] == os.getpid():
+            state["holder"] = None
+            state["held_at"] = None
+        if url:
+            state["count"] += 1
+            state["urls"][url] = clock.now()
+        if wait:
+            state["not_before"] = max(state["not_before"], clock.now() + wait)
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+提示词正文压缩
+去掉代码块、引用、末尾签名和链接，只保留开头段落以及包含抽奖、截止时间等关键词的句子，
+按提示词类型控制 token 预算，并统计节省的 token 和与完整正文判断结果的一致率
+"""
+import os
+import random
+import re
+
+# 各类型提示词的正文 token 预算
+TOKEN_BUDGETS = {
+    "is_real": int(os.environ.get("NS_PROMPT_BUDGET_IS_REAL", "200")),
+    "ended": int(os.environ.get("NS_PROMPT_BUDGET_ENDED", "250")),
+    "reply": int(os.environ.get("NS_PROMPT_BUDGET_REPLY", "300")),
+}
+# 以该比例抽样，额外用完整正文再判断一次，统计压缩对准确率的影响
+SHADOW_RATE = float(os.environ.get("NS_COMPACT_SHADOW_RATE", "0"))
+
+# 开头段落保留的最大 token 数
+LEAD_TOKENS = 80
+
+KEYWORDS = (
+    "抽奖", "抽", "奖", "送", "福利", "赠", "免费", "名额", "中奖", "开奖", "参与", "回复", "评论", "留言",
+    "截止", "结束", "时间", "规则", "条件", "要求", "楼层", "随机", "已开", "活动",
+)
+DEADLINE_RE = re.compile(
+    r'\d{1,2}\s*月\s*\d{1,2}\s*[日号]|\d{1,2}\s*[日号]|\d{1,2}[:：]\d{2}|周[一二三四五六日天]|星期[一二三四五六日天]|'
+    r'今[天晚日]|明[天晚日]|后天|\d+\s*(?:小时|天)后|\d{4}[-/.]\d{1,2}[-/.]\d{1,2}'
+)
+
+# 接口返回的正文是 Markdown：``` 围起来的代码块，以及空行后每行缩进 4 个空格或制表符的代码块
+_CODE_BLOCK_RE = re.compile(r'```.*?(?:```|$)', re.S)
+_INDENTED_CODE_RE = re.compile(r'(^|\n\n)((?:(?: {4}|\t).*(?:\n|\Z))+)')
+_QUOTE_LINE_RE = re.compile(r'^\s*[>＞].*$', re.M)
+_URL_RE = re.compile(r'https?://\S+|www\.\S+')
+# 签名最多的行数，分隔线之后超过该行数的多半是正文中的分隔线
+SIGNATURE_MAX_LINES = 5
+# 签名：-- 、—— 、___ 等独占一行的分隔线之后，到正文结尾只剩几行
+_SIGNATURE_RE = re.compile(
+    rf'^[ \t]*(?:--[ \t]*|[-—_=]{{3,}})[ \t]*$(?:\n[^\n]*){{0,{SIGNATURE_MAX_LINES}}}\s*\Z', re.M
+)
+_SENTENCE_RE = re.compile(r'[^。！？!?；;\n]+[。！？!?；;]?')
+_CJK_RE = re.compile(r'[　-鿿＀-￯]')
+
+COMPACT_STATS = {}
+
+
+def estimate_tokens(text):
+    """粗略估算 token 数：中日韩字符每字约 1 个，其他字符每 4 个约 1 个"""
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def _drop_unless_relevant(match):
+    return match.group(0) if _is_relevant(match.group(0)) else ""
+
+
+def strip_noise(post_content):
+    """
+    去掉代码块、引用行、末尾签名和链接
+    包含抽奖关键词或时间的引用行和末尾段落保留，楼主常把规则和开奖时间写在引用里
+    """
+    text = _CODE_BLOCK_RE.sub(" ", post_content or "")
+    text = _INDENTED_CODE_RE.sub(lambda m: m.group(1) + "\n", text)
+    text = _SIGNATURE_RE.sub(_drop_unless_relevant, text)
+    text = _QUOTE_LINE_RE.sub(_drop_unless_relevant, text)
+    text = _URL_RE.sub("", text)
+    return text
+
+
+def _is_relevant(sentence):
+    return any(k in sentence for k in KEYWORDS) or DEADLINE_RE.search(sentence) is not None
+
+
+def compact_content(post_content, prompt_type):
+    """
+    按提示词类型压缩正文：保留开头段落和包含关键词的句子，总量不超过 token 预算
+    """
+    budget = TOKEN_BUDGETS.get(prompt_type, TOKEN_BUDGETS["reply"])
+    sentences = [s.strip() for s in _SENTENCE_RE.findall(strip_noise(post_content))]
+    sentences = [s for s in sentences if s]
+
+    picked = set()
+    used = 0
+    # 开头段落
+    for i, sentence in enumerate(sentences):
+        cost = estimate_tokens(sentence)
+        if used + cost > min(LEAD_TOKENS, budget) and picked:
+            break
+        picked.add(i)
+        used += cost
+    # 关键句
+    for i, sentence in enumerate(sentences):
+        if i in picked or not _is_relevant(sentence):
+            continue
+        cost = estimate_tokens(sentence)
+        if used + cost > budget:
+            continue
+        picked.add(i)
+        used += cost
+
+    compacted = " ".join(sentences[i] for i in sorted(picked))
+    # 单句超长时按字符截断兜底
+    while compacted and estimate_tokens(compacted) > budget:
+        compacted = compacted[:int(len(compacted) * 0.9)]
+
+    stats = COMPACT_STATS.setdefault(prompt_type, {"calls": 0, "original": 0, "compacted": 0, "shadow": 0, "agree": 0})
+    stats["calls"] += 1
+    stats["original"] += estimate_tokens(post_content or "")
+    stats["compacted"] += estimate_tokens(compacted)
+    return compacted
+
+
+def should_shadow():
+    """是否对本次判断额外使用完整正文做对比"""
+    return SHADOW_RATE > 0 and random.random() < SHADOW_RATE
+
+
+def record_shadow(prompt_type, agree):
+    """记录一次压缩正文与完整正文判断结果的对比"""
+    stats = COMPACT_STATS.setdefault(prompt_type, {"calls": 0, "original": 0, "compacted": 0, "shadow": 0, "agree": 0})
+    stats["shadow"] += 1
+    stats["agree"] += bool(agree)
+
+
+def compact_stats_summary():
+    """返回各类型提示词节省的 token 和对比一致率"""
+    if not COMPACT_STATS:
+        return "正文压缩：无"
+    lines = []
+    for prompt_type, stats in COMPACT_STATS.items():
+        saved = stats["original"] - stats["compacted"]
+        rate = saved / stats["original"] * 100 if stats["original"] else 0
+        line = f"{prompt_type}: {stats['calls']} 次，正文 token {stats['original']} -> {stats['compacted']}（节省 {rate:.1f}%）"
+        if stats["shadow"]:
+            line += f"，与完整正文一致 {stats['agree']}/{stats['shadow']}"
+        lines.append(line)
+    return "正文压缩统计：\n  " + "\n  ".join(lines)
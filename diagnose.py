@@ -2,49 +2,60 @@
 """
 NodeSeek 脚本诊断和修复工具
 用于解决 ChromeDriver 版本不匹配问题
+
+用法：
+    python diagnose.py                  # 检查环境
+    python diagnose.py --refresh        # 重新解析浏览器版本
+    python diagnose.py --perf           # 性能自检，结果写入 JSON
+    python diagnose.py --perf --compare perf_report_old.json
 """
 import subprocess
-import os
 import sys
-import re
-
-def check_chrome_installed():
-    """检查 Chrome 是否已安装"""
-    chrome_paths = [
-        '/opt/hostedtoolcache/setup-chrome/chromium/stable/x64/chrome',
-        '/usr/bin/google-chrome',
-        '/usr/bin/chromium',
-        '/usr/bin/chromium-browser',
-    ]
-    
-    for path in chrome_paths:
-        if os.path.exists(path):
-            print(f"✓ 找到 Chrome: {path}")
-            return path
-    
-    print("✗ 未找到 Chrome 浏览器")
-    return None
+import argparse
+import http.server
+import json
+import os
+import platform
+import socket
+import statistics
+import threading
+import time
 
-def get_chrome_version(chrome_path):
-    """获取 Chrome 版本"""
-    try:
-        result = subprocess.run(
-            [chrome_path, '--version'],
-            capture_output=True,
-            text=True,
-            timeout=5
-        )
-        if result.returncode == 0:
-            version_str = result.stdout.strip()
-            match = re.search(r'(\d+)', version_str)
-            if match:
-                version = int(match.group(1))
-                print(f"✓ Chrome 版本: {version_str.strip()}")
-                return version
-    except Exception as e:
-        print(f"✗ 获取 Chrome 版本失败: {str(e)}")
-    
-    return None
+from browser_resolver import MANIFEST_PATH, resolve
+
+# 性能自检测量导入耗时的模块
+HEAVY_MODULES = ['selenium.webdriver', 'undetected_chromedriver', 'requests', 'bs4', 'curl_cffi']
+WEBDRIVER_RTT_SAMPLES = 20
+ENDPOINT_RTT_SAMPLES = 5
+# 没有配置大模型服务时，测量到该地址的往返延迟作为替代
+PERF_ENDPOINT = os.environ.get("NS_PERF_ENDPOINT", "https://generativelanguage.googleapis.com/")
+
+# 结构与论坛首页帖子列表相近的本地测试页面
+FIXTURE_HTML = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>fixture</title></head>
+<body><ul class="post-list">%s</ul></body></html>
+""" % "".join(
+    f'<li class="post-list-item"><div class="post-title"><a href="/post-{i}-1">测试帖子 {i}</a></div>'
+    f'<div class="post-info">作者 {i} · {i} 回复</div></li>'
+    for i in range(100)
+)
+
+def check_chrome(refresh=False):
+    """通过浏览器清单检查 Chrome 和 ChromeDriver，refresh 时强制重新解析"""
+    manifest = resolve(refresh=refresh)
+    if not manifest:
+        print("✗ 未找到 Chrome 浏览器")
+        return None
+    print(f"✓ 找到 Chrome: {manifest['browser_path']}")
+    print(f"✓ Chrome 版本: {manifest['browser_version']}")
+    if manifest.get("driver_path"):
+        mark = "✓" if manifest.get("driver_major") == manifest["browser_major"] else "✗"
+        print(f"{mark} ChromeDriver: {manifest['driver_path']}（{manifest['driver_version']}）")
+        print(f"  sha256: {manifest['driver_sha256']}")
+    else:
+        print("✗ 未找到 ChromeDriver")
+    print(f"  清单: {MANIFEST_PATH}（{'已重新解析' if refresh else '缓存有效时直接使用'}）")
+    return manifest
 
 def check_python_packages():
     """检查必要的 Python 包"""
@@ -85,7 +96,7 @@ def install_packages(packages):
         print(f"✗ 包安装失败: {str(e)}")
         return False
 
-def diagnose():
+def diagnose(refresh=False):
     """运行诊断"""
     print("=" * 50)
     print("NodeSeek 脚本诊断工具")
@@ -93,13 +104,12 @@ def diagnose():
     
     # 检查 Chrome
     print("\n1. 检查 Chrome 浏览器...")
-    chrome_path = check_chrome_installed()
-    if not chrome_path:
+    manifest = check_chrome(refresh)
+    if not manifest:
         print("请安装 Chrome 或 Chromium 浏览器")
         return False
     
-    chrome_version = get_chrome_version(chrome_path)
-    if not chrome_version:
+    if not manifest.get("browser_major"):
         print("无法获取 Chrome 版本")
         return False
     
@@ -122,6 +132,203 @@ def diagnose():
     
     return True
 
+def _summary(samples):
+    samples = sorted(samples)
+    if not samples:
+        return None
+    return {
+        "p50": statistics.median(samples),
+        "p95": samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+        "min": samples[0],
+        "samples": len(samples),
+    }
+
+
+def measure_imports():
+    """在独立的解释器中测量各模块的冷导入耗时"""
+    results = {}
+    for module in HEAVY_MODULES:
+        code = f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+        try:
+            output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, timeout=60)
+            results[module] = float(output.stdout.strip()) if output.returncode == 0 else None
+        except Exception:
+            results[module] = None
+        shown = f"{results[module]:.3f}s" if results[module] is not None else "导入失败"
+        print(f"  import {module}: {shown}")
+    return results
+
+
+class _QuietHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = FIXTURE_HTML.encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def measure_browser(manifest):
+    """测量 Chrome 冷启动、本地测试页面首次加载和 WebDriver 命令往返延迟"""
+    from selenium import webdriver
+    from selenium.webdriver.chrome.service import Service
+    from browser_manager import teardown_driver
+
+    results = {}
+    server = http.server.HTTPServer(('127.0.0.1', 0), _QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    driver = None
+    try:
+        options = webdriver.ChromeOptions()
+        options.binary_location = manifest["browser_path"]
+        for arg in ('--headless=new', '--no-sandbox', '--disable-dev-shm-usage', '--disable-gpu'):
+            options.add_argument(arg)
+        start = time.perf_counter()
+        driver = webdriver.Chrome(service=Service(manifest.get("driver_path")), options=options)
+        results["chrome_cold_start"] = time.perf_counter() - start
+        print(f"  Chrome 冷启动: {results['chrome_cold_start']:.3f}s")
+
+        start = time.perf_counter()
+        driver.get(f"http://127.0.0.1:{server.server_port}/")
+        driver.find_element("css selector", ".post-list-item")
+        results["fixture_first_load"] = time.perf_counter() - start
+        print(f"  本地测试页面首次加载: {results['fixture_first_load']:.3f}s")
+
+        samples = []
+        for _ in range(WEBDRIVER_RTT_SAMPLES):
+            start = time.perf_counter()
+            driver.execute_script("return 1")
+            samples.append(time.perf_counter() - start)
+        results["webdriver_rtt"] = _summary(samples)
+        print(f"  WebDriver 命令往返: p50 {results['webdriver_rtt']['p50'] * 1000:.1f}ms，"
+              f"p95 {results['webdriver_rtt']['p95'] * 1000:.1f}ms")
+    except Exception as e:
+        print(f"  ✗ 浏览器测量失败: {str(e)}")
+        results["error"] = str(e)
+    finally:
+        if driver is not None:
+            teardown_driver(driver)
+        server.shutdown()
+    return results
+
+
+def measure_llm():
+    """
+    测量大模型服务的往返延迟，未配置服务时测量替代地址
+    直接发送单个请求，不经过对冲、重试和熔断，也不计入每日预算
+    """
+    import requests
+    from llm_providers import GENERATION_PROFILES, select_provider
+
+    results = {}
+    provider = select_provider("classify")
+    if provider is not None:
+        model = provider.model_for("classify")
+        samples = []
+        for _ in range(3):
+            start = time.perf_counter()
+            try:
+                provider.generate("只回答“是”。", model, 30, GENERATION_PROFILES["classify_fast"])
+                samples.append(time.perf_counter() - start)
+            except Exception as e:
+                print(f"  ✗ 大模型调用失败: {str(e)}")
+        results["llm_provider"] = provider.name
+        results["llm_rtt"] = _summary(samples)
+        if samples:
+            print(f"  大模型（{results['llm_provider']}）往返: p50 {results['llm_rtt']['p50']:.3f}s")
+    samples = []
+    for _ in range(ENDPOINT_RTT_SAMPLES):
+        start = time.perf_counter()
+        try:
+            requests.get(PERF_ENDPOINT, timeout=10)
+            samples.append(time.perf_counter() - start)
+        except Exception as e:
+            print(f"  ✗ 请求 {PERF_ENDPOINT} 失败: {str(e)}")
+            break
+    results["endpoint"] = PERF_ENDPOINT
+    results["endpoint_rtt"] = _summary(samples)
+    if samples:
+        print(f"  {PERF_ENDPOINT} 往返: p50 {results['endpoint_rtt']['p50'] * 1000:.1f}ms")
+    return results
+
+
+def _flatten(report, prefix=""):
+    """把报告展开为 {指标路径: 数值}，用于对比"""
+    flat = {}
+    for key, value in report.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten(value, path + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool) and not key == "samples":
+            flat[path] = value
+    return flat
+
+
+def compare_reports(current, baseline_path):
+    """与之前的报告对比，列出变化超过 20% 的指标"""
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)
+    print(f"\n与 {baseline_path}（{baseline.get('host')}，Chrome {baseline.get('chrome_version')}）对比：")
+    old, new = _flatten(baseline["results"]), _flatten(current["results"])
+    for key in sorted(set(old) & set(new)):
+        if not old[key]:
+            continue
+        change = (new[key] - old[key]) / old[key] * 100
+        mark = "✗" if change > 20 else ("✓" if change < -20 else " ")
+        print(f"  {mark} {key}: {old[key]:.4f} -> {new[key]:.4f}（{change:+.1f}%）")
+
+
+def perf(output, compare=None):
+    """性能自检，结果写入 JSON 文件"""
+    print("=" * 50)
+    print("NodeSeek 性能自检")
+    print("=" * 50)
+    manifest = resolve()
+    report = {
+        "host": socket.gethostname(),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "chrome_version": manifest["browser_version"] if manifest else None,
+        "driver_version": manifest.get("driver_version") if manifest else None,
+        "time": time.time(),
+        "results": {},
+    }
+    print("\n1. Python 模块导入耗时...")
+    report["results"]["imports"] = measure_imports()
+    print("\n2. 浏览器...")
+    if manifest and manifest.get("driver_path"):
+        report["results"]["browser"] = measure_browser(manifest)
+    else:
+        print("  ✗ 未找到 Chrome 或 ChromeDriver，跳过")
+    print("\n3. 大模型服务...")
+    try:
+        report["results"]["llm"] = measure_llm()
+    except ImportError as e:
+        print(f"  ✗ 跳过: {str(e)}")
+
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n结果已保存到 {output}")
+    if compare:
+        compare_reports(report, compare)
+    return "error" not in report["results"].get("browser", {})
+
+
 if __name__ == "__main__":
-    success = diagnose()
+    parser = argparse.ArgumentParser(description="NodeSeek 脚本诊断工具")
+    parser.add_argument("--refresh", action="store_true", help="重新解析浏览器和 ChromeDriver 版本并更新清单")
+    parser.add_argument("--perf", action="store_true", help="测量导入、浏览器启动、页面加载、WebDriver 和大模型延迟")
+    parser.add_argument("--output", default="perf_report.json", help="性能自检结果文件")
+    parser.add_argument("--compare", help="与之前的性能自检结果对比")
+    args = parser.parse_args()
+    if args.perf:
+        if args.refresh:
+            resolve(refresh=True)
+        success = perf(args.output, args.compare)
+    else:
+        success = diagnose(refresh=args.refresh)
     sys.exit(0 if success else 1)
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+有限开销的故障诊断记录
+在内存中的定长环形缓冲区里保留最近 N 个步骤的快照（URL、耗时、在页面内截断的 DOM 片段、
+可选的低分辨率截图），只有步骤失败时才把整个缓冲区连同异常堆栈写入磁盘。
+采集耗时会被统计，累计超过运行时间的一定比例后只记录 URL 和耗时，保证诊断不拖慢正常运行。
+"""
+import collections
+import json
+import os
+import time
+import traceback
+
+RING_SIZE = int(os.environ.get("NS_DIAG_RING", "20"))
+DIAG_DIR = os.environ.get("NS_DIAG_DIR", "diagnostics")
+DOM_CHARS = int(os.environ.get("NS_DIAG_DOM_CHARS", "2000"))
+SCREENSHOT = os.environ.get("NS_DIAG_SCREENSHOT", "false").lower() == "true"
+# 诊断采集累计耗时占运行时间的上限
+BUDGET_RATIO = float(os.environ.get("NS_DIAG_BUDGET", "0.02"))
+# 运行初期给予的固定额度（秒），避免第一次采集就超出比例
+BUDGET_GRACE = 2.0
+
+DOM_SCRIPT = "return document.documentElement ? document.documentElement.outerHTML.slice(0, arguments[0]) : '';"
+
+DIAG_STATS = {"snapshots": 0, "reduced": 0, "dumps": 0, "capture_seconds": 0.0}
+
+_ring = collections.deque(maxlen=RING_SIZE)
+_started = time.time()
+_last = time.time()
+
+
+def _within_budget():
+    allowed = BUDGET_GRACE + (time.time() - _started) * BUDGET_RATIO
+    return DIAG_STATS["capture_seconds"] < allowed
+
+
+def _screenshot(driver):
+    """通过 CDP 截取缩小到 1/4 的低质量 JPEG，返回 base64"""
+    try:
+        return driver.execute_cdp_cmd("Page.captureScreenshot", {
+            "format": "jpeg",
+            "quality": 30,
+            "clip": {"x": 0, "y": 0, "width": 1920, "height": 1080, "scale": 0.25},
+        }).get("data")
+    except Exception:
+        return None
+
+
+def snapshot(driver, step, detail=None, full=False):
+    """
+    记录一个步骤的快照到环形缓冲区
+    full: 失败时使用，忽略开销上限并在开启时附带截图
+    """
+    global _last
+    begin = time.time()
+    entry = {"step": step, "time": begin, "since_last": begin - _last, "detail": detail}
+    _last = begin
+    try:
+        entry["url"] = driver.current_url if driver else None
+    except Exception:
+        entry["url"] = None
+    if driver is not None and (full or _within_budget()):
+        try:
+            entry["dom"] = driver.execute_script(DOM_SCRIPT, DOM_CHARS)
+        except Exception:
+            entry["dom"] = None
+        if SCREENSHOT and full:
+            entry["screenshot"] = _screenshot(driver)
+    else:
+        DIAG_STATS["reduced"] += 1
+    cost = time.time() - begin
+    entry["capture_cost"] = cost
+    DIAG_STATS["capture_seconds"] += cost
+    DIAG_STATS["snapshots"] += 1
+    _ring.append(entry)
+    return entry
+
+
+def record_failure(driver, step, error=None):
+    """
+    步骤失败时调用：补充一个完整快照，把缓冲区和异常堆栈写入 DIAG_DIR，返回写入的文件路径
+    """
+    snapshot(driver, step, detail=f"{type(error).__name__}: {error}" if error else None, full=True)
+    path = None
+    try:
+        os.makedirs(DIAG_DIR, exist_ok=True)
+        path = os.path.join(DIAG_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}_{step}.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({
+                "step": step,
+                "error": repr(error) if error else None,
+                "traceback": traceback.format_exc() if error else None,
+                "snapshots": list(_ring),
+            }, f, ensure_ascii=False, indent=2)
+        DIAG_STATS["dumps"] += 1
+        print(f"诊断信息已写入 {path}")
+    except Exception as e:
+        print(f"写入诊断信息出错：{str(e)}")
+    return path
+
+
+def diagnostics_summary():
+    """返回诊断采集的开销统计"""
+    return (
+        f"诊断记录：快照 {DIAG_STATS['snapshots']} 个（超出开销上限精简 {DIAG_STATS['reduced']} 个），"
+        f"采集耗时 {DIAG_STATS['capture_seconds']:.2f} 秒，写入故障记录 {DIAG_STATS['dumps']} 份"
+    )
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+生成参数配置基准测试
+用记录下来的真实提示词（运行时设置 NS_RECORD_PROMPTS=true）逐个测试各生成参数配置，
+报告每个配置的 p50/p95 延迟和回答有效率。
+每次测量直接调用服务发送单个请求，不经过对冲、重试和熔断，也不计入每日预算，测到的是真实的尾部延迟。
+
+用法：
+    python llm_bench.py                              # 测试各任务的全部适用配置
+    python llm_bench.py classify_fast,classify_think # 只测试指定配置
+    python llm_bench.py --limit 20 --output bench.json
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+from llm_providers import GENERATION_PROFILES, RECORDED_PROMPTS_PATH, select_provider
+
+
+def _valid_classify(text):
+    return text.strip() in ("是", "否")
+
+
+def _valid_reply(text):
+    reply = text.strip().replace("\n", " ").strip('"\'“”')
+    return 4 <= len(reply) <= 20
+
+
+def _valid_batch(text):
+    match = re.search(r'\{.*\}', text, re.S)
+    if not match:
+        return False
+    try:
+        return isinstance(json.loads(match.group(0)), dict)
+    except ValueError:
+        return False
+
+
+VALIDATORS = {"classify": _valid_classify, "reply": _valid_reply, "batch": _valid_batch}
+
+
+def _percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    k = (len(values) - 1) * pct / 100
+    lo = int(k)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+def load_prompts(limit):
+    """按任务读取记录的提示词，每个任务最多 limit 条"""
+    prompts = {}
+    if not os.path.exists(RECORDED_PROMPTS_PATH):
+        return prompts
+    with open(RECORDED_PROMPTS_PATH, encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            bucket = prompts.setdefault(entry["task"], [])
+            if len(bucket) < limit:
+                bucket.append(entry["prompt"])
+    return prompts
+
+
+def profiles_for_task(task, selected):
+    """任务适用的配置：名称以任务名开头的配置加上 default，或命令行指定的配置"""
+    if selected:
+        return [p for p in selected if p in GENERATION_PROFILES]
+    return ["default"] + [p for p in GENERATION_PROFILES if p.startswith(task)]
+
+
+def bench(selected, limit):
+    prompts = load_prompts(limit)
+    if not prompts:
+        print("✗ 没有找到记录的提示词，请先设置 NS_RECORD_PROMPTS=true 运行一次脚本")
+        return None
+    results = []
+    for task, task_prompts in prompts.items():
+        provider = select_provider(task)
+        if provider is None:
+            print(f"✗ {task}: 没有可用的大模型服务，跳过")
+            continue
+        model = provider.model_for(task)
+        validator = VALIDATORS.get(task, lambda text: bool(text.strip()))
+        for profile in profiles_for_task(task, selected):
+            latencies = []
+            valid = errors = 0
+            for prompt in task_prompts:
+                start = time.time()
+                try:
+                    text, _, _, _ = provider.generate(prompt, model, 60, GENERATION_PROFILES[profile])
+                except Exception as e:
+                    errors += 1
+                    print(f"  {profile} 调用出错：{str(e)}")
+                    continue
+                latencies.append(time.time() - start)
+                valid += validator(text)
+            result = {
+                "task": task,
+                "provider": provider.name,
+                "model": model,
+                "profile": profile,
+                "samples": len(task_prompts),
+                "errors": errors,
+                "p50": _percentile(latencies, 50),
+                "p95": _percentile(latencies, 95),
+                "valid_rate": valid / len(task_prompts),
+            }
+            results.append(result)
+            print(
+                f"{task:<9} {profile:<16} p50 {result['p50']:.2f}s  p95 {result['p95']:.2f}s  "
+                f"有效 {valid}/{len(task_prompts)}  失败 {errors}"
+            )
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="生成参数配置基准测试")
+    parser.add_argument("profiles", nargs="?", help="逗号分隔的配置名，默认测试各任务的全部适用配置")
+    parser.add_argument("--limit", type=int, default=20, help="每个任务最多使用的提示词数量")
+    parser.add_argument("--output", help="把结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    selected = args.profiles.split(",") if args.profiles else None
+    results = bench(selected, args.limit)
+    if results and args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存到 {args.output}")
+    sys.exit(0 if results else 1)
@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""
+大模型请求策略：每帖总时限、对冲请求、有限重试和熔断
+- 每个帖子的所有大模型调用共享一个总时限，超时不再发起新请求
+- 请求超过近期 p90 延迟仍未返回时，发出一个重复请求，取先成功的结果
+- 429/5xx 和网络错误按带抖动的指数退避重试，次数有限
+- 连续失败达到阈值后熔断，冷却期内直接判定服务不可用，冷却结束后放行一次试探请求
+"""
+import collections
+import os
+import random
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+
+import clock
+
+POST_DEADLINE = float(os.environ.get("NS_LLM_POST_DEADLINE", "30"))
+MAX_RETRIES = int(os.environ.get("NS_LLM_MAX_RETRIES", "2"))
+BACKOFF_BASE = float(os.environ.get("NS_LLM_BACKOFF_BASE", "1"))
+# 对冲延迟：近期成功请求的 p90，样本不足时使用默认值
+HEDGE_ENABLED = os.environ.get("NS_LLM_HEDGE", "true").lower() == "true"
+HEDGE_DEFAULT_DELAY = float(os.environ.get("NS_LLM_HEDGE_DELAY", "4"))
+HEDGE_MIN_SAMPLES = 5
+BREAKER_THRESHOLD = int(os.environ.get("NS_LLM_BREAKER_THRESHOLD", "4"))
+BREAKER_COOLDOWN = float(os.environ.get("NS_LLM_BREAKER_COOLDOWN", "300"))
+
+RETRYABLE_STATUS = (429, 500, 502, 503, 504)
+
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="llm")
+_latencies = collections.defaultdict(lambda: collections.deque(maxlen=50))
+_breakers = {}
+_deadline = None
+
+POLICY_STATS = {"hedged": 0, "hedge_wins": 0, "retries": 0, "breaker_trips": 0, "deadline_skips": 0}
+
+
+class DeadlineExceeded(RuntimeError):
+    pass
+
+
+class CircuitOpen(RuntimeError):
+    pass
+
+
+class CircuitBreaker:
+    """连续失败计数熔断器：closed -> open（冷却）-> half-open（放行一次）-> closed"""
+
+    def __init__(self, name):
+        self.name = name
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    def is_open(self):
+        if self.opened_at is None:
+            return False
+        if clock.now() - self.opened_at >= BREAKER_COOLDOWN and not self.trial_in_flight:
+            return False
+        return True
+
+    def before_call(self):
+        if self.is_open():
+            raise CircuitOpen(f"{self.name} 已熔断，冷却中")
+        if self.opened_at is not None:
+            self.trial_in_flight = True
+
+    def record_success(self):
+        if self.opened_at is not None:
+            print(f"{self.name} 试探请求成功，熔断恢复")
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.trial_in_flight = False
+        if self.opened_at is not None or self.failures >= BREAKER_THRESHOLD:
+            self.opened_at = clock.now()
+            POLICY_STATS["breaker_trips"] += 1
+            print(f"{self.name} 连续失败 {self.failures} 次，熔断 {BREAKER_COOLDOWN:.0f} 秒")
+
+
+def breaker_for(name):
+    if name not in _breakers:
+        _breakers[name] = CircuitBreaker(name)
+    return _breakers[name]
+
+
+def circuit_open(name):
+    """服务是否处于熔断状态"""
+    return breaker_for(name).is_open()
+
+
+def start_post_deadline(seconds=None):
+    """开始处理一个帖子，重置该帖子所有大模型调用的总时限"""
+    global _deadline
+    _deadline = clock.now() + (POST_DEADLINE if seconds is None else seconds)
+
+
+def clear_post_deadline():
+    global _deadline
+    _deadline = None
+
+
+def _remaining():
+    return None if _deadline is None else _deadline - clock.now()
+
+
+def _hedge_delay(name):
+    samples = sorted(_latencies[name])
+    if len(samples) < HEDGE_MIN_SAMPLES:
+        return HEDGE_DEFAULT_DELAY
+    return samples[min(len(samples) - 1, int(len(samples) * 0.9))]
+
+
+def _is_retryable(error):
+    if isinstance(error, requests.HTTPError):
+        response = getattr(error, "response", None)
+        return response is not None and response.status_code in RETRYABLE_STATUS
+    return isinstance(error, (requests.ConnectionError, requests.Timeout))
+
+
+def _retry_after(error):
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+def _hedged(name, call, timeout):
+    """发起请求，超过对冲延迟仍未返回时再发一个重复请求，返回先成功的结果"""
+    first = _executor.submit(call, timeout)
+    if not HEDGE_ENABLED:
+        return first.result()
+    delay = _hedge_delay(name)
+    done, _ = wait([first], timeout=min(delay, timeout))
+    if done:
+        return first.result()
+    remaining = _remaining()
+    hedge_timeout = timeout if remaining is None else min(timeout, remaining)
+    if hedge_timeout <= 0:
+        return first.result()
+    POLICY_STATS["hedged"] += 1
+    second = _executor.submit(call, hedge_timeout)
+    pending = {first, second}
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                if future is second:
+                    POLICY_STATS["hedge_wins"] += 1
+                return future.result()
+            error = future.exception()
+    raise error
+
+
+def call_with_policy(name, call, timeout):
+    """
+    按策略执行一次大模型调用
+    call(timeout) 为实际的请求函数，失败时抛出异常
+    """
+    breaker = breaker_for(name)
+    attempt = 0
+    while True:
+        remaining = _remaining()
+        if remaining is not None and remaining <= 0:
+            POLICY_STATS["deadline_skips"] += 1
+            raise DeadlineExceeded("当前帖子的大模型调用已超出总时限")
+        attempt_timeout = timeout if remaining is None else min(timeout, remaining)
+        breaker.before_call()
+        start = clock.now()
+        try:
+            result = _hedged(name, call, attempt_timeout)
+        except Exception as e:
+            if not _is_retryable(e):
+                # 服务有响应（如 400），既不计入熔断也不算恢复，只释放试探请求的占位
+                breaker.trial_in_flight = False
+                raise
+            breaker.record_failure()
+            if attempt >= MAX_RETRIES or breaker.is_open():
+                raise
+            attempt += 1
+            POLICY_STATS["retries"] += 1
+            backoff = _retry_after(e) or BACKOFF_BASE * (2 ** (attempt - 1)) * random.uniform(0.5, 1.5)
+            remaining = _remaining()
+            if remaining is not None and backoff >= remaining:
+                raise
+            print(f"{name} 请求失败（{str(e)}），{backoff:.1f} 秒后第 {attempt} 次重试")
+            clock.sleep(backoff)
+            continue
+        _latencies[name].append(clock.now() - start)
+        breaker.record_success()
+        return result
+
+
+def policy_stats_summary():
+    """返回对冲、重试和熔断的统计"""
+    return (
+        f"请求策略：对冲 {POLICY_STATS['hedged']} 次（对冲请求胜出 {POLICY_STATS['hedge_wins']} 次），"
+        f"重试 {POLICY_STATS['retries']} 次，熔断 {POLICY_STATS['breaker_trips']} 次，"
+        f"超时放弃 {POLICY_STATS['deadline_skips']} 次"
+    )
@@ -0,0 +1,340 @@
+# -*- coding: utf-8 -*-
+"""
+可插拔的大模型调用层
+统一 Gemini、OpenAI 兼容接口和本地 llama.cpp 服务的请求与响应解析，
+支持按任务选择服务和模型，并按服务统计延迟和费用
+
+任务：
+    classify  抽奖帖判断（是/否）
+    reply     生成回复
+    batch     批量生成回复库
+
+配置（环境变量）：
+    NS_LLM_PROVIDER             默认服务：gemini / openai / local（默认 gemini）
+    NS_LLM_<任务>_PROVIDER      指定任务使用的服务，auto 表示选择平均延迟最低的可用服务
+    NS_LLM_<任务>_MODEL_<服务>  指定任务在某个服务上使用的模型
+    NS_LLM_<任务>_MODEL         指定任务使用的模型，只对任务明确指定（非 auto）的服务生效
+    GEMINI_API_KEY / GEMINI_MODEL
+    NS_OPENAI_BASE_URL / NS_OPENAI_API_KEY / NS_OPENAI_MODEL
+    NS_LOCAL_LLM_URL / NS_LOCAL_LLM_MODEL
+    NS_LLM_PRICE_<服务>         每百万 token 的输入,输出价格（美元），如 0.3,2.5
+    NS_LLM_<任务>_PROFILE       指定任务使用的生成参数配置，见 GENERATION_PROFILES
+    NS_LLM_PROFILES             自定义生成参数配置的 JSON 文件，与内置配置合并
+    NS_RECORD_PROMPTS           为 true 时把提示词记录到 recorded_prompts.jsonl，供 llm_bench.py 使用
+"""
+import abc
+import json
+import os
+import threading
+
+import requests
+
+import clock
+from llm_policy import call_with_policy, circuit_open
+from token_budget import budget_allows, record_usage
+from metrics import LLM_CALLS, LLM_LATENCY, inc, observe
+
+TASKS = ("classify", "reply", "batch")
+
+# 生成参数配置：max_output_tokens、thinking_budget（仅 Gemini 2.5）、temperature、stop
+# default 为不带任何参数的原始请求
+GENERATION_PROFILES = {
+    "default": {},
+    "classify_fast": {"max_output_tokens": 8, "thinking_budget": 0, "temperature": 0.0, "stop": ["\n"]},
+    "classify_think": {"max_output_tokens": 512, "thinking_budget": 256, "temperature": 0.0},
+    "reply_fast": {"max_output_tokens": 64, "thinking_budget": 0, "temperature": 0.9},
+    "reply_think": {"max_output_tokens": 1024, "thinking_budget": 512, "temperature": 0.9},
+    "batch": {"max_output_tokens": 4096, "thinking_budget": 0, "temperature": 1.0},
+}
+TASK_PROFILES = {"classify": "classify_fast", "reply": "reply_fast", "batch": "batch"}
+
+RECORD_PROMPTS = os.environ.get("NS_RECORD_PROMPTS", "false").lower() == "true"
+RECORDED_PROMPTS_PATH = "recorded_prompts.jsonl"
+
+
+def _env(name, default=None):
+    value = os.environ.get(name)
+    return value if value else default
+
+
+def _load_custom_profiles():
+    path = os.environ.get("NS_LLM_PROFILES")
+    if not path:
+        return
+    try:
+        with open(path, encoding='utf-8') as f:
+            GENERATION_PROFILES.update(json.load(f))
+    except Exception as e:
+        print(f"加载生成参数配置出错：{str(e)}")
+
+
+_load_custom_profiles()
+
+
+def profile_for(task):
+    """任务使用的生成参数配置名"""
+    name = _env(f"NS_LLM_{task.upper()}_PROFILE", TASK_PROFILES.get(task, "default"))
+    if name not in GENERATION_PROFILES:
+        print(f"未知的生成参数配置 {name}，使用 default")
+        return "default"
+    return name
+
+
+def _parse_price(name, default):
+    """解析 "输入,输出" 格式的价格，格式错误时打印提示并使用默认价格"""
+    price = _env(f"NS_LLM_PRICE_{name.upper()}", default)
+    try:
+        input_price, output_price = (float(p) for p in price.split(","))
+        return input_price, output_price
+    except ValueError:
+        print(f"NS_LLM_PRICE_{name.upper()} 格式错误（{price}），使用默认价格 {default}")
+        input_price, output_price = (float(p) for p in default.split(","))
+        return input_price, output_price
+
+
+class LLMProvider(abc.ABC):
+    """大模型服务基类，子类实现 generate 返回 (文本, 输入 token, 输出 token, 思考 token)"""
+
+    name = "base"
+    default_model = None
+    default_price = "0,0"
+
+    def __init__(self):
+        self.input_price, self.output_price = _parse_price(self.name, self.default_price)
+
+    def available(self):
+        return False
+
+    def model_for(self, task):
+        model = _env(f"NS_LLM_{task.upper()}_MODEL_{self.name.upper()}")
+        if model:
+            return model
+        # 不带服务名的模型配置只属于任务指定的服务，auto 路由到其他服务时不能套用
+        if _task_provider(task) == self.name:
+            return _env(f"NS_LLM_{task.upper()}_MODEL", self.default_model)
+        return self.default_model
+
+    @abc.abstractmethod
+    def generate(self, prompt, model, timeout, profile):
+        """发送一次请求，返回 (文本, 输入 token, 输出 token, 思考 token)"""
+
+
+class GeminiProvider(LLMProvider):
+    name = "gemini"
+    default_price = "0.3,2.5"
+
+    def __init__(self):
+        super().__init__()
+        self.api_key = _env("GEMINI_API_KEY")
+        self.default_model = _env("GEMINI_MODEL", "gemini-2.5-flash")
+
+    def available(self):
+        return bool(self.api_key)
+
+    def generate(self, prompt, model, timeout, profile):
+        url = f"https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent"
+        headers = {"Content-Type": "application/json"}
+        data = {"contents": [{"parts": [{"text": prompt}]}]}
+        config = {}
+        if "max_output_tokens" in profile:
+            config["maxOutputTokens"] = profile["max_output_tokens"]
+        if "temperature" in profile:
+            config["temperature"] = profile["temperature"]
+        if profile.get("stop"):
+            config["stopSequences"] = profile["stop"]
+        if "thinking_budget" in profile and model.startswith("gemini-2.5"):
+            config["thinkingConfig"] = {"thinkingBudget": profile["thinking_budget"]}
+        if config:
+            data["generationConfig"] = config
+        response = requests.post(f"{url}?key={self.api_key}", headers=headers, json=data, timeout=timeout)
+        response.raise_for_status()
+        result = response.json()
+        text = result.get("candidates", [{}])[0].get("content", {}).get("parts", [{}])[0].get("text", "")
+        usage = result.get("usageMetadata", {})
+        return (
+            text,
+            usage.get("promptTokenCount", 0),
+            usage.get("candidatesTokenCount", 0),
+            usage.get("thoughtsTokenCount", 0),
+        )
+
+
+class OpenAICompatibleProvider(LLMProvider):
+    name = "openai"
+
+    def __init__(self):
+        super().__init__()
+        self.base_url = (_env("NS_OPENAI_BASE_URL") or "").rstrip("/")
+        self.api_key = _env("NS_OPENAI_API_KEY")
+        self.default_model = _env("NS_OPENAI_MODEL", "gpt-4o-mini")
+
+    def available(self):
+        return bool(self.base_url)
+
+    def generate(self, prompt, model, timeout, profile):
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        data = {"model": model, "messages": [{"role": "user", "content": prompt}]}
+        if "max_output_tokens" in profile:
+            data["max_tokens"] = profile["max_output_tokens"]
+        if "temperature" in profile:
+            data["temperature"] = profile["temperature"]
+        if profile.get("stop"):
+            data["stop"] = profile["stop"]
+        response = requests.post(f"{self.base_url}/chat/completions", headers=headers, json=data, timeout=timeout)
+        response.raise_for_status()
+        result = response.json()
+        text = result.get("choices", [{}])[0].get("message", {}).get("content", "") or ""
+        usage = result.get("usage", {})
+        return text, usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0), 0
+
+
+class LocalLlamaProvider(LLMProvider):
+    """llama.cpp server 风格的本地服务，使用其原生 /completion 接口"""
+
+    name = "local"
+
+    def __init__(self):
+        super().__init__()
+        self.base_url = (_env("NS_LOCAL_LLM_URL") or "").rstrip("/")
+        self.default_model = _env("NS_LOCAL_LLM_MODEL", "local")
+
+    def available(self):
+        return bool(self.base_url)
+
+    def generate(self, prompt, model, timeout, profile):
+        headers = {"Content-Type": "application/json"}
+        data = {"prompt": prompt, "n_predict": profile.get("max_output_tokens", 256), "cache_prompt": True}
+        if "temperature" in profile:
+            data["temperature"] = profile["temperature"]
+        if profile.get("stop"):
+            data["stop"] = profile["stop"]
+        response = requests.post(f"{self.base_url}/completion", headers=headers, json=data, timeout=timeout)
+        response.raise_for_status()
+        result = response.json()
+        return result.get("content", ""), result.get("tokens_evaluated", 0), result.get("tokens_predicted", 0), 0
+
+
+PROVIDERS = {p.name: p for p in (GeminiProvider(), OpenAICompatibleProvider(), LocalLlamaProvider())}
+
+# 每个服务的调用统计：calls 为调用次数，requests 为实际发出的请求数（含重试和对冲）
+PROVIDER_STATS = {
+    name: {"calls": 0, "requests": 0, "errors": 0, "latency": 0.0, "input_tokens": 0, "output_tokens": 0, "cost": 0.0}
+    for name in PROVIDERS
+}
+_stats_lock = threading.Lock()
+
+
+def _mean_latency(name):
+    stats = PROVIDER_STATS[name]
+    ok = stats["calls"] - stats["errors"]
+    return stats["latency"] / ok if ok > 0 else 0.0
+
+
+def _task_provider(task):
+    """任务配置的服务名，可能为 auto"""
+    return _env(f"NS_LLM_{task.upper()}_PROVIDER", _env("NS_LLM_PROVIDER", "gemini")).lower()
+
+
+def select_provider(task):
+    """按任务配置选择服务，auto 时优先尝试未测量过的服务，其后选平均延迟最低的"""
+    choice = _task_provider(task)
+    if choice != "auto":
+        provider = PROVIDERS.get(choice)
+        return provider if provider and provider.available() and not circuit_open(provider.name) else None
+    candidates = [p for p in PROVIDERS.values() if p.available() and not circuit_open(p.name)]
+    if not candidates:
+        return None
+    return min(candidates, key=lambda p: (PROVIDER_STATS[p.name]["calls"] > 0, _mean_latency(p.name)))
+
+
+def llm_available(task):
+    """任务是否有可用的服务（已配置且未熔断）"""
+    return select_provider(task) is not None
+
+
+def llm_circuit_open(task):
+    """任务配置了服务，但全部处于熔断状态"""
+    configured = [p for p in PROVIDERS.values() if p.available()]
+    return bool(configured) and select_provider(task) is None
+
+
+def _record_prompt(task, prompt_type, prompt):
+    try:
+        with open(RECORDED_PROMPTS_PATH, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({"task": task, "prompt_type": prompt_type, "prompt": prompt}, ensure_ascii=False) + "\n")
+    except Exception as e:
+        print(f"记录提示词出错：{str(e)}")
+
+
+def generate_text(task, prompt, timeout=10, prompt_type=None, profile=None):
+    """
+    调用任务对应的服务生成文本，失败时抛出异常，由调用方决定如何降级
+    prompt_type: 用于 token 统计和预算控制的提示词类型，默认与任务相同
+    profile: 生成参数配置名，默认按任务配置选择
+    """
+    prompt_type = prompt_type or task
+    if RECORD_PROMPTS:
+        _record_prompt(task, prompt_type, prompt)
+    provider = select_provider(task)
+    if provider is None:
+        inc(LLM_CALLS, task=task, prompt_type=prompt_type, outcome="unavailable")
+        raise RuntimeError(f"任务 {task} 没有可用的大模型服务")
+    if not budget_allows(prompt_type):
+        inc(LLM_CALLS, task=task, prompt_type=prompt_type, outcome="over_budget")
+        raise RuntimeError(f"今日大模型预算不足，不再发起 {prompt_type} 调用")
+    model = provider.model_for(task)
+    generation = GENERATION_PROFILES[profile or profile_for(task)]
+    stats = PROVIDER_STATS[provider.name]
+    stats["calls"] += 1
+
+    def attempt(attempt_timeout):
+        # 重试和对冲的每个请求都计入预算和费用，包括完成时调用方已经拿到结果的对冲请求
+        try:
+            result = provider.generate(prompt, model, attempt_timeout, generation)
+        except Exception:
+            _charge(provider, prompt_type, 0, 0, 0)
+            raise
+        _charge(provider, prompt_type, *result[1:])
+        return result
+
+    start = clock.now()
+    try:
+        text, _, _, _ = call_with_policy(provider.name, attempt, timeout)
+    except Exception:
+        stats["errors"] += 1
+        inc(LLM_CALLS, task=task, prompt_type=prompt_type, outcome="error")
+        raise
+    latency = clock.now() - start
+    stats["latency"] += latency
+    inc(LLM_CALLS, task=task, prompt_type=prompt_type, outcome="ok")
+    observe(LLM_LATENCY, latency, task=task)
+    return text
+
+
+def _charge(provider, prompt_type, input_tokens, output_tokens, thinking_tokens):
+    """记录一次实际发出的请求的用量和费用，思考 token 按输出价格计费"""
+    billed_output = output_tokens + thinking_tokens
+    with _stats_lock:
+        stats = PROVIDER_STATS[provider.name]
+        stats["requests"] += 1
+        stats["input_tokens"] += input_tokens
+        stats["output_tokens"] += billed_output
+        stats["cost"] += (input_tokens * provider.input_price + billed_output * provider.output_price) / 1e6
+    record_usage(prompt_type, input_tokens, output_tokens, thinking_tokens)
+
+
+def provider_stats_summary():
+    """返回各服务的调用次数、平均延迟和费用"""
+    lines = []
+    for name, stats in PROVIDER_STATS.items():
+        if not stats["calls"]:
+            continue
+        lines.append(
+            f"{name}: 调用 {stats['calls']} 次（失败 {stats['errors']}，实际请求 {stats['requests']} 次），平均延迟 {_mean_latency(name):.2f}s，"
+            f"token {stats['input_tokens']}/{stats['output_tokens']}，费用 ${stats['cost']:.4f}"
+        )
+    if not lines:
+        return "大模型调用：无"
+    return "大模型调用统计：\n  " + "\n  ".join(lines)
@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+"""
+基于 Gemini 历史判断结果训练的本地抽奖预分类器
+check_is_real_lottery / check_lottery_ended 的 Gemini 结论会记录为标注数据，
+据此训练字符 n-gram 朴素贝叶斯模型，高置信度的帖子直接在本地判断，其余仍交给 Gemini
+
+用法：
+    python lottery_classifier.py train      # 用已记录的判断结果训练模型
+    python lottery_classifier.py evaluate   # 评估与 Gemini 的一致率和可节省的调用比例
+"""
+import json
+import math
+import os
+import random
+import sys
+
+import clock
+
+VERDICT_LOG = os.environ.get("NS_VERDICT_LOG", "lottery_verdicts.jsonl")
+MODEL_PATH = os.environ.get("NS_CLASSIFIER_MODEL", "lottery_classifier.json")
+# 本地判断所需的最低置信度，低于该值交给 Gemini
+CONFIDENCE_THRESHOLD = float(os.environ.get("NS_CLASSIFIER_THRESHOLD", "0.97"))
+# 每个任务至少需要的样本数，样本太少时不训练
+MIN_SAMPLES = 30
+# 帖子中至少要有这么多训练时见过的特征才给出判断，否则置信度按 0.5 处理
+MIN_KNOWN_FEATURES = int(os.environ.get("NS_CLASSIFIER_MIN_FEATURES", "20"))
+# 交叉验证中达到置信度阈值的样本与 Gemini 的一致率不低于该值、且样本数不少于 MIN_EVAL_LOCAL 时才启用本地判断
+MIN_AGREEMENT = float(os.environ.get("NS_CLASSIFIER_MIN_AGREEMENT", "0.98"))
+MIN_EVAL_LOCAL = 10
+
+# 判断任务：是否真的抽奖帖、是否已开奖
+TASKS = ("is_real", "ended")
+
+NGRAM_RANGE = (1, 3)
+# 参与分类的文本长度，与 check_is_real_lottery 的截断保持一致
+MAX_TEXT_LEN = 500
+
+# 本次运行的统计
+CLASSIFIER_STATS = {"local": 0, "gemini": 0}
+
+_model_cache = None
+
+
+def _features(post_title, post_content):
+    """提取字符 n-gram 特征，标题单独加前缀以区分来源"""
+    feats = []
+    for prefix, text in (("t", post_title or ""), ("c", (post_content or "")[:MAX_TEXT_LEN])):
+        text = "".join(text.split())
+        for n in range(NGRAM_RANGE[0], NGRAM_RANGE[1] + 1):
+            for i in range(len(text) - n + 1):
+                feats.append(prefix + text[i:i + n])
+    return feats
+
+
+def record_verdict(task, post_title, post_content, verdict):
+    """记录一条 Gemini 判断结果作为标注数据"""
+    try:
+        entry = {
+            "time": clock.now(),
+            "task": task,
+            "title": post_title,
+            "content": (post_content or "")[:MAX_TEXT_LEN],
+            "verdict": bool(verdict),
+        }
+        with open(VERDICT_LOG, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    except Exception as e:
+        print(f"记录判断结果出错：{str(e)}")
+
+
+def load_verdicts(task=None):
+    """读取已记录的判断结果，可按任务过滤"""
+    samples = []
+    if not os.path.exists(VERDICT_LOG):
+        return samples
+    with open(VERDICT_LOG, encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if task is None or entry.get("task") == task:
+                samples.append(entry)
+    return samples
+
+
+def train(samples):
+    """训练多项式朴素贝叶斯模型，返回可序列化的模型字典"""
+    class_docs = {"1": 0, "0": 0}
+    class_totals = {"1": 0, "0": 0}
+    counts = {"1": {}, "0": {}}
+    for entry in samples:
+        label = "1" if entry["verdict"] else "0"
+        class_docs[label] += 1
+        for feat in _features(entry["title"], entry["content"]):
+            counts[label][feat] = counts[label].get(feat, 0) + 1
+            class_totals[label] += 1
+    vocab = set(counts["1"]) | set(counts["0"])
+    return {
+        "docs": class_docs,
+        "totals": class_totals,
+        "counts": counts,
+        "vocab_size": len(vocab),
+    }
+
+
+def predict(model, post_title, post_content):
+    """
+    返回 (判断结果, 置信度)
+    训练时没见过的特征不参与计算，否则每个未知特征都会给两类各加一项，把后验概率推向 0 或 1；
+    已知特征少于 MIN_KNOWN_FEATURES 时证据不足，置信度返回 0.5
+    """
+    total_docs = model["docs"]["1"] + model["docs"]["0"]
+    vocab_size = model["vocab_size"] + 1
+    counts = model["counts"]
+    known = [f for f in _features(post_title, post_content) if f in counts["1"] or f in counts["0"]]
+    if len(known) < MIN_KNOWN_FEATURES:
+        return model["docs"]["1"] >= model["docs"]["0"], 0.5
+    scores = {}
+    for label in ("1", "0"):
+        # 拉普拉斯平滑
+        score = math.log((model["docs"][label] + 1) / (total_docs + 2))
+        denom = model["totals"][label] + vocab_size
+        label_counts = counts[label]
+        for feat in known:
+            score += math.log((label_counts.get(feat, 0) + 1) / denom)
+        scores[label] = score
+    # 转换为后验概率
+    top = max(scores.values())
+    p_true = math.exp(scores["1"] - top) / (math.exp(scores["1"] - top) + math.exp(scores["0"] - top))
+    verdict = p_true >= 0.5
+    return verdict, (p_true if verdict else 1 - p_true)
+
+
+def _load_models():
+    """惰性加载模型文件，不存在或损坏时返回空字典"""
+    global _model_cache
+    if _model_cache is None:
+        _model_cache = {}
+        if os.path.exists(MODEL_PATH):
+            try:
+                with open(MODEL_PATH, encoding='utf-8') as f:
+                    _model_cache = json.load(f)
+            except Exception as e:
+                print(f"加载本地分类模型出错：{str(e)}")
+    return _model_cache
+
+
+def classify_locally(task, post_title, post_content, threshold=None):
+    """
+    尝试在本地判断，置信度足够时返回 True/False，否则返回 None 表示需要调用 Gemini
+    threshold: 覆盖默认置信度阈值，如预算用完时降低要求
+    """
+    model = _load_models().get(task)
+    if not model:
+        CLASSIFIER_STATS["gemini"] += 1
+        return None
+    verdict, confidence = predict(model, post_title, post_content)
+    if confidence < (CONFIDENCE_THRESHOLD if threshold is None else threshold):
+        CLASSIFIER_STATS["gemini"] += 1
+        return None
+    CLASSIFIER_STATS["local"] += 1
+    return verdict
+
+
+def classifier_stats_summary():
+    """返回本次运行本地分类的统计描述"""
+    total = CLASSIFIER_STATS["local"] + CLASSIFIER_STATS["gemini"]
+    if not total:
+        return "本地分类器：未进行任何判断"
+    rate = CLASSIFIER_STATS["local"] / total * 100
+    return f"本地分类器：共 {total} 次判断，本地完成 {CLASSIFIER_STATS['local']} 次（{rate:.1f}%），其余交给 Gemini"
+
+
+def cross_validate(samples, folds=5, seed=0):
+    """
+    k 折交叉验证，返回 (全部一致数, 达到置信度阈值的样本数, 其中一致数)
+    """
+    rng = random.Random(seed)
+    samples = samples[:]
+    rng.shuffle(samples)
+    agree_all = agree_local = local = 0
+    for k in range(folds):
+        test = samples[k::folds]
+        train_set = [s for i, s in enumerate(samples) if i % folds != k]
+        model = train(train_set)
+        for entry in test:
+            verdict, confidence = predict(model, entry["title"], entry["content"])
+            hit = verdict == entry["verdict"]
+            agree_all += hit
+            if confidence >= CONFIDENCE_THRESHOLD:
+                local += 1
+                agree_local += hit
+    return agree_all, local, agree_local
+
+
+def quality_ok(local, agree_local):
+    """交叉验证结果是否足以启用本地判断"""
+    return local >= MIN_EVAL_LOCAL and agree_local / local >= MIN_AGREEMENT
+
+
+def train_all():
+    """
+    为每个任务训练模型并写入模型文件
+    只有交叉验证中高置信度判断与 Gemini 足够一致的任务才写入模型，其余任务仍全部交给 Gemini
+    """
+    models = {}
+    for task in TASKS:
+        samples = load_verdicts(task)
+        if len(samples) < MIN_SAMPLES:
+            print(f"✗ {task}: 样本数 {len(samples)} 少于 {MIN_SAMPLES}，跳过训练")
+            continue
+        _, local, agree_local = cross_validate(samples)
+        if not quality_ok(local, agree_local):
+            rate = f"{agree_local / local * 100:.1f}%" if local else "无"
+            print(
+                f"✗ {task}: 交叉验证中高置信度样本 {local} 条，一致率 {rate}，"
+                f"未达到 {MIN_EVAL_LOCAL} 条 / {MIN_AGREEMENT * 100:.0f}%，不启用本地判断"
+            )
+            continue
+        models[task] = train(samples)
+        positives = sum(1 for s in samples if s["verdict"])
+        print(
+            f"✓ {task}: 使用 {len(samples)} 条样本训练（是 {positives} / 否 {len(samples) - positives}），"
+            f"交叉验证一致率 {agree_local / local * 100:.1f}%"
+        )
+    with open(MODEL_PATH, 'w', encoding='utf-8') as f:
+        json.dump(models, f, ensure_ascii=False)
+    print(f"模型已保存到 {MODEL_PATH}")
+    return bool(models)
+
+
+def evaluate(folds=5, seed=0):
+    """
+    k 折交叉验证，报告与 Gemini 的一致率以及按当前阈值可避免的 API 调用比例
+    """
+    ok = True
+    for task in TASKS:
+        samples = load_verdicts(task)
+        if len(samples) < folds * 2:
+            print(f"✗ {task}: 样本数 {len(samples)} 不足以评估")
+            ok = False
+            continue
+        agree_all, local, agree_local = cross_validate(samples, folds, seed)
+        n = len(samples)
+        print(f"\n任务 {task}（{n} 条样本，{folds} 折交叉验证）")
+        print(f"  全部样本与 Gemini 一致率: {agree_all / n * 100:.1f}%")
+        print(f"  置信度 >= {CONFIDENCE_THRESHOLD} 的样本: {local} 条，可避免 API 调用 {local / n * 100:.1f}%")
+        if local:
+            print(f"  其中与 Gemini 一致率: {agree_local / local * 100:.1f}%")
+        print(f"  启用本地判断: {'是' if quality_ok(local, agree_local) else '否'}")
+    return ok
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "evaluate"
+    if command == "train":
+        success = train_all()
+    elif command == "evaluate":
+        success = evaluate()
+    else:
+        print(__doc__)
+        success = False
+    sys.exit(0 if success else 1)
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+抽奖帖指定回复内容的本地规则引擎
+帖子明确要求回复特定内容（如 回复'XXX'参与）时直接提取原文，无需调用 Gemini
+"""
+import re
+import sys
+
+# 引号对：半角、全角、中文弯引号、直角引号
+QUOTE_PAIRS = [
+    ('"', '"'),
+    ("'", "'"),
+    ('“', '”'),
+    ('‘', '’'),
+    ('＂', '＂'),
+    ('＇', '＇'),
+    ('「', '」'),
+    ('『', '』'),
+]
+# 【】多用作小标题，只接受紧跟在动词后面、且后面不是冒号的，如“回帖【参与抽奖】”
+BRACKET_PAIR = ('【', '】')
+
+# 表示“回复某内容”的动词
+REPLY_VERBS = r'(?:回复|评论|留言|回帖|跟帖|盖楼)'
+
+# 动词与引号之间允许出现的修饰语，如“内容”“关键词”“：”“即可”
+VERB_GLUE = r'(?:\s*(?:内容|关键词|关键字|口令|暗号|格式|以下内容|下面的内容)?\s*(?:为|是)?\s*[:：]?\s*)'
+
+# 紧挨在规则前面的否定词，如“不要回复'XXX'”，这类内容是楼主禁止的回复
+NEGATION_RE = re.compile(r'(?:不要|不许|不能|别|勿|禁止)\s*$')
+# 紧挨在规则前面的叙述主语，如“楼主回复'收到'的中奖”，描述的是别人的回复而不是参与方式
+NARRATOR_RE = re.compile(r'(?:楼主|作者|博主|我)(?:会|将|已|已经)?\s*$')
+
+# 提取结果的长度限制，过长多半是误匹配
+MIN_REPLY_LEN = 1
+MAX_REPLY_LEN = 50
+
+
+def _body(close_q):
+    c = re.escape(close_q)
+    return rf'([^{c}\n]{{{MIN_REPLY_LEN},{MAX_REPLY_LEN}}}?)'
+
+
+def _build_rules():
+    """
+    按引号类型生成规则列表，返回 [(规则名, 正则, 引号)]
+    引号只在左右引号相同时给出，用于判断动词本身是否落在另一对引号里
+    """
+    rules = []
+    for open_q, close_q in QUOTE_PAIRS:
+        o, c = re.escape(open_q), re.escape(close_q)
+        body = _body(close_q)
+        same = open_q if open_q == close_q else None
+        # 回复'XXX'参与 / 评论：「XXX」即可
+        rules.append((f"verb_quote{open_q}{close_q}", re.compile(rf'{REPLY_VERBS}{VERB_GLUE}{o}{body}{c}'), same))
+        # 带'XXX'回复 / 以「XXX」评论
+        rules.append((f"quote_verb{open_q}{close_q}", re.compile(rf'(?:带上?|以|用|打上?){o}{body}{c}\s*{REPLY_VERBS}'), same))
+    open_q, close_q = BRACKET_PAIR
+    rules.append((
+        f"verb_quote{open_q}{close_q}",
+        re.compile(rf'{REPLY_VERBS}{re.escape(open_q)}{_body(close_q)}{re.escape(close_q)}(?!\s*[:：])'),
+        None,
+    ))
+    return rules
+
+
+RULES = _build_rules()
+
+# 命中率统计
+RULE_STATS = {"checked": 0, "matched": 0, "missed": 0, "by_rule": {}}
+
+
+def extract_required_reply(post_title, post_content):
+    """
+    从帖子正文和标题中提取指定的回复内容
+    返回需要一字不差回复的文本，未命中任何规则时返回 None
+    """
+    RULE_STATS["checked"] += 1
+    for text in (post_content or "", post_title or ""):
+        # 取正文中位置最靠前的有效匹配，位置相同时按规则顺序
+        best = None
+        for name, pattern, same_quote in RULES:
+            for match in pattern.finditer(text):
+                before = text[:match.start()]
+                if NEGATION_RE.search(before) or NARRATOR_RE.search(before):
+                    continue
+                # 前面的同种引号为奇数个时，动词在引号内，匹配到的是下一段引号内容
+                if same_quote and before.count(same_quote) % 2:
+                    continue
+                reply = match.group(1).strip()
+                if not (MIN_REPLY_LEN <= len(reply) <= MAX_REPLY_LEN):
+                    continue
+                if best is None or match.start() < best[0]:
+                    best = (match.start(), name, reply)
+                break
+        if best:
+            _, name, reply = best
+            RULE_STATS["matched"] += 1
+            RULE_STATS["by_rule"][name] = RULE_STATS["by_rule"].get(name, 0) + 1
+            return reply
+    RULE_STATS["missed"] += 1
+    return None
+
+
+def rule_stats_summary():
+    """返回规则命中率统计的文字描述"""
+    checked = RULE_STATS["checked"]
+    if not checked:
+        return "本地规则：未检查任何抽奖帖子"
+    rate = RULE_STATS["matched"] / checked * 100
+    return f"本地规则：检查 {checked} 个抽奖帖子，命中 {RULE_STATS['matched']} 个（{rate:.1f}%），其余交给 Gemini"
+
+
+# 规则自检用例：(正文, 期望提取结果)
+SAMPLE_CASES = [
+    ("回复'我要鸡腿'参与抽奖", "我要鸡腿"),
+    ('回复"NodeSeek 永远滴神"即可', "NodeSeek 永远滴神"),
+    ("评论“祝楼主发财”参与", "祝楼主发财"),
+    ("留言‘来了’就行", "来了"),
+    ("回复＂抽我＂参与", "抽我"),
+    ("回复：「NS牛逼」，周五开奖", "NS牛逼"),
+    ("回复内容：『好人一生平安』", "好人一生平安"),
+    ("回帖【参与抽奖】即可", "参与抽奖"),
+    ("评论关键词为「VPS」", "VPS"),
+    ("带上'来一份'回复参与", "来一份"),
+    ("以「感谢大佬」评论即可", "感谢大佬"),
+    ("楼下回复“冲冲冲”自动参与", "冲冲冲"),
+    ('不要回复"哈哈"之类的，回复"好运"参与', "好运"),
+    ('楼主回复"收到"的就是中奖了，回复"冲"参与', "冲"),
+    ('【活动规则】回复"好运"参与', "好运"),
+    ("回复【活动规则】：每人限一次，周五开奖", None),
+    ("回复：【注意事项】不要重复回复", None),
+    ('大家"踊跃回复"参与抽奖"周五开奖"', None),
+    ("楼主回复【已开奖】了", None),
+    ("送三台 VPS，随便回复参与，周日开奖", None),
+    ("年终奖发了吗？大家聊聊", None),
+]
+
+
+def self_check():
+    """运行规则自检，全部通过返回 True"""
+    failed = 0
+    for content, expected in SAMPLE_CASES:
+        got = extract_required_reply("", content)
+        if got == expected:
+            print(f"✓ {content} -> {got}")
+        else:
+            failed += 1
+            print(f"✗ {content} -> {got}（期望 {expected}）")
+    print(f"\n共 {len(SAMPLE_CASES)} 个用例，失败 {failed} 个")
+    return failed == 0
+
+
+if __name__ == "__main__":
+    sys.exit(0 if self_check() else 1)
@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+"""
+抽奖帖子近实时监听
+常驻进程按带抖动的间隔轮询列表页，只用一次带 If-None-Match / If-Modified-Since 的 HTTP 请求，
+列表未变化时服务端返回 304，几乎不消耗流量；有变化时与已见过的最大帖子 ID（水位线）比较，
+新出现的抽奖帖子立即交给浏览器预取、判断并评论。评论配额、已评论的帖子和评论间隔与每日定时任务共享（comment_ledger.py），
+距离上一次评论不足间隔时新帖子留到之后的轮询再处理，等待期间照常轮询。
+浏览器只在有新抽奖帖子时才启动（守护进程模式下接入预热实例），把反应时间从小时级降到秒级。
+
+用法：
+    python lottery_watcher.py            # 持续监听，Ctrl+C 或 SIGTERM 退出
+    python lottery_watcher.py --once     # 只轮询一次，用于检查配置
+"""
+import argparse
+import json
+import os
+import random
+import signal
+import sys
+
+import clock
+from comment_ledger import daily_quota, recent_commented_urls, slot_wait
+from session_probe import EXPIRED, fetch, probe_session
+from post_listing import LISTING_URL, listing_from_html, listing_from_json
+from metrics import LOTTERIES_FOUND, POSTS_SCANNED, counter, inc, start_metrics_server, write_textfile
+
+WATCH_URL = os.environ.get("NS_WATCH_URL", LISTING_URL)
+WATCH_STATE = os.environ.get("NS_WATCH_STATE", "watcher_state.json")
+WATCH_INTERVAL = float(os.environ.get("NS_WATCH_INTERVAL", "60"))
+# 每次间隔在 [1 - JITTER, 1 + JITTER] 倍之间随机，避免固定周期的请求特征
+WATCH_JITTER = float(os.environ.get("NS_WATCH_JITTER", "0.3"))
+# 连续失败时间隔成倍增加，直到该上限
+WATCH_MAX_INTERVAL = float(os.environ.get("NS_WATCH_MAX_INTERVAL", "900"))
+# 处理失败（如浏览器启动失败）的帖子最多尝试的次数
+PENDING_ATTEMPTS = 3
+
+WATCH_POLLS = counter("nodeseek_watch_polls_total", "Listing polls by result")
+WATCH_STATS = {"polls": 0, "not_modified": 0, "errors": 0, "bytes": 0, "new_posts": 0, "lotteries": 0, "comments": 0}
+
+
+class PollError(Exception):
+    """轮询失败，retry_after 为服务端要求的等待秒数"""
+
+    def __init__(self, message, retry_after=None, expired=False):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.expired = expired
+
+
+def load_state():
+    state = {"etag": None, "last_modified": None, "watermark": None, "pending": {}}
+    if os.path.exists(WATCH_STATE):
+        try:
+            with open(WATCH_STATE, encoding='utf-8') as f:
+                state.update(json.load(f))
+        except Exception as e:
+            print(f"读取监听状态出错：{str(e)}")
+    # 旧版本单独记录的评论数已改为计入共享评论记录
+    state.pop("comments", None)
+    return state
+
+
+def save_state(state):
+    try:
+        with open(WATCH_STATE, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False, indent=2)
+    except OSError as e:
+        print(f"保存监听状态出错：{str(e)}")
+
+
+def _retry_after(response):
+    try:
+        return float(response.headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+def poll_once(state, cookie_header):
+    """
+    条件请求列表页，返回水位线之后新出现的非置顶帖子（PostSummary 列表），列表未变化时返回空列表
+    第一次轮询只建立水位线，不把已有帖子当作新帖子
+    """
+    headers = {}
+    if state["etag"]:
+        headers["If-None-Match"] = state["etag"]
+    if state["last_modified"]:
+        headers["If-Modified-Since"] = state["last_modified"]
+    WATCH_STATS["polls"] += 1
+    try:
+        response = fetch(WATCH_URL, cookie_header, headers)
+    except Exception as e:
+        raise PollError(f"请求失败：{str(e)}")
+    if response.status_code == 304:
+        WATCH_STATS["not_modified"] += 1
+        inc(WATCH_POLLS, result="not_modified")
+        return []
+    if response.status_code in (429, 503):
+        raise PollError(f"HTTP {response.status_code}", retry_after=_retry_after(response))
+    if response.status_code in (401, 403):
+        # 403 也可能是防护页面，交给会话探测确认
+        status, reason = probe_session(cookie_header)
+        raise PollError(f"HTTP {response.status_code}（{reason}）", expired=status == EXPIRED)
+    if response.status_code != 200:
+        raise PollError(f"HTTP {response.status_code}")
+
+    WATCH_STATS["bytes"] += len(response.content)
+    state["etag"] = response.headers.get("ETag") or None
+    state["last_modified"] = response.headers.get("Last-Modified") or None
+    try:
+        if "json" in response.headers.get("Content-Type", ""):
+            listing = listing_from_json(json.loads(response.text))
+        else:
+            listing = listing_from_html(response.text, WATCH_URL)
+    except Exception as e:
+        raise PollError(f"解析列表出错：{str(e)}")
+    if not listing:
+        # 被防护页面拦截时页面上没有帖子，不更新缓存标识，下次重新完整请求
+        state["etag"] = state["last_modified"] = None
+        raise PollError("列表页没有帖子")
+    inc(WATCH_POLLS, result="modified")
+    inc(POSTS_SCANNED, len(listing))
+
+    watermark = state["watermark"]
+    newest = max(post.post_id for post in listing)
+    state["watermark"] = newest if watermark is None else max(watermark, newest)
+    if watermark is None:
+        print(f"建立帖子水位线：{newest}")
+        return []
+    fresh = [post for post in listing if post.post_id > watermark and not post.pinned]
+    WATCH_STATS["new_posts"] += len(fresh)
+    return fresh
+
+
+def next_interval(failures, retry_after=None):
+    """带抖动的轮询间隔，连续失败时指数退避，服务端给出 Retry-After 时不早于该时间"""
+    interval = WATCH_INTERVAL * (2 ** failures) * random.uniform(1 - WATCH_JITTER, 1 + WATCH_JITTER)
+    return max(min(interval, WATCH_MAX_INTERVAL), retry_after or 0)
+
+
+def record_failed_attempt(state):
+    """待处理的帖子全部计一次失败的尝试，达到上限的帖子放弃并记录"""
+    for url in list(state["pending"]):
+        state["pending"][url] += 1
+        if state["pending"][url] >= PENDING_ATTEMPTS:
+            del state["pending"][url]
+            print(f"抽奖帖子 {url} 已尝试 {PENDING_ATTEMPTS} 次仍处理失败，放弃")
+            with open('comment_log.txt', 'a', encoding='utf-8') as f:
+                f.write(f"{clock.ctime()}: Dropped lottery post {url} after {PENDING_ATTEMPTS} failed attempts\n")
+
+
+def handle_lotteries(state):
+    """
+    启动（或接入预热的）浏览器处理待处理的抽奖帖子，评论计入与每日任务共享的配额
+    距离上一次评论不足间隔时不等待，未处理的帖子留在待处理列表中；返回 False 表示登录状态已失效
+    """
+    # 延迟导入，轮询期间不加载浏览器和大模型相关模块
+    from browser_daemon import warm_or_cold_driver
+    from nodeseek_daily import comment_lottery_posts, setup_driver_and_cookies
+
+    limit, used = daily_quota()
+    urls = list(state["pending"])
+    with warm_or_cold_driver(setup_driver_and_cookies) as driver:
+        if not driver:
+            print("浏览器初始化失败，稍后重试")
+            record_failed_attempt(state)
+            return True
+        _, count, session_lost, deferred = comment_lottery_posts(
+            driver, urls, limit - used, recent_commented_urls(), wait_for_gap=False
+        )
+    # 已打开处理过的帖子不再重试，因间隔未处理的帖子保留原有的尝试次数
+    state["pending"] = {url: state["pending"][url] for url in deferred}
+    WATCH_STATS["comments"] += count
+    print(f"新抽奖帖子处理完成，评论 {count} 个，今日共评论 {used + count}/{limit} 个")
+    return not session_lost
+
+
+def watch(once=False):
+    """轮询直到收到 SIGTERM / SIGINT；会话失效时返回退出码 2"""
+    cookie_header = os.environ.get("NS_COOKIE") or os.environ.get("COOKIE") or ""
+    status, reason = probe_session(cookie_header)
+    print(f"登录状态：{status}（{reason}）")
+    if status == EXPIRED:
+        print("✗ Cookie 已失效，请更新 NS_COOKIE 后重试")
+        return 2
+
+    def _shutdown(signum, frame):
+        raise SystemExit(0)
+
+    signal.signal(signal.SIGTERM, _shutdown)
+    start_metrics_server()
+    state = load_state()
+    failures = 0
+    print(f"开始监听 {WATCH_URL}，间隔约 {WATCH_INTERVAL:.0f} 秒")
+    try:
+        while True:
+            retry_after = None
+            try:
+                fresh = poll_once(state, cookie_header)
+                failures = 0
+            except PollError as e:
+                if e.expired:
+                    print(f"✗ 登录状态已失效（{str(e)}），停止监听")
+                    return 2
+                failures += 1
+                retry_after = e.retry_after
+                WATCH_STATS["errors"] += 1
+                inc(WATCH_POLLS, result="error")
+                print(f"轮询列表出错：{str(e)}")
+                fresh = []
+            for post in fresh:
+                if post.is_lottery_candidate and post.href not in state["pending"]:
+                    print(f"发现新抽奖帖子：{post.title}")
+                    inc(LOTTERIES_FOUND)
+                    WATCH_STATS["lotteries"] += 1
+                    state["pending"][post.href] = 0
+            # 距离上一次评论（包括每日任务的评论）不足间隔时先继续轮询，之后再处理
+            wait = slot_wait() if state["pending"] else 0
+            if wait is None:
+                print(f"今日评论配额已用完，放弃 {len(state['pending'])} 个新抽奖帖子")
+                state["pending"] = {}
+            elif state["pending"] and wait <= 0:
+                try:
+                    if not handle_lotteries(state):
+                        print("✗ 登录状态已失效，停止监听")
+                        return 2
+                except Exception as e:
+                    print(f"处理新抽奖帖子出错：{str(e)}")
+                    record_failed_attempt(state)
+            save_state(state)
+            if once:
+                break
+            clock.sleep(next_interval(failures, retry_after))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        save_state(state)
+        write_textfile()
+        print(watch_stats_summary())
+    return 0
+
+
+def watch_stats_summary():
+    """返回监听模式的统计"""
+    return (
+        f"抽奖监听：轮询 {WATCH_STATS['polls']} 次（未变化 {WATCH_STATS['not_modified']} 次，"
+        f"失败 {WATCH_STATS['errors']} 次），下载 {WATCH_STATS['bytes'] / 1024:.1f} KB，"
+        f"新帖子 {WATCH_STATS['new_posts']} 个，新抽奖帖子 {WATCH_STATS['lotteries']} 个，评论 {WATCH_STATS['comments']} 个"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="抽奖帖子近实时监听")
+    parser.add_argument("--once", action="store_true", help="只轮询一次")
+    args = parser.parse_args()
+    sys.exit(watch(once=args.once))
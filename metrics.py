@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+运行指标导出（Prometheus 文本格式）
+内置轻量的计数器、仪表和直方图，热路径上只做字典累加；
+运行结束时写入 node_exporter 的 textfile 目录，守护进程模式下也可以通过本地 HTTP 端口抓取。
+"""
+import bisect
+import http.server
+import os
+import threading
+
+import clock
+
+TEXTFILE = os.environ.get("NS_METRICS_TEXTFILE", "")
+PORT = int(os.environ.get("NS_METRICS_PORT", "0"))
+
+# 秒级延迟的默认桶
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60)
+
+_lock = threading.Lock()
+_families = {}
+
+
+class _Family:
+    def __init__(self, name, kind, help_text, buckets=None):
+        self.name = name
+        self.kind = kind
+        self.help = help_text
+        self.buckets = buckets
+        self.values = {}
+
+    def _key(self, labels):
+        return tuple(sorted(labels.items())) if labels else ()
+
+
+def _family(name, kind, help_text, buckets=None):
+    family = _families.get(name)
+    if family is None:
+        family = _families[name] = _Family(name, kind, help_text, buckets)
+    return family
+
+
+def counter(name, help_text):
+    return _family(name, "counter", help_text)
+
+
+def gauge(name, help_text):
+    return _family(name, "gauge", help_text)
+
+
+def histogram(name, help_text, buckets=LATENCY_BUCKETS):
+    return _family(name, "histogram", help_text, tuple(buckets))
+
+
+# 对冲请求和 HTTP 抓取在其他线程中执行，更新和渲染都在锁内进行
+def inc(family, amount=1, **labels):
+    key = family._key(labels)
+    with _lock:
+        family.values[key] = family.values.get(key, 0) + amount
+
+
+def set_gauge(family, value, **labels):
+    key = family._key(labels)
+    with _lock:
+        family.values[key] = value
+
+
+def observe(family, value, **labels):
+    key = family._key(labels)
+    index = bisect.bisect_left(family.buckets, value)
+    with _lock:
+        entry = family.values.get(key)
+        if entry is None:
+            entry = family.values[key] = [[0] * len(family.buckets), 0.0, 0]
+        if index < len(family.buckets):
+            entry[0][index] += 1
+        entry[1] += value
+        entry[2] += 1
+
+
+class timer:
+    """with timer(PAGE_LOAD, page="post"): ... 记录代码块耗时"""
+
+    def __init__(self, family, **labels):
+        self.family = family
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = clock.now()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.family, clock.now() - self.start, **self.labels)
+        return False
+
+
+# 运行指标
+POSTS_SCANNED = counter("nodeseek_posts_scanned_total", "Posts read from the listing")
+LOTTERIES_FOUND = counter("nodeseek_lotteries_found_total", "Lottery candidates found in the listing")
+LLM_CALLS = counter("nodeseek_llm_calls_total", "LLM calls by task, prompt type and outcome")
+LLM_LATENCY = histogram("nodeseek_llm_latency_seconds", "LLM call latency")
+PAGE_LOAD = histogram("nodeseek_page_load_seconds", "Page load latency")
+TYPING_TIME = histogram("nodeseek_typing_seconds", "Time spent typing a comment", (1, 2, 5, 10, 20, 40))
+COMMENTS = counter("nodeseek_comments_total", "Comment submissions by confirmation outcome")
+SIGN_IN = counter("nodeseek_sign_in_total", "Sign-in attempts by result")
+BROWSER_RSS = gauge("nodeseek_browser_rss_bytes", "Browser process tree RSS")
+RUN_TIMESTAMP = gauge("nodeseek_last_run_timestamp_seconds", "Time the last run finished")
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def render():
+    """生成 Prometheus 文本格式"""
+    lines = []
+    with _lock:
+        for family in _families.values():
+            if not family.values:
+                continue
+            lines.append(f"# HELP {family.name} {family.help}")
+            lines.append(f"# TYPE {family.name} {family.kind}")
+            for key, value in sorted(family.values.items()):
+                if family.kind != "histogram":
+                    lines.append(f"{family.name}{_labels(key)} {value}")
+                    continue
+                counts, total, count = value
+                cumulative = 0
+                for bound, n in zip(family.buckets, counts):
+                    cumulative += n
+                    lines.append(f"{family.name}_bucket{_labels(key, [('le', bound)])} {cumulative}")
+                lines.append(f"{family.name}_bucket{_labels(key, [('le', '+Inf')])} {count}")
+                lines.append(f"{family.name}_sum{_labels(key)} {total}")
+                lines.append(f"{family.name}_count{_labels(key)} {count}")
+    return "\n".join(lines) + "\n"
+
+
+def write_textfile(path=None):
+    """写入 node_exporter textfile，先写临时文件再改名，避免被读到一半"""
+    path = path or TEXTFILE
+    if not path:
+        return None
+    set_gauge(RUN_TIMESTAMP, clock.now())
+    try:
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(render())
+        os.replace(tmp, path)
+        print(f"运行指标已写入 {path}")
+    except OSError as e:
+        print(f"写入运行指标出错：{str(e)}")
+    return path
+
+
+def _read_textfile():
+    if not TEXTFILE or not os.path.exists(TEXTFILE):
+        return None
+    with open(TEXTFILE, encoding='utf-8') as f:
+        return f.read()
+
+
+class _MetricsHandler(http.server.BaseHTTPRequestHandler):
+    """
+    /metrics 只返回本进程的指标；/metrics/run 返回最近一次运行写入的 textfile
+    两者的指标族有重叠，分开提供，避免同一响应中出现重复的 HELP / TYPE
+    """
+
+    def do_GET(self):
+        path = self.path.split('?')[0]
+        body = render() if path == "/metrics" else _read_textfile() if path == "/metrics/run" else None
+        if body is None:
+            self.send_response(404)
+            self.end_headers()
+            return
+        data = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_metrics_server(port=None):
+    """在后台线程中提供 http://127.0.0.1:<port>/metrics 和 /metrics/run，端口为 0 时不启动"""
+    port = PORT if port is None else port
+    if not port:
+        return None
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True, name="metrics").start()
+    print(f"运行指标地址: http://127.0.0.1:{port}/metrics，最近一次运行: http://127.0.0.1:{port}/metrics/run")
+    return server
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+通过 CDP 网络事件捕获论坛前端加载的 JSON 数据
+开启 Chrome 性能日志后，正常浏览时的 Network.responseReceived 事件会写入日志，
+对列表、帖子和用户状态接口的 JSON 响应调用 Network.getResponseBody 读取结构化数据，
+提取帖子和列表时优先使用这些数据，页面没有对应接口请求时回退到 DOM 提取。
+"""
+import collections
+import json
+import os
+import re
+
+import clock
+
+CAPTURE_ENABLED = os.environ.get("NS_NETWORK_CAPTURE", "true").lower() == "true"
+
+# 按 URL 归类的接口，可通过 NS_CAPTURE_<KIND> 覆盖正则
+# 按顺序匹配：带帖子 ID 的详情接口先于列表接口，避免 /api/posts/123 被当作列表
+CAPTURE_PATTERNS = {
+    "post": re.compile(
+        os.environ.get("NS_CAPTURE_POST", r"/api/.*(?:post|content|comment)s?(?:[/-]|\?(?:.*&)?(?:post_?)?id=)\d+(?:[/?#&]|$)"),
+        re.I,
+    ),
+    "listing": re.compile(os.environ.get("NS_CAPTURE_LISTING", r"/api/.*(?:list|posts|board)"), re.I),
+    "user": re.compile(os.environ.get("NS_CAPTURE_USER", r"/api/.*(?:account|user|member|notify)"), re.I),
+}
+MAX_BODY_BYTES = 2 * 1024 * 1024
+
+CAPTURE_STATS = {"responses": 0, "captured": 0, "errors": 0, "hits": 0, "misses": 0}
+
+# 每类只保留最近的若干条响应
+_captured = collections.defaultdict(lambda: collections.deque(maxlen=20))
+
+
+def enable_capture(options):
+    """为 ChromeOptions 打开性能日志，使网络事件可以通过 get_log('performance') 读取"""
+    if CAPTURE_ENABLED:
+        options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
+    return options
+
+
+def _kind(url):
+    for kind, pattern in CAPTURE_PATTERNS.items():
+        if pattern.search(url):
+            return kind
+    return None
+
+
+def drain(driver):
+    """读取积压的网络事件，取回匹配接口的 JSON 响应体，返回本次新捕获的数量"""
+    if not CAPTURE_ENABLED:
+        return 0
+    try:
+        entries = driver.get_log("performance")
+    except Exception:
+        # 未开启性能日志（如接入的预热实例）时静默跳过
+        return 0
+    count = 0
+    for entry in entries:
+        try:
+            message = json.loads(entry["message"])["message"]
+        except (KeyError, ValueError):
+            continue
+        if message.get("method") != "Network.responseReceived":
+            continue
+        params = message.get("params", {})
+        response = params.get("response", {})
+        if "json" not in response.get("mimeType", ""):
+            continue
+        kind = _kind(response.get("url", ""))
+        if kind is None:
+            continue
+        CAPTURE_STATS["responses"] += 1
+        try:
+            body = driver.execute_cdp_cmd("Network.getResponseBody", {"requestId": params["requestId"]})
+            text = body.get("body", "")
+            if body.get("base64Encoded") or len(text) > MAX_BODY_BYTES:
+                continue
+            _captured[kind].append({"url": response["url"], "time": clock.now(), "data": json.loads(text)})
+            CAPTURE_STATS["captured"] += 1
+            count += 1
+        except Exception:
+            # 响应体可能已被浏览器释放
+            CAPTURE_STATS["errors"] += 1
+    return count
+
+
+def _post_id_re(post_id):
+    """匹配 URL 中作为完整路径段或 id 参数出现的帖子 ID，避免 123 匹配到 /1234 或其他数字"""
+    post_id = re.escape(str(post_id))
+    return re.compile(rf"(?:post-|/|[?&](?:post_?)?id=){post_id}(?:[/?#&]|$)", re.I)
+
+
+def latest(driver, kind, since=0, post_id=None):
+    """返回 since 之后捕获的、URL 指向 post_id 帖子的最近一条该类响应的数据，没有时返回 None"""
+    drain(driver)
+    pattern = _post_id_re(post_id) if post_id is not None else None
+    for record in reversed(_captured[kind]):
+        if record["time"] >= since and (pattern is None or pattern.search(record["url"])):
+            return record["data"]
+    return None
+
+
+def _walk(obj):
+    """广度优先遍历 JSON 中的所有字典"""
+    queue = collections.deque([obj])
+    while queue:
+        item = queue.popleft()
+        if isinstance(item, dict):
+            yield item
+            queue.extend(item.values())
+        elif isinstance(item, list):
+            queue.extend(item)
+
+
+def _first(d, *keys):
+    for key in keys:
+        if d.get(key) not in (None, ""):
+            return d[key]
+    return None
+
+
+def post_fields(data):
+    """从帖子接口数据中取出与 extract_post 记录同名的字段，取不到的字段不返回"""
+    for d in _walk(data):
+        title = _first(d, "title")
+        content = _first(d, "content", "text", "body")
+        if isinstance(title, str) and isinstance(content, str):
+            fields = {"title": title.strip(), "content": content.strip()}
+            author = _first(d, "author", "username", "member_name", "authorName")
+            if isinstance(author, dict):
+                author = _first(author, "name", "username", "member_name")
+            if author:
+                fields["author"] = str(author)
+            post_time = _first(d, "created_at", "createdAt", "created", "time")
+            if post_time:
+                fields["post_time"] = str(post_time)
+            replies = _first(d, "reply_count", "replyCount", "comment_count", "commentCount", "comments")
+            if isinstance(replies, int):
+                fields["reply_count"] = replies
+            return fields
+    return {}
+
+
+def listing_entries(data):
+    """从列表接口数据中取出帖子列表，返回与 LISTING_SCRIPT 相同结构的字典列表"""
+    for d in _walk(data):
+        for value in d.values():
+            if isinstance(value, list) and value and all(isinstance(v, dict) for v in value) \
+                    and all("id" in v and "title" in v for v in value):
+                return [{
+                    "href": f"https://www.nodeseek.com/post-{v['id']}-1",
+                    "title": str(v["title"]).strip(),
+                    "pinned": bool(_first(v, "pinned", "is_pinned", "sticky")),
+                    "reply_count": int(_first(v, "reply_count", "replyCount", "comment_count", "commentCount") or 0),
+                    "timestamp": str(_first(v, "updated_at", "updatedAt", "created_at", "createdAt") or ""),
+                } for v in value]
+    return []
+
+
+def current_user(data):
+    """从用户状态接口数据中取出 (用户 ID, 用户名)"""
+    for d in _walk(data):
+        uid = _first(d, "member_id", "uid", "user_id", "id")
+        name = _first(d, "member_name", "username", "name")
+        if uid is not None and isinstance(name, str):
+            return str(uid), name
+    return None
+
+
+def capture_stats_summary():
+    """返回网络捕获的统计"""
+    return (
+        f"网络捕获：匹配响应 {CAPTURE_STATS['responses']} 个，读取 {CAPTURE_STATS['captured']} 个，"
+        f"失败 {CAPTURE_STATS['errors']} 个；结构化数据命中 {CAPTURE_STATS['hits']} 次，回退 DOM {CAPTURE_STATS['misses']} 次"
+    )
@@ -10,20 +10,41 @@ print(f"Python 版本: {sys.version}")
 
 print("导入标准库...")
 import os
-import requests
 from bs4 import BeautifulSoup
 print("导入 Selenium...")
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 import random
-import time
 import traceback
 print("导入 undetected-chromedriver...")
 import undetected_chromedriver as uc
 print(f"undetected-chromedriver 版本: {uc.__version__}")
 from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.common.action_chains import ActionChains
+import clock
+from lottery_rules import extract_required_reply, rule_stats_summary
+from lottery_classifier import classify_locally, record_verdict, classifier_stats_summary
+from reply_history import find_similar_reply, remember_reply
+from reply_bank import prepare_reply_bank, pick_bank_reply, is_generic_post, reply_bank_size
+from llm_providers import generate_text, llm_available, llm_circuit_open, provider_stats_summary
+from llm_policy import start_post_deadline, clear_post_deadline, policy_stats_summary
+from browser_manager import BROWSER_STATS, child_pids, kill_spawned_since, teardown_driver
+from browser_daemon import warm_or_cold_driver
+from browser_memory import apply_browser_profile, after_post, memory_stats_summary
+from browser_resolver import resolve, describe
+from post_extract import extract_post
+from post_listing import capture_listing, refresh_listing
+from network_capture import enable_capture, capture_stats_summary
+from post_triage import triage_posts, triage_stats_summary
+from diagnostics import snapshot, record_failure, diagnostics_summary
+from session_probe import probe_session, check_session_midrun, EXPIRED
+from comment_confirm import install_confirmation, wait_confirmation, confirm_stats_summary
+from comment_ledger import acquire_slot, daily_quota, recent_commented_urls, release_slot, wait_for_slot
+from pacing import start_attempt, record_outcome, pacing_delay, failure_delay, last_throttled, pacing_summary
+from metrics import BROWSER_RSS, LOTTERIES_FOUND, PAGE_LOAD, SIGN_IN, TYPING_TIME, inc, set_gauge, timer, write_textfile
+from content_compact import compact_content, should_shadow, record_shadow, compact_stats_summary
+from token_budget import budget_allows, usage_summary
 print("所有库导入完成")
 
 
@@ -39,16 +60,9 @@ print(f"NS_COOKIE loaded: {'Set' if cookie else 'Not set'}")
 print(f"HEADLESS: {headless}")
 print(f"NS_RANDOM: {ns_random}")
 
-def check_lottery_ended(post_title, post_content):
-    """
-    使用 Gemini 判断抽奖是否已开奖
-    返回 True 表示已开奖，False 表示未开奖
-    """
-    try:
-        if not GEMINI_API_KEY:
-            return False  # 无法判断时默认未开奖
-        
-        prompt = f"""
+def lottery_ended_prompt(post_title, post_content):
+    """判断是否已开奖的提示词"""
+    return f"""
 判断这个抽奖帖子是否已经开奖或结束。
 
 标题：{post_title}
@@ -61,20 +75,60 @@ def check_lottery_ended(post_title, post_content):
 
 回复：
 """
+
+def real_lottery_prompt(post_title, post_content):
+    """判断是否真的抽奖帖子的提示词"""
+    return f"""
+判断这个帖子是否真的是抽奖/送福利帖子。
+
+标题：{post_title}
+内容：{post_content}
+
+规则：
+1. 真的抽奖帖子特征：明确说明送东西、抽奖、福利、赠送、免费领取等，有参与方式
+2. 不是抽奖帖子：只是讨论"年终奖"、"奖金"、"奖励"等话题，没有送东西
+3. 不是抽奖帖子：出售商品、求购、技术讨论等
+4. 只回复"是"或"否"，不要其他内容
+
+回复：
+"""
+
+def ask_yes_no(prompt_type, post_title, post_content, build_prompt):
+    """
+    使用压缩后的正文向大模型提问，返回原始回复
+    按抽样比例额外用完整正文再问一次，统计压缩对判断结果的影响
+    """
+    compacted = compact_content(post_content, prompt_type)
+    reply = generate_text("classify", build_prompt(post_title, compacted), prompt_type=prompt_type).strip()
+    shadow_type = f"{prompt_type}_shadow"
+    if should_shadow() and budget_allows(shadow_type):
+        full_reply = generate_text("classify", build_prompt(post_title, post_content), prompt_type=shadow_type).strip()
+        record_shadow(prompt_type, full_reply == reply)
+    return reply
+
+def check_lottery_ended(post_title, post_content):
+    """
+    使用 Gemini 判断抽奖是否已开奖
+    返回 True 表示已开奖，False 表示未开奖
+    """
+    try:
+        # 大模型不可用或预算用完时放宽本地分类器的置信度要求，仍无法判断则默认未开奖
+        if not llm_available("classify") or not budget_allows("ended"):
+            local_verdict = classify_locally("ended", post_title, post_content, threshold=0.5)
+            print(f"大模型不可用或今日预算不足，使用本地判断：{'已' if local_verdict else '未'}开奖")
+            return bool(local_verdict)
         
-        url = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash:generateContent"
-        headers = {"Content-Type": "application/json"}
-        data = {
-            "contents": [{
-                "parts": [{"text": prompt}]
-            }]
-        }
+        # 本地分类器置信度足够时直接返回
+        local_verdict = classify_locally("ended", post_title, post_content)
+        if local_verdict is not None:
+            print(f"本地分类器判断{'已' if local_verdict else '未'}开奖")
+            return local_verdict
         
-        response = requests.post(f"{url}?key={GEMINI_API_KEY}", headers=headers, json=data, timeout=10)
-        response.raise_for_status()
+        reply = ask_yes_no("ended", post_title, post_content, lottery_ended_prompt)
         
-        result = response.json()
-        reply = result.get("candidates", [{}])[0].get("content", {}).get("parts", [{}])[0].get("text", "").strip()
+        # 记录 Gemini 的判断结果，用于训练本地分类器
+        if reply in ("是", "否"):
+            record_verdict("ended", post_title, post_content, reply == "是")
         
         return reply == "是"
         
@@ -88,37 +142,23 @@ def check_is_real_lottery(post_title, post_content):
     返回 True 表示是真的抽奖帖子，False 表示不是
     """
     try:
-        if not GEMINI_API_KEY:
-            return True  # 无法判断时默认是抽奖帖子（保守策略）
-        
-        prompt = f"""
-判断这个帖子是否真的是抽奖/送福利帖子。
-
-标题：{post_title}
-内容：{post_content[:500]}
-
-规则：
-1. 真的抽奖帖子特征：明确说明送东西、抽奖、福利、赠送、免费领取等，有参与方式
-2. 不是抽奖帖子：只是讨论"年终奖"、"奖金"、"奖励"等话题，没有送东西
-3. 不是抽奖帖子：出售商品、求购、技术讨论等
-4. 只回复"是"或"否"，不要其他内容
-
-回复：
-"""
+        # 大模型不可用或预算用完时放宽本地分类器的置信度要求，仍无法判断则默认是抽奖帖子（保守策略）
+        if not llm_available("classify") or not budget_allows("is_real"):
+            local_verdict = classify_locally("is_real", post_title, post_content, threshold=0.5)
+            print(f"大模型不可用或今日预算不足，使用本地判断：{'不是' if local_verdict is False else '是'}抽奖帖子")
+            return local_verdict is not False
         
-        url = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash:generateContent"
-        headers = {"Content-Type": "application/json"}
-        data = {
-            "contents": [{
-                "parts": [{"text": prompt}]
-            }]
-        }
+        # 本地分类器置信度足够时直接返回
+        local_verdict = classify_locally("is_real", post_title, post_content)
+        if local_verdict is not None:
+            print(f"本地分类器判断{'是' if local_verdict else '不是'}抽奖帖子")
+            return local_verdict
         
-        response = requests.post(f"{url}?key={GEMINI_API_KEY}", headers=headers, json=data, timeout=10)
-        response.raise_for_status()
+        reply = ask_yes_no("is_real", post_title, post_content, real_lottery_prompt)
         
-        result = response.json()
-        reply = result.get("candidates", [{}])[0].get("content", {}).get("parts", [{}])[0].get("text", "").strip()
+        # 记录 Gemini 的判断结果，用于训练本地分类器
+        if reply in ("是", "否"):
+            record_verdict("is_real", post_title, post_content, reply == "是")
         
         return reply == "是"
         
@@ -126,19 +166,53 @@ def check_is_real_lottery(post_title, post_content):
         print(f"判断是否抽奖帖子出错：{str(e)}")
         return True  # 出错时默认是抽奖帖子（保守策略）
 
-def get_gemini_reply(post_title, post_content, is_lottery=False, recent_replies=None):
+def get_gemini_reply(post_title, post_content, is_lottery=False):
     """
-    调用 Gemini API 根据帖子内容生成自然回复，失败时返回 None
+    根据帖子内容生成自然回复，没有可用回复时返回 None
     is_lottery: 是否为抽奖帖子
-    recent_replies: 最近使用的回复列表，用于避免重复
+    依次尝试：本地规则（抽奖指定回复）、回复库（通用帖子）、Gemini，Gemini 失败时回退到回复库
+    """
+    # 帖子明确要求回复特定内容时，直接使用本地规则提取，无需调用 Gemini
+    if is_lottery:
+        required_reply = extract_required_reply(post_title, post_content)
+        if required_reply:
+            print(f"本地规则命中，使用指定回复：{required_reply}")
+            return required_reply
+    
+    # 通用帖子直接使用回复库，节省 API 调用
+    if not is_lottery and is_generic_post(post_content):
+        bank_reply = pick_bank_reply(post_title, post_content)
+        if bank_reply:
+            print(f"通用帖子，使用回复库回复：{bank_reply}")
+            return bank_reply
+    
+    # 预算紧张时普通帖子直接使用回复库，把剩余预算留给抽奖帖子
+    prompt_type = "reply_lottery" if is_lottery else "reply"
+    if not budget_allows(prompt_type):
+        reply = pick_bank_reply(post_title, post_content, category="lottery" if is_lottery else None)
+        print(f"今日大模型预算不足，使用回复库回复：{reply}")
+        return reply
+    
+    reply = request_gemini_reply(post_title, post_content, is_lottery)
+    if reply is None:
+        reply = pick_bank_reply(post_title, post_content, category="lottery" if is_lottery else None)
+        if reply:
+            print(f"Gemini 未生成可用回复，使用回复库回复：{reply}")
+    return reply
+
+def request_gemini_reply(post_title, post_content, is_lottery=False):
+    """
+    调用 Gemini API 根据帖子内容生成自然回复，失败时返回 None
+    与历史回复近似重复的内容会被拒绝
     """
-    if recent_replies is None:
-        recent_replies = []
     try:
-        if not GEMINI_API_KEY:
-            print("未找到 Gemini API 密钥，跳过回复")
+        if not llm_available("reply"):
+            print("未找到可用的大模型服务（如 Gemini API 密钥），跳过回复")
             return None
         
+        # 只保留开头段落和关键句，控制提示词长度
+        post_content = compact_content(post_content, "reply")
+        
         # 根据是否为抽奖帖子使用不同的提示词
         if is_lottery:
             # 抽奖帖子的提示词
@@ -183,21 +257,7 @@ def get_gemini_reply(post_title, post_content, is_lottery=False, recent_replies=
 只输出回复内容。
 """
         
-        url = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash:generateContent"
-        headers = {
-            "Content-Type": "application/json"
-        }
-        data = {
-            "contents": [{
-                "parts": [{"text": prompt}]
-            }]
-        }
-        
-        response = requests.post(f"{url}?key={GEMINI_API_KEY}", headers=headers, json=data, timeout=10)
-        response.raise_for_status()
-        
-        result = response.json()
-        reply = result.get("candidates", [{}])[0].get("content", {}).get("parts", [{}])[0].get("text", "")
+        reply = generate_text("reply", prompt, prompt_type="reply_lottery" if is_lottery else "reply")
         
         # 清理回复，去除多余换行或符号
         reply = reply.strip().replace("\n", " ").replace('"', "").replace(""", "").replace(""", "")
@@ -207,9 +267,10 @@ def get_gemini_reply(post_title, post_content, is_lottery=False, recent_replies=
             print(f"Gemini 回复长度异常（{len(reply)}）：{reply}，跳过回复")
             return None
         
-        # 检查是否与最近的回复重复
-        if recent_replies and reply in recent_replies:
-            print(f"回复内容重复（{reply}），跳过")
+        # 检查是否与历史回复近似重复
+        similar = find_similar_reply(reply)
+        if similar:
+            print(f"回复内容与历史回复近似重复（{reply} ≈ {similar[0]}，相似度 {similar[1]:.2f}），跳过")
             return None
         
         print(f"Gemini 生成回复（{'抽奖' if is_lottery else '普通'}）：{reply}")
@@ -219,28 +280,6 @@ def get_gemini_reply(post_title, post_content, is_lottery=False, recent_replies=
         print(f"调用 Gemini API 出错：{str(e)}，跳过回复")
         return None
 
-def extract_post_content(driver):
-    """
-    提取帖子标题和正文内容
-    """
-    try:
-        # 获取标题
-        title_element = WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((By.CSS_SELECTOR, '.post-title'))
-        )
-        post_title = title_element.text.strip()
-        
-        # 获取正文（取首段）
-        content_element = WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((By.CSS_SELECTOR, '.post-content'))
-        )
-        post_content = content_element.text.strip()[:5000]  # 限制长度
-        
-        return post_title, post_content
-    except Exception as e:
-        print(f"提取帖子内容出错：{str(e)}")
-        return "未知标题", "未知内容"
-
 def click_sign_icon(driver):
     """
     尝试点击签到图标和试试手气按钮的通用方法
@@ -249,7 +288,7 @@ def click_sign_icon(driver):
         print("准备进入签到页面...")
         driver.get("https://www.nodeseek.com/board")
         print("等待页面加载...")
-        time.sleep(5)
+        clock.sleep(5)
         
         # 打印当前URL
         print(f"当前页面URL: {driver.current_url}")
@@ -269,8 +308,10 @@ def click_sign_icon(driver):
             
             click_button.click()
             print("完成试试手气点击")
+            inc(SIGN_IN, result="clicked")
         except Exception as lucky_error:
             print(f"试试手气按钮点击失败或者签到过了: {str(lucky_error)}")
+            inc(SIGN_IN, result="not_clicked")
             
         return True
         
@@ -278,16 +319,16 @@ def click_sign_icon(driver):
         print(f"签到过程中出错:")
         print(f"错误类型: {type(e).__name__}")
         print(f"错误信息: {str(e)}")
-        print(f"当前页面URL: {driver.current_url}")
-        print(f"当前页面源码片段: {driver.page_source[:500]}...")
-        print("详细错误信息:")
-        traceback.print_exc()
+        # 页面 URL、DOM 片段和堆栈写入诊断记录，不再序列化整个页面源码
+        record_failure(driver, "sign", e)
+        inc(SIGN_IN, result="error")
         return False
 
 def setup_driver_and_cookies():
     """
     初始化浏览器并设置 Cookie
     """
+    driver = None
     try:
         if not cookie:
             print("未找到 Cookie 配置")
@@ -296,21 +337,20 @@ def setup_driver_and_cookies():
         print("开始初始化浏览器...")
         print(f"当前工作目录: {os.getcwd()}")
         
-        # 检查 Chrome 是否已安装
-        import subprocess
-        try:
-            chrome_version = subprocess.check_output(['google-chrome', '--version'], stderr=subprocess.STDOUT).decode().strip()
-            print(f"检测到 Chrome: {chrome_version}")
-        except Exception as e:
-            print(f"无法检测 Chrome 版本: {e}")
+        # 读取缓存的浏览器清单，浏览器二进制未变化时不再启动子进程探测版本
+        manifest = resolve()
+        print(f"检测到 {describe(manifest)}")
+        browser_path = manifest["browser_path"] if manifest else '/usr/bin/google-chrome'
+        chromedriver_path = (manifest or {}).get("driver_path") or '/usr/local/bin/chromedriver'
         
         # 添加重试机制
-        driver = None
         max_retries = 3
         for attempt in range(max_retries):
+            # 记录启动前的子进程，初始化失败时清理半启动的 Chrome / chromedriver
+            spawned_before = child_pids()
             try:
                 print(f"尝试初始化浏览器 (尝试 {attempt + 1}/{max_retries})...")
-                print(f"时间戳: {time.time()}")
+                print(f"时间戳: {clock.now()}")
                 
                 # 每次重试都创建新的 ChromeOptions 对象
                 options = uc.ChromeOptions()
@@ -322,22 +362,25 @@ def setup_driver_and_cookies():
                     options.add_argument('--disable-gpu')
                     options.add_argument('--window-size=1920,1080')
                     options.add_argument('--user-agent=Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/144.0.0.0 Safari/537.36')
+                apply_browser_profile(options)
+                enable_capture(options)
                 
                 print("ChromeOptions 配置完成，开始创建 Chrome 实例...")
                 # 强制使用系统安装的 Chrome 和 ChromeDriver
                 driver = uc.Chrome(
                     options=options,
-                    driver_executable_path='/usr/local/bin/chromedriver',
-                    browser_executable_path='/usr/bin/google-chrome',
+                    driver_executable_path=chromedriver_path,
+                    browser_executable_path=browser_path,
                     use_subprocess=True
                 )
                 
-                print(f"浏览器初始化成功，时间戳: {time.time()}")
+                print(f"浏览器初始化成功，时间戳: {clock.now()}")
                 break
             except Exception as e:
                 print(f"初始化尝试 {attempt + 1} 失败：{str(e)}")
+                kill_spawned_since(spawned_before)
                 if attempt < max_retries - 1:
-                    time.sleep(2)
+                    clock.sleep(2)
                 else:
                     raise
         
@@ -351,7 +394,7 @@ def setup_driver_and_cookies():
         
         print("正在设置 Cookie...")
         driver.get('https://www.nodeseek.com')
-        time.sleep(5)
+        clock.sleep(5)
         
         for cookie_item in cookie.split(';'):
             try:
@@ -367,23 +410,30 @@ def setup_driver_and_cookies():
                 continue
         
         driver.refresh()
-        time.sleep(5)
+        clock.sleep(5)
         return driver
         
     except Exception as e:
         print(f"设置浏览器和 Cookie 时出错：{str(e)}")
         traceback.print_exc()
+        # 浏览器已启动但后续步骤失败时，关闭浏览器避免残留进程
+        if driver:
+            teardown_driver(driver)
         return None
 
-def post_comment_on_url(driver, post_url, input_text):
+def post_comment_on_url(driver, post_url, input_text, editor_present=False):
     """
-    在指定帖子 URL 上发表评论，返回 True/False 表示是否成功
+    在指定帖子 URL 上发表评论，返回 True/False 表示评论是否确认出现在页面上
+    editor_present: 提取帖子信息时已确认当前页面就是该帖子且编辑器已加载，不再重新打开页面
     """
+    start_attempt()
     try:
-        driver.get(post_url)
-        # 模拟浏览
-        driver.execute_script("window.scrollBy(0, 500);")
-        time.sleep(random.uniform(2, 5))
+        if not (editor_present and driver.current_url.split('#')[0] == post_url):
+            with timer(PAGE_LOAD, page="comment"):
+                driver.get(post_url)
+            # 模拟浏览
+            driver.execute_script("window.scrollBy(0, 500);")
+            clock.sleep(random.uniform(2, 5))
         
         editor = WebDriverWait(driver, 30).until(
             EC.presence_of_element_located((By.CSS_SELECTOR, '.CodeMirror'))
@@ -393,145 +443,239 @@ def post_comment_on_url(driver, post_url, input_text):
             editor.click()
         except:
             driver.execute_script("arguments[0].click();", editor)
-        time.sleep(0.5)
+        clock.sleep(0.5)
         
         # 模拟真实打字，速度随机变化
         actions = ActionChains(driver)
         for char in input_text:
             actions.send_keys(char)
             actions.pause(random.uniform(0.05, 0.2))
-        actions.perform()
-        time.sleep(2)
+        with timer(TYPING_TIME):
+            actions.perform()
+        clock.sleep(2)
         
         submit_button = WebDriverWait(driver, 30).until(
             EC.element_to_be_clickable((By.XPATH, "//button[contains(@class, 'submit') and contains(@class, 'btn') and contains(text(), '发布评论')]"))
         )
         driver.execute_script("arguments[0].scrollIntoView(true);", submit_button)
-        time.sleep(0.5)
+        clock.sleep(0.5)
+        # 点击前安装监听，只有页面上出现我们的评论才算成功
+        install_confirmation(driver, input_text)
         submit_button.click()
         
-        print(f"已在帖子 {post_url} 中完成评论：{input_text}")
+        confirmation = wait_confirmation(driver, input_text)
+        record_outcome(confirmation)
+        if confirmation["status"] != "confirmed":
+            detail = confirmation.get("detail") or confirmation["reason"]
+            print(f"帖子 {post_url} 的评论未确认成功（{confirmation['reason']}）：{detail}")
+            with open('comment_log.txt', 'a', encoding='utf-8') as f:
+                f.write(f"{clock.ctime()}: Unconfirmed comment on {post_url} ({confirmation['reason']}): {detail}\n")
+            return False
+        
+        print(f"已在帖子 {post_url} 中完成评论：{input_text}（确认耗时 {confirmation['latency']:.1f} 秒）")
         with open('comment_log.txt', 'a', encoding='utf-8') as f:
-            f.write(f"{time.ctime()}: Commented on {post_url} with '{input_text}'\n")
+            f.write(f"{clock.ctime()}: Commented on {post_url} with '{input_text}'\n")
         return True
     except Exception as e:
         print(f"在帖子 {post_url} 上评论失败：{str(e)}")
-        traceback.print_exc()
+        record_failure(driver, "comment", e)
         return False
 
+def lottery_skip_reason(post_title, post_content):
+    """判断抽奖帖子是否应跳过，返回跳过原因；真的抽奖且未开奖时返回 None"""
+    # 使用 Gemini 判断是否真的是抽奖帖子
+    if not check_is_real_lottery(post_title, post_content):
+        return "不是真的抽奖帖子（如讨论年终奖等）"
+    # 使用 Gemini 判断是否已开奖
+    if check_lottery_ended(post_title, post_content):
+        return "已开奖"
+    return None
+
+def judge_triaged(triaged, commented_urls):
+    """
+    预取完成后立即判断真假和是否开奖，返回 {url: 跳过原因或 None}
+    评论之间要等待数分钟，预取的页面状态到时已经过时，评论时只重新读取已回复和评论开关
+    """
+    verdicts = {}
+    for url, post in triaged.items():
+        if url in commented_urls:
+            continue
+        if post["already_replied"] or not post["comments_open"]:
+            verdicts[url] = "已回复过或已关闭评论"
+            continue
+        if llm_circuit_open("classify"):
+            break
+        try:
+            start_post_deadline()
+            verdicts[url] = lottery_skip_reason(post["title"], post["content"])
+        except Exception as e:
+            print(f"判断预取的抽奖帖子 {url} 时出错：{str(e)}")
+        finally:
+            clear_post_deadline()
+    return verdicts
+
+def comment_lottery_posts(driver, lottery_urls, max_comments, commented_urls, wait_for_gap=True):
+    """
+    按顺序回复抽奖帖子：并行预取并判断真假和是否开奖，再逐个打开帖子确认仍可评论，生成回复并评论
+    每次评论前在共享评论记录中占位，距离上一次评论（包括其他进程的评论）不足间隔时等待；
+    wait_for_gap 为 False 时不等待，直接停止，未处理的帖子留给调用方稍后再试
+    新评论的帖子加入 commented_urls；返回 (最后使用的 driver, 评论数, 登录状态是否失效, 因间隔未处理的帖子)
+    """
+    comment_count = 0
+    deferred = []
+    verdicts = {}
+    # 多标签页并行加载候选帖子，评论仍在主标签页中逐个进行
+    if not llm_circuit_open("classify"):
+        verdicts = judge_triaged(triage_posts(driver, lottery_urls), commented_urls)
+    for index, lurl in enumerate(lottery_urls):
+        if comment_count >= max_comments:
+            print("达到每日评论上限，停止评论")
+            break
+        
+        # 定期探测登录状态，会话失效后不再继续
+        if not check_session_midrun(driver):
+            return driver, comment_count, True, deferred
+        
+        # 检查是否已回复过此帖子
+        if lurl in commented_urls:
+            print(f"帖子 {lurl} 已回复过，跳过")
+            continue
+        
+        # 大模型服务熔断期间不打开需要判断的抽奖帖子，避免白白加载页面
+        if llm_circuit_open("classify"):
+            print(f"大模型服务熔断中，跳过抽奖帖子 {lurl}")
+            continue
+        
+        holding = success = False
+        wait_time = 0
+        try:
+            print(f"\n正在处理抽奖帖子 ({comment_count + 1}/{max_comments})")
+            if verdicts.get(lurl):
+                print(f"帖子 {lurl} {verdicts[lurl]}，跳过")
+                continue
+            if wait_for_gap:
+                holding = wait_for_slot()
+                if not holding:
+                    print("今日评论配额已用完，停止评论")
+                    break
+            else:
+                gap = acquire_slot()
+                if gap is None:
+                    print("今日评论配额已用完，停止评论")
+                    break
+                if gap > 0:
+                    deferred = lottery_urls[index:]
+                    print(f"距离上一次评论不足间隔，{len(deferred)} 个帖子 {gap/60:.1f} 分钟后再处理")
+                    break
+                holding = True
+            # 评论前重新打开帖子，确认此刻仍未回复过且评论开放
+            with timer(PAGE_LOAD, page="post"):
+                driver.get(lurl)
+            clock.sleep(random.uniform(2, 4))
+            post = extract_post(driver)
+            snapshot(driver, "lottery_post", lurl)
+            if post["already_replied"] or not post["comments_open"]:
+                print(f"帖子 {lurl} 已回复过或已关闭评论，跳过")
+                continue
+            post_title, post_content = post["title"], post["content"]
+            start_post_deadline()
+            
+            # 预取失败的帖子在这里判断真假和是否开奖
+            if lurl not in verdicts:
+                reason = lottery_skip_reason(post_title, post_content)
+                if reason:
+                    print(f"帖子 {lurl} {reason}，跳过")
+                    continue
+            
+            # 使用抽奖模式生成回复
+            input_text = get_gemini_reply(post_title, post_content, is_lottery=True)
+            if input_text is None:
+                print(f"帖子 {lurl} 获取回复失败，跳过")
+                with open('comment_log.txt', 'a', encoding='utf-8') as f:
+                    f.write(f"{clock.ctime()}: Skipped lottery post {lurl} due to Gemini API failure\n")
+                continue
+            
+            success = post_comment_on_url(driver, lurl, input_text, post["editor_present"])
+            if success:
+                comment_count += 1
+                commented_urls.add(lurl)  # 记录已回复的URL
+                remember_reply(input_text, lurl)  # 记录回复内容，用于跨天去重
+                # 抽奖帖子评论后间隔 5-6 分钟，按学习到的节奏系数缩放，下一次评论前等待
+                wait_time = pacing_delay(300, 360)
+                print(f"下一次评论至少间隔 {wait_time/60:.1f} 分钟")
+            else:
+                # 已提交但未确认成功时同样间隔，避免立即再次提交
+                wait_time = failure_delay(300, 360)
+                if wait_time:
+                    print(f"{'提交被限流' if last_throttled() else '提交未确认成功'}，下一次评论至少间隔 {wait_time/60:.1f} 分钟")
+        
+        except Exception as e:
+            print(f"处理抽奖帖子 {lurl} 时出错：{str(e)}")
+            record_failure(driver, "lottery_post", e)
+            continue
+        finally:
+            # 跳过或出错的帖子同样清除大模型调用时限，避免带到下一个帖子
+            clear_post_deadline()
+            if holding:
+                release_slot(lurl if success else None, wait_time)
+            # 重置标签页并采样内存，超过上限时换用重启后的浏览器
+            driver = after_post(driver)
+    return driver, comment_count, False, deferred
+
 def nodeseek_comment(driver):
+    """
+    评论帖子，返回最后使用的 driver（内存超限重启后与传入的不同）
+    """
     try:
         print("正在访问交易区...")
-        target_url = 'https://www.nodeseek.com/'
-        driver.get(target_url)
         print("等待页面加载...")
-        
-        posts = WebDriverWait(driver, 30).until(
-            EC.presence_of_all_elements_located((By.CSS_SELECTOR, '.post-list-item'))
-        )
-        print(f"成功获取到 {len(posts)} 个帖子")
-        
-        valid_posts = [post for post in posts if not post.find_elements(By.CSS_SELECTOR, '.pined')]
+        # 列表只抓取一次，两个阶段都基于这份快照
+        listing = capture_listing(driver)
+        print(f"成功获取到 {len(listing)} 个帖子")
+        snapshot(driver, "listing", f"{len(listing)} 个帖子")
         
         # 第一步：识别抽奖帖子（标题包含"抽"或"奖"）
-        lottery_urls = set()  # 使用 set 避免重复
-        for post in valid_posts:
-            try:
-                post_link_el = post.find_element(By.CSS_SELECTOR, '.post-title a')
-                post_title_text = post_link_el.text.strip()
-                post_href = post_link_el.get_attribute('href')
-                # 检查标题是否包含"抽"或"奖"
-                if '抽' in post_title_text or '奖' in post_title_text:
-                    lottery_urls.add(post_href)
-                    print(f"发现抽奖帖子：{post_title_text}")
-            except Exception:
-                continue
+        lottery_urls = []
+        for post in listing:
+            if not post.pinned and post.is_lottery_candidate:
+                lottery_urls.append(post.href)
+                inc(LOTTERIES_FOUND)
+                print(f"发现抽奖帖子：{post.title}")
         
-        lottery_urls = list(lottery_urls)  # 转回列表
+        # 每次运行只批量生成一次回复库，作为 Gemini 失败时的兜底
+        prepare_reply_bank()
         
         comment_count = 0
-        MAX_DAILY_COMMENTS = random.randint(20, 25)
-        commented_urls = set()  # 跟踪已回复的帖子URL，避免重复
-        recent_replies = []  # 跟踪最近的回复内容，避免重复
+        # 每日配额和已回复的帖子与抽奖监听进程共享，两边的评论都计入
+        daily_limit, used = daily_quota()
+        MAX_DAILY_COMMENTS = daily_limit - used
+        # 模拟运行时记录到虚拟时间线，用于核对配额
+        clock.mark("quota", daily_limit)
+        commented_urls = recent_commented_urls()  # 跟踪已回复的帖子URL，避免重复
         
         # 第二步：优先回复抽奖帖子
+        session_lost = False
         if lottery_urls:
             print(f"\n发现 {len(lottery_urls)} 个抽奖帖子，优先回复")
-        for lurl in lottery_urls:
-            if comment_count >= MAX_DAILY_COMMENTS:
-                print("达到每日评论上限，停止评论")
-                break
-            
-            # 检查是否已回复过此帖子
-            if lurl in commented_urls:
-                print(f"帖子 {lurl} 已回复过，跳过")
-                continue
-            
-            try:
-                print(f"\n正在处理抽奖帖子 ({comment_count + 1}/{MAX_DAILY_COMMENTS})")
-                driver.get(lurl)
-                time.sleep(random.uniform(2, 4))
-                
-                post_title, post_content = extract_post_content(driver)
-                
-                # 使用 Gemini 判断是否真的是抽奖帖子
-                if not check_is_real_lottery(post_title, post_content):
-                    print(f"帖子 {lurl} 不是真的抽奖帖子（如讨论年终奖等），跳过")
-                    continue
-                
-                # 使用 Gemini 判断是否已开奖
-                if check_lottery_ended(post_title, post_content):
-                    print(f"帖子 {lurl} 已开奖，跳过")
-                    continue
-                
-                # 使用抽奖模式生成回复
-                input_text = get_gemini_reply(post_title, post_content, is_lottery=True, recent_replies=recent_replies)
-                if input_text is None:
-                    print(f"帖子 {lurl} 获取回复失败，跳过")
-                    with open('comment_log.txt', 'a', encoding='utf-8') as f:
-                        f.write(f"{time.ctime()}: Skipped lottery post {lurl} due to Gemini API failure\n")
-                    continue
-                
-                success = post_comment_on_url(driver, lurl, input_text)
-                if success:
-                    comment_count += 1
-                    commented_urls.add(lurl)  # 记录已回复的URL
-                    recent_replies.append(input_text)  # 记录回复内容
-                    if len(recent_replies) > 10:  # 只保留最近10个回复
-                        recent_replies.pop(0)
-                    # 抽奖帖子评论后等待 5-6 分钟
-                    wait_time = random.uniform(300, 360)
-                    print(f"等待 {wait_time/60:.1f} 分钟...")
-                    time.sleep(wait_time)
-                
-            except Exception as e:
-                print(f"处理抽奖帖子 {lurl} 时出错：{str(e)}")
-                continue
+            driver, comment_count, session_lost, _ = comment_lottery_posts(
+                driver, lottery_urls, MAX_DAILY_COMMENTS, commented_urls
+            )
         
         # 第三步：从剩余帖子中随机选择进行评论
         remaining_quota = MAX_DAILY_COMMENTS - comment_count
-        if remaining_quota > 0:
+        if remaining_quota > 0 and not session_lost:
             print(f"\n开始随机回复普通帖子，还需回复 {remaining_quota} 个")
             
-            # 重新访问首页获取帖子列表（因为之前的WebElement已失效）
-            driver.get(target_url)
-            time.sleep(3)
-            posts = WebDriverWait(driver, 30).until(
-                EC.presence_of_all_elements_located((By.CSS_SELECTOR, '.post-list-item'))
-            )
-            valid_posts_refresh = [post for post in posts if not post.find_elements(By.CSS_SELECTOR, '.pined')]
-            
-            # 筛选出未回复过的帖子（排除抽奖帖子和已回复的帖子）
-            remaining_urls = []
-            for post in valid_posts_refresh:
+            # 筛选出未回复过的帖子（排除置顶和已回复的帖子），直接使用列表快照
+            remaining_urls = [post.href for post in listing if not post.pinned and post.href not in commented_urls]
+            if len(remaining_urls) < remaining_quota:
+                # 候选不足时增量刷新列表，只合并新出现的帖子
                 try:
-                    post_link_el = post.find_element(By.CSS_SELECTOR, '.post-title a')
-                    post_href = post_link_el.get_attribute('href')
-                    # 排除已回复的帖子
-                    if post_href not in commented_urls:
-                        remaining_urls.append(post_href)
-                except Exception:
-                    continue
+                    listing, fresh = refresh_listing(driver, listing)
+                    print(f"刷新帖子列表，新增 {len(fresh)} 个帖子")
+                    remaining_urls += [post.href for post in fresh if not post.pinned and post.href not in commented_urls]
+                except Exception as e:
+                    print(f"刷新帖子列表出错：{str(e)}")
             
             # 随机选择需要评论的帖子
             if remaining_urls:
@@ -545,69 +689,127 @@ def nodeseek_comment(driver):
                     print("达到每日评论上限，停止评论")
                     break
                 
+                if not check_session_midrun(driver):
+                    break
+                
                 # 检查是否已回复过此帖子
                 if post_url in commented_urls:
                     print(f"帖子 {post_url} 已回复过，跳过")
                     continue
                 
+                # 大模型服务熔断且回复库为空时，打开帖子也无法回复
+                if llm_circuit_open("reply") and not reply_bank_size():
+                    print(f"大模型服务熔断中且回复库为空，跳过帖子 {post_url}")
+                    continue
+                
+                holding = success = False
+                wait_time = 0
                 try:
                     print(f"\n正在处理普通帖子 {i+1}/{len(selected_urls)} ({comment_count + 1}/{MAX_DAILY_COMMENTS})")
-                    driver.get(post_url)
+                    holding = wait_for_slot()
+                    if not holding:
+                        print("今日评论配额已用完，停止评论")
+                        break
+                    with timer(PAGE_LOAD, page="post"):
+                        driver.get(post_url)
                     
                     # 模拟浏览
                     driver.execute_script("window.scrollBy(0, 500);")
-                    time.sleep(random.uniform(2, 5))
+                    clock.sleep(random.uniform(2, 5))
                     
-                    # 提取帖子内容
-                    post_title, post_content = extract_post_content(driver)
+                    # 一次往返提取帖子信息
+                    post = extract_post(driver)
+                    snapshot(driver, "post", post_url)
+                    if post["already_replied"] or not post["comments_open"]:
+                        print(f"帖子 {post_url} 已回复过或已关闭评论，跳过")
+                        continue
+                    post_title, post_content = post["title"], post["content"]
                     
                     # 使用普通模式生成回复
-                    input_text = get_gemini_reply(post_title, post_content, is_lottery=False, recent_replies=recent_replies)
+                    start_post_deadline()
+                    input_text = get_gemini_reply(post_title, post_content, is_lottery=False)
                     if input_text is None:
                         print(f"帖子 {post_url} 获取回复失败，跳过评论")
                         with open('comment_log.txt', 'a', encoding='utf-8') as f:
-                            f.write(f"{time.ctime()}: Skipped comment on {post_url} due to Gemini API failure\n")
+                            f.write(f"{clock.ctime()}: Skipped comment on {post_url} due to Gemini API failure\n")
                         continue
                     
-                    success = post_comment_on_url(driver, post_url, input_text)
+                    success = post_comment_on_url(driver, post_url, input_text, post["editor_present"])
                     if success:
                         comment_count += 1
                         commented_urls.add(post_url)  # 记录已回复的URL
-                        recent_replies.append(input_text)  # 记录回复内容
-                        if len(recent_replies) > 10:  # 只保留最近10个回复
-                            recent_replies.pop(0)
-                        # 普通帖子评论后等待 10-15 分钟
-                        wait_time = random.uniform(600, 900)
-                        print(f"等待 {wait_time/60:.1f} 分钟...")
-                        time.sleep(wait_time)
+                        remember_reply(input_text, post_url)  # 记录回复内容，用于跨天去重
+                        # 普通帖子评论后间隔 10-15 分钟，按学习到的节奏系数缩放，下一次评论前等待
+                        wait_time = pacing_delay(600, 900)
+                        print(f"下一次评论至少间隔 {wait_time/60:.1f} 分钟")
+                    else:
+                        wait_time = failure_delay(600, 900)
+                        if wait_time:
+                            print(f"{'提交被限流' if last_throttled() else '提交未确认成功'}，下一次评论至少间隔 {wait_time/60:.1f} 分钟")
                     
                 except Exception as e:
                     print(f"处理帖子 {post_url} 时出错：{str(e)}")
+                    record_failure(driver, "post", e)
                     continue
+                finally:
+                    clear_post_deadline()
+                    if holding:
+                        release_slot(post_url if success else None, wait_time)
+                    driver = after_post(driver)
         
         print(f"\nNodeSeek 评论任务完成，共评论 {comment_count} 个帖子")
+        print(rule_stats_summary())
+        print(classifier_stats_summary())
+        print(provider_stats_summary())
+        print(compact_stats_summary())
+        print(usage_summary())
+        print(policy_stats_summary())
+        print(memory_stats_summary())
+        print(capture_stats_summary())
+        print(triage_stats_summary())
+        print(diagnostics_summary())
+        print(confirm_stats_summary())
+        print(pacing_summary())
                 
     except Exception as e:
         print(f"NodeSeek 评论出错：{str(e)}")
-        traceback.print_exc()
+        record_failure(driver, "comment_task", e)
+    # 内存超限时浏览器可能已经重启，返回当前使用的实例
+    return driver
 
 if __name__ == "__main__":
     print("=== 开始执行 NodeSeek 评论脚本 ===")
-    print(f"时间戳: {time.time()}")
-    
-    print("\n步骤 1: 初始化浏览器和设置 Cookie...")
-    driver = setup_driver_and_cookies()
-    if not driver:
-        print("浏览器初始化失败")
-        exit(1)
-    print(f"浏览器初始化成功，时间戳: {time.time()}")
+    print(f"时间戳: {clock.now()}")
     
-    print("\n步骤 2: 执行评论任务...")
-    nodeseek_comment(driver)
-    print(f"评论任务完成，时间戳: {time.time()}")
-    
-    print("\n步骤 3: 执行签到任务...")
-    click_sign_icon(driver)
-    print(f"签到任务完成，时间戳: {time.time()}")
+    # 会话失效、浏览器启动失败或异常退出时同样写入运行指标
+    try:
+        print("\n步骤 0: 探测登录状态...")
+        # 启动浏览器前确认 Cookie 有效，过期时直接退出
+        session_status, session_reason = probe_session(cookie)
+        print(f"登录状态：{session_status}（{session_reason}）")
+        if session_status == EXPIRED:
+            print("✗ Cookie 已失效，请更新 NS_COOKIE 后重试")
+            exit(2)
+        
+        print("\n步骤 1: 初始化浏览器和设置 Cookie...")
+        # 守护进程模式下接入预热实例；冷启动时退出（包括异常和 SIGTERM）保证关闭浏览器并清理进程树
+        with warm_or_cold_driver(setup_driver_and_cookies) as driver:
+            if not driver:
+                print("浏览器初始化失败")
+                exit(1)
+            print(f"浏览器初始化成功，时间戳: {clock.now()}")
+            
+            print("\n步骤 2: 执行评论任务...")
+            driver = nodeseek_comment(driver)
+            print(f"评论任务完成，时间戳: {clock.now()}")
+            
+            print("\n步骤 3: 执行签到任务...")
+            click_sign_icon(driver)
+            print(f"签到任务完成，时间戳: {clock.now()}")
+    finally:
+        # 浏览器关闭后进程树 RSS 统计已完整，写入 node_exporter textfile
+        set_gauge(BROWSER_RSS, BROWSER_STATS["peak_rss"], kind="peak")
+        set_gauge(BROWSER_RSS, BROWSER_STATS["last_rss"], kind="last")
+        write_textfile()
     
     print("\n=== 脚本执行完成 ===")
@@ -15,11 +15,11 @@ import traceback
 import undetected_chromedriver as uc
 from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.common.action_chains import ActionChains
-
-try:
-    from webdriver_manager.chrome import ChromeDriverManager
-except ImportError:
-    ChromeDriverManager = None
+from llm_providers import generate_text, llm_available
+from browser_manager import managed_driver, child_pids, kill_spawned_since, teardown_driver
+from browser_memory import apply_browser_profile
+from post_extract import extract_post
+from browser_resolver import resolve, describe
 
 # 环境变量
 ns_random = os.environ.get("NS_RANDOM", "false").lower() == "true"
@@ -35,8 +35,8 @@ print(f"NS_RANDOM: {ns_random}")
 def get_gemini_reply(post_title, post_content):
     """调用 Gemini API 根据帖子内容生成自然回复"""
     try:
-        if not GEMINI_API_KEY:
-            print("未找到 Gemini API 密钥，跳过回复")
+        if not llm_available("reply"):
+            print("未找到可用的大模型服务（如 Gemini API 密钥），跳过回复")
             return None
         
         prompt = f"""
@@ -47,15 +47,7 @@ def get_gemini_reply(post_title, post_content):
         - "思路很清晰"
         """
         
-        url = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent"
-        headers = {"Content-Type": "application/json"}
-        data = {"contents": [{"parts": [{"text": prompt}]}]}
-        
-        response = requests.post(f"{url}?key={GEMINI_API_KEY}", headers=headers, json=data, timeout=10)
-        response.raise_for_status()
-        
-        result = response.json()
-        reply = result.get("candidates", [{}])[0].get("content", {}).get("parts", [{}])[0].get("text", "")
+        reply = generate_text("reply", prompt)
         reply = reply.strip().replace("\n", " ").replace('"', "").replace(""", "").replace(""", "")
         
         if len(reply) < 4 or len(reply) > 25:
@@ -71,21 +63,8 @@ def get_gemini_reply(post_title, post_content):
 
 def extract_post_content(driver):
     """提取帖子标题和正文内容"""
-    try:
-        title_element = WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((By.CSS_SELECTOR, '.post-title'))
-        )
-        post_title = title_element.text.strip()
-        
-        content_element = WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((By.CSS_SELECTOR, '.post-content'))
-        )
-        post_content = content_element.text.strip()[:500]
-        
-        return post_title, post_content
-    except Exception as e:
-        print(f"提取帖子内容出错：{str(e)}")
-        return "未知标题", "未知内容"
+    post = extract_post(driver)
+    return post["title"], post["content"][:500]
 
 def click_sign_icon(driver):
     """尝试点击签到图标和试试手气按钮"""
@@ -123,6 +102,7 @@ def click_sign_icon(driver):
 
 def setup_driver_and_cookies():
     """初始化浏览器并设置 Cookie - 增强版本"""
+    driver = None
     try:
         if not cookie:
             print("未找到 Cookie 配置")
@@ -130,15 +110,13 @@ def setup_driver_and_cookies():
             
         print("开始初始化浏览器...")
         
-        # 尝试使用 WebDriver Manager
-        driver_path = None
-        if ChromeDriverManager:
-            try:
-                print("正在获取匹配的 ChromeDriver...")
-                driver_path = ChromeDriverManager().install()
-                print(f"ChromeDriver 路径: {driver_path}")
-            except Exception as e:
-                print(f"WebDriver Manager 获取驱动失败，使用 undetected-chromedriver 自动检测: {str(e)}")
+        # 使用缓存的浏览器清单，本地没有匹配的驱动时才通过 WebDriver Manager 下载
+        manifest = resolve(allow_download=True)
+        print(f"检测到 {describe(manifest)}")
+        driver_path = manifest.get("driver_path") if manifest else None
+        if driver_path and manifest.get("driver_major") != manifest["browser_major"]:
+            print("ChromeDriver 版本不匹配，使用 undetected-chromedriver 自动检测")
+            driver_path = None
         
         options = uc.ChromeOptions()
         options.add_argument('--no-sandbox')
@@ -150,11 +128,12 @@ def setup_driver_and_cookies():
             options.add_argument('--disable-gpu')
             options.add_argument('--window-size=1920,1080')
             options.add_argument('--user-agent=Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/144.0.0.0 Safari/537.36')
+        apply_browser_profile(options)
         
-        driver = None
         max_retries = 3
         
         for attempt in range(max_retries):
+            spawned_before = child_pids()
             try:
                 print(f"尝试初始化浏览器 (尝试 {attempt + 1}/{max_retries})...")
                 
@@ -168,6 +147,7 @@ def setup_driver_and_cookies():
                 
             except Exception as e:
                 print(f"初始化尝试 {attempt + 1} 失败：{str(e)}")
+                kill_spawned_since(spawned_before)
                 if attempt < max_retries - 1:
                     time.sleep(2)
                 else:
@@ -205,6 +185,8 @@ def setup_driver_and_cookies():
     except Exception as e:
         print(f"设置浏览器和 Cookie 时出错：{str(e)}")
         traceback.print_exc()
+        if driver:
+            teardown_driver(driver)
         return None
 
 def nodeseek_comment(driver):
@@ -294,10 +276,10 @@ def nodeseek_comment(driver):
 
 if __name__ == "__main__":
     print("开始执行 NodeSeek 评论脚本...")
-    driver = setup_driver_and_cookies()
-    if not driver:
-        print("浏览器初始化失败")
-        exit(1)
-    nodeseek_comment(driver)
-    click_sign_icon(driver)
+    with managed_driver(setup_driver_and_cookies) as driver:
+        if not driver:
+            print("浏览器初始化失败")
+            exit(1)
+        nodeseek_comment(driver)
+        click_sign_icon(driver)
     print("脚本执行完成")
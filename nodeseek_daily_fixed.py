@@ -16,6 +16,10 @@ import traceback
 import undetected_chromedriver as uc
 from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.common.action_chains import ActionChains
+from llm_providers import generate_text, llm_available
+from browser_manager import managed_driver, child_pids, kill_spawned_since, teardown_driver
+from browser_memory import apply_browser_profile
+from post_extract import extract_post
 
 # 环境变量
 ns_random = os.environ.get("NS_RANDOM", "false").lower() == "true"
@@ -32,8 +36,8 @@ print(f"NS_RANDOM: {ns_random}")
 def get_gemini_reply(post_title, post_content):
     """调用 Gemini API 根据帖子内容生成自然回复"""
     try:
-        if not GEMINI_API_KEY:
-            print("未找到 Gemini API 密钥，跳过回复")
+        if not llm_available("reply"):
+            print("未找到可用的大模型服务（如 Gemini API 密钥），跳过回复")
             return None
         
         prompt = f"""
@@ -44,15 +48,7 @@ def get_gemini_reply(post_title, post_content):
         - "思路很清晰"
         """
         
-        url = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent"
-        headers = {"Content-Type": "application/json"}
-        data = {"contents": [{"parts": [{"text": prompt}]}]}
-        
-        response = requests.post(f"{url}?key={GEMINI_API_KEY}", headers=headers, json=data, timeout=10)
-        response.raise_for_status()
-        
-        result = response.json()
-        reply = result.get("candidates", [{}])[0].get("content", {}).get("parts", [{}])[0].get("text", "")
+        reply = generate_text("reply", prompt)
         reply = reply.strip().replace("\n", " ").replace('"', "").replace(""", "").replace(""", "")
         
         if len(reply) < 4 or len(reply) > 25:
@@ -68,21 +64,8 @@ def get_gemini_reply(post_title, post_content):
 
 def extract_post_content(driver):
     """提取帖子标题和正文内容"""
-    try:
-        title_element = WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((By.CSS_SELECTOR, '.post-title'))
-        )
-        post_title = title_element.text.strip()
-        
-        content_element = WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((By.CSS_SELECTOR, '.post-content'))
-        )
-        post_content = content_element.text.strip()[:500]
-        
-        return post_title, post_content
-    except Exception as e:
-        print(f"提取帖子内容出错：{str(e)}")
-        return "未知标题", "未知内容"
+    post = extract_post(driver)
+    return post["title"], post["content"][:500]
 
 def click_sign_icon(driver):
     """尝试点击签到图标和试试手气按钮"""
@@ -120,6 +103,7 @@ def click_sign_icon(driver):
 
 def setup_driver_and_cookies():
     """初始化浏览器并设置 Cookie"""
+    driver = None
     try:
         if not cookie:
             print("未找到 Cookie 配置")
@@ -136,10 +120,11 @@ def setup_driver_and_cookies():
             options.add_argument('--disable-gpu')
             options.add_argument('--window-size=1920,1080')
             options.add_argument('--user-agent=Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/144.0.0.0 Safari/537.36')
+        apply_browser_profile(options)
         
-        driver = None
         max_retries = 3
         for attempt in range(max_retries):
+            spawned_before = child_pids()
             try:
                 print(f"尝试初始化浏览器 (尝试 {attempt + 1}/{max_retries})...")
                 driver = uc.Chrome(options=options, version_main=None)
@@ -147,6 +132,7 @@ def setup_driver_and_cookies():
                 break
             except Exception as e:
                 print(f"初始化尝试 {attempt + 1} 失败：{str(e)}")
+                kill_spawned_since(spawned_before)
                 if attempt < max_retries - 1:
                     time.sleep(2)
                 else:
@@ -184,6 +170,8 @@ def setup_driver_and_cookies():
     except Exception as e:
         print(f"设置浏览器和 Cookie 时出错：{str(e)}")
         traceback.print_exc()
+        if driver:
+            teardown_driver(driver)
         return None
 
 def nodeseek_comment(driver):
@@ -273,10 +261,10 @@ def nodeseek_comment(driver):
 
 if __name__ == "__main__":
     print("开始执行 NodeSeek 评论脚本...")
-    driver = setup_driver_and_cookies()
-    if not driver:
-        print("浏览器初始化失败")
-        exit(1)
-    nodeseek_comment(driver)
-    click_sign_icon(driver)
+    with managed_driver(setup_driver_and_cookies) as driver:
+        if not driver:
+            print("浏览器初始化失败")
+            exit(1)
+        nodeseek_comment(driver)
+        click_sign_icon(driver)
     print("脚本执行完成")
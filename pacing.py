@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+根据论坛反馈自适应调整评论间隔
+评论间隔为原有的随机区间乘以按账号学习的系数，系数按 AIMD 方式调整：
+- 评论确认成功且提交耗时正常时，系数减小一个固定步长（加快节奏）
+- 出现 429/403、“太快”类提示或验证码时，系数成倍增大（放慢节奏）
+- 提交耗时偏高或超时未确认时保持不变
+系数限制在配置的上下限之间（下限默认 1，不会比原有区间更快），并持久化到文件，跨运行保留；
+提交后未确认成功的尝试同样按间隔等待，结果未知的提交可能已经发出
+"""
+import hashlib
+import json
+import os
+import random
+
+import clock
+
+PACING_STATE = os.environ.get("NS_PACING_STATE", "pacing_state.json")
+MIN_FACTOR = float(os.environ.get("NS_PACING_MIN_FACTOR", "1"))
+MAX_FACTOR = float(os.environ.get("NS_PACING_MAX_FACTOR", "4"))
+DECREASE_STEP = float(os.environ.get("NS_PACING_STEP", "0.05"))
+BACKOFF = float(os.environ.get("NS_PACING_BACKOFF", "2"))
+# 提交确认耗时超过该值视为服务端变慢，不再加快节奏
+SLOW_LATENCY = float(os.environ.get("NS_PACING_SLOW_LATENCY", "5"))
+
+# 视为被限流的确认失败原因
+THROTTLE_REASONS = ("too_fast", "rate_limited", "forbidden", "captcha")
+
+PACING_STATS = {"faster": 0, "slower": 0, "held": 0}
+
+_state = None
+_last_throttled = False
+_last_submitted = False
+
+
+def _account():
+    """按用户名或 Cookie 摘要区分账号，不在文件中保存 Cookie 本身"""
+    name = os.environ.get("NS_USERNAME")
+    if name:
+        return name
+    cookie = os.environ.get("NS_COOKIE") or os.environ.get("COOKIE") or ""
+    return hashlib.sha1(cookie.encode('utf-8')).hexdigest()[:12]
+
+
+def _load():
+    global _state
+    if _state is None:
+        _state = {}
+        if os.path.exists(PACING_STATE):
+            try:
+                with open(PACING_STATE, encoding='utf-8') as f:
+                    _state = json.load(f)
+            except Exception as e:
+                print(f"读取节奏状态出错：{str(e)}")
+    return _state.setdefault(_account(), {"factor": 1.0, "successes": 0, "throttles": 0, "updated": None})
+
+
+def _save():
+    try:
+        with open(PACING_STATE, 'w', encoding='utf-8') as f:
+            json.dump(_state, f, ensure_ascii=False, indent=2)
+    except OSError as e:
+        print(f"保存节奏状态出错：{str(e)}")
+
+
+def current_factor():
+    return _load()["factor"]
+
+
+def start_attempt():
+    """每次尝试评论前调用，清除上一次提交的结果，提交前就失败的尝试不会沿用旧结果"""
+    global _last_throttled, _last_submitted
+    _last_throttled = False
+    _last_submitted = False
+
+
+def record_outcome(confirmation):
+    """根据一次评论提交的确认结果调整系数"""
+    global _last_throttled, _last_submitted
+    _last_submitted = True
+    account = _load()
+    old = account["factor"]
+    status, reason = confirmation.get("status"), confirmation.get("reason")
+    _last_throttled = reason in THROTTLE_REASONS
+    if _last_throttled:
+        account["factor"] = min(MAX_FACTOR, old * BACKOFF)
+        account["throttles"] += 1
+        PACING_STATS["slower"] += 1
+        print(f"检测到限流信号（{reason}），评论间隔系数 {old:.2f} -> {account['factor']:.2f}")
+    elif status == "confirmed" and (confirmation.get("latency") or 0) <= SLOW_LATENCY:
+        account["factor"] = max(MIN_FACTOR, old - DECREASE_STEP)
+        account["successes"] += 1
+        PACING_STATS["faster"] += 1
+    else:
+        PACING_STATS["held"] += 1
+    account["updated"] = clock.now()
+    _save()
+
+
+def pacing_delay(low, high):
+    """在原有随机区间的基础上乘以学习到的系数，返回等待秒数"""
+    return random.uniform(low, high) * current_factor()
+
+
+def failure_delay(low, high):
+    """
+    本次尝试已提交但未确认成功时返回需要等待的秒数，提交前就失败时返回 0
+    超时或出错的提交结果未知，至少按原有间隔等待；被限流时系数已经增大，等待随之变长
+    """
+    return pacing_delay(low, high) if _last_submitted else 0
+
+
+def last_throttled():
+    """本次尝试的提交是否被限流"""
+    return _last_throttled
+
+
+def pacing_summary():
+    """返回本次运行的节奏调整统计"""
+    return (
+        f"评论节奏：当前间隔系数 {current_factor():.2f}，加快 {PACING_STATS['faster']} 次，"
+        f"放慢 {PACING_STATS['slower']} 次，保持 {PACING_STATS['held']} 次"
+    )
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+帖子页结构化提取
+注入一段脚本，在页面内等待标题和正文就绪后一次性返回帖子信息，
+替代分别等待 .post-title、.post-content、.CodeMirror 的多次 WebDriver 往返。
+编辑器晚于正文渲染时继续等待，直到出现编辑器或评论关闭标记，避免把开放的帖子误判为已关闭。
+页面加载时捕获到帖子接口的 JSON 数据时，帖子字段优先使用接口数据。
+"""
+import os
+import re
+
+from network_capture import CAPTURE_STATS, current_user, latest, post_fields
+
+# 自己的用户名，用于判断是否已经回复过；未设置时根据页头的个人空间链接判断
+USERNAME = os.environ.get("NS_USERNAME", "")
+MAX_CONTENT_LEN = 5000
+
+EXTRACT_SCRIPT = """
+var timeoutMs = arguments[0], username = arguments[1], maxLen = arguments[2];
+var done = arguments[arguments.length - 1];
+var start = Date.now();
+
+function text(el) { return el ? (el.innerText || el.textContent || '').trim() : ''; }
+function spaceId(a) {
+    var m = a && (a.getAttribute('href') || '').match(/\\/space\\/(\\d+)/);
+    return m ? m[1] : null;
+}
+
+function collect(final) {
+    var title = document.querySelector('.post-title');
+    var content = document.querySelector('.post-content');
+    if (document.readyState === 'loading' || !title || !content) {
+        return null;
+    }
+    var items = Array.prototype.slice.call(document.querySelectorAll('.content-item'));
+    var first = items.length ? items[0] : document;
+    var author = first.querySelector('.author-name');
+    var time = first.querySelector('time');
+    var me = spaceId(document.querySelector('header a[href*="/space/"]'));
+    var replied = items.slice(1).some(function (item) {
+        var a = item.querySelector('.author-name');
+        if (username && text(a) === username) return true;
+        return me !== null && spaceId(a && a.closest('a')) === me;
+    });
+    var editor = !!document.querySelector('.CodeMirror');
+    var locked = !!document.querySelector('.post-locked, .locked, .comment-closed');
+    // 编辑器可能比正文晚渲染，没有编辑器也没有关闭标记时继续等待
+    if (!editor && !locked && !final) {
+        return null;
+    }
+    return {
+        ready: true,
+        title: text(title),
+        content: text(content).slice(0, maxLen),
+        author: text(author),
+        post_time: time ? (time.getAttribute('datetime') || text(time)) : '',
+        reply_count: Math.max(items.length - 1, 0),
+        // 超时仍未出现编辑器时只凭关闭标记判断，编辑器是否可用由 editor_present 反映
+        comments_open: !locked,
+        editor_present: editor,
+        already_replied: replied
+    };
+}
+
+(function poll() {
+    var record = null;
+    try { record = collect(); } catch (e) { record = null; }
+    if (record) { done(record); return; }
+    if (Date.now() - start > timeoutMs) {
+        try { record = collect(true); } catch (e) { record = null; }
+        done(record || {ready: false});
+        return;
+    }
+    setTimeout(poll, 100);
+})();
+"""
+
+EMPTY_RECORD = {
+    "ready": False,
+    "title": "未知标题",
+    "content": "未知内容",
+    "author": "",
+    "post_time": "",
+    "reply_count": 0,
+    "comments_open": True,
+    "editor_present": False,
+    "already_replied": False,
+}
+
+
+def extract_post(driver, timeout=10):
+    """
+    一次往返提取当前帖子页的结构化信息，返回字典：
+    title / content / author / post_time / reply_count / comments_open / editor_present / already_replied / ready
+    页面未在 timeout 秒内就绪或脚本出错时返回 ready=False 的默认记录
+    """
+    username = USERNAME
+    if not username:
+        user = current_user(latest(driver, "user") or {})
+        username = user[1] if user else ""
+    try:
+        record = driver.execute_async_script(EXTRACT_SCRIPT, int(timeout * 1000), username, MAX_CONTENT_LEN)
+    except Exception as e:
+        print(f"提取帖子信息出错：{str(e)}")
+        return dict(EMPTY_RECORD)
+    if not record or not record.get("ready"):
+        print("等待帖子页面就绪超时")
+        return dict(EMPTY_RECORD)
+    record = {**EMPTY_RECORD, **record}
+
+    # 编辑器、评论状态等页面状态以 DOM 为准，帖子字段优先使用接口数据
+    match = re.search(r'/post-(\d+)', driver.current_url)
+    fields = post_fields(latest(driver, "post", post_id=match.group(1)) or {}) if match else {}
+    if fields:
+        CAPTURE_STATS["hits"] += 1
+        fields["content"] = fields["content"][:MAX_CONTENT_LEN]
+        record.update(fields)
+    else:
+        CAPTURE_STATS["misses"] += 1
+    return record
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+帖子列表快照
+列表页只抓取一次，转换为不可变的帖子摘要记录，抽奖和普通帖子两个阶段以及之后的排序、
+筛选都基于这些记录进行，不再因为 WebElement 失效而重新加载首页。
+需要新帖子时通过 refresh_listing 显式增量刷新，只合并新出现的帖子 ID。
+页面加载时捕获到列表接口的 JSON 数据时直接使用，否则从 DOM 抓取。
+不启动浏览器的轮询可用 listing_from_html / listing_from_json 解析 HTTP 响应。
+"""
+import re
+from dataclasses import dataclass
+from urllib.parse import urljoin
+
+from bs4 import BeautifulSoup
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
+
+import clock
+from network_capture import CAPTURE_STATS, latest, listing_entries
+from metrics import PAGE_LOAD, POSTS_SCANNED, inc, timer
+
+LISTING_URL = 'https://www.nodeseek.com/'
+
+LISTING_SCRIPT = """
+return Array.prototype.map.call(document.querySelectorAll('.post-list-item'), function (item) {
+    var link = item.querySelector('.post-title a');
+    var count = item.querySelector('.info-comments-count, [class*="comments-count"]');
+    var time = item.querySelector('time');
+    return {
+        href: link ? link.href : '',
+        title: link ? (link.innerText || link.textContent || '').trim() : '',
+        pinned: !!item.querySelector('.pined'),
+        reply_count: count ? parseInt((count.innerText || count.textContent || '').replace(/\\D/g, ''), 10) || 0 : 0,
+        timestamp: time ? (time.getAttribute('datetime') || '') : ''
+    };
+});
+"""
+
+_POST_ID = re.compile(r'/post-(\d+)')
+
+
+@dataclass(frozen=True, slots=True)
+class PostSummary:
+    """列表页上一个帖子的摘要"""
+    post_id: int
+    href: str
+    title: str
+    pinned: bool
+    reply_count: int
+    timestamp: str
+    captured_at: float
+
+    @property
+    def is_lottery_candidate(self):
+        """标题包含“抽”或“奖”的帖子"""
+        return '抽' in self.title or '奖' in self.title
+
+
+def _to_summaries(raw, captured_at):
+    summaries, seen = [], set()
+    for entry in raw or []:
+        match = _POST_ID.search(entry.get("href") or "")
+        if not match or int(match.group(1)) in seen:
+            continue
+        seen.add(int(match.group(1)))
+        summaries.append(PostSummary(
+            post_id=int(match.group(1)),
+            href=entry["href"],
+            title=entry.get("title", ""),
+            pinned=bool(entry.get("pinned")),
+            reply_count=int(entry.get("reply_count") or 0),
+            timestamp=entry.get("timestamp", ""),
+            captured_at=captured_at,
+        ))
+    return summaries
+
+
+def capture_listing(driver, url=LISTING_URL, timeout=30):
+    """打开列表页，等待帖子出现后一次性抓取全部帖子摘要，返回 PostSummary 元组"""
+    started = clock.now()
+    with timer(PAGE_LOAD, page="listing"):
+        driver.get(url)
+        WebDriverWait(driver, timeout).until(
+            EC.presence_of_element_located((By.CSS_SELECTOR, '.post-list-item'))
+        )
+    entries = listing_entries(latest(driver, "listing", since=started) or {})
+    if entries:
+        CAPTURE_STATS["hits"] += 1
+    else:
+        CAPTURE_STATS["misses"] += 1
+        entries = driver.execute_script(LISTING_SCRIPT)
+    summaries = tuple(_to_summaries(entries, clock.now()))
+    inc(POSTS_SCANNED, len(summaries))
+    return summaries
+
+
+def refresh_listing(driver, known, url=LISTING_URL):
+    """
+    重新抓取列表页，只合并 known 中没有的帖子 ID
+    返回 (合并后的元组, 新增的元组)
+    """
+    seen = {post.post_id for post in known}
+    fresh = tuple(post for post in capture_listing(driver, url) if post.post_id not in seen)
+    return tuple(known) + fresh, fresh
+
+
+def listing_from_html(html, base_url=LISTING_URL):
+    """按 LISTING_SCRIPT 相同的选择器解析列表页 HTML，返回 PostSummary 元组"""
+    entries = []
+    for item in BeautifulSoup(html, 'html.parser').select('.post-list-item'):
+        link = item.select_one('.post-title a')
+        count = item.select_one('.info-comments-count, [class*="comments-count"]')
+        time_tag = item.select_one('time')
+        entries.append({
+            "href": urljoin(base_url, link.get('href', '')) if link else '',
+            "title": link.get_text(strip=True) if link else '',
+            "pinned": item.select_one('.pined') is not None,
+            "reply_count": int(re.sub(r'\D', '', count.get_text()) or 0) if count else 0,
+            "timestamp": time_tag.get('datetime', '') if time_tag else '',
+        })
+    return tuple(_to_summaries(entries, clock.now()))
+
+
+def listing_from_json(data):
+    """解析列表接口的 JSON 数据，返回 PostSummary 元组"""
+    return tuple(_to_summaries(listing_entries(data), clock.now()))
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+多标签页并行预取候选帖子
+同时在有限数量的后台标签页中加载候选帖子，哪个先加载完就先提取，
+结果交给后续的 Gemini 判断；只有评论步骤仍在主标签页中按人工节奏进行。
+评论之间要等待数分钟，调用方应在预取后立即完成判断，评论时只重新读取已回复、评论开关等页面状态。
+"""
+import os
+
+import clock
+from post_extract import extract_post
+from metrics import PAGE_LOAD, observe
+
+TRIAGE_TABS = int(os.environ.get("NS_TRIAGE_TABS", "4"))
+TRIAGE_TIMEOUT = float(os.environ.get("NS_TRIAGE_TIMEOUT", "30"))
+POLL_INTERVAL = 0.2
+
+TRIAGE_STATS = {"fetched": 0, "failed": 0, "seconds": 0.0}
+
+
+def _open_tab(driver, url):
+    """新开标签页并发起导航，不等待加载完成"""
+    driver.switch_to.new_window('tab')
+    driver.execute_script("window.location.href = arguments[0];", url)
+    return driver.current_window_handle
+
+
+def _loaded(driver):
+    state, href = driver.execute_script("return [document.readyState, location.href];")
+    return state == 'complete' and href != 'about:blank'
+
+
+def triage_posts(driver, urls, max_tabs=None, timeout=None):
+    """
+    并行加载 urls 并提取帖子信息，返回 {url: extract_post 记录}
+    加载超时或提取失败的帖子不在结果中，由调用方按原方式串行处理
+    max_tabs 小于 2 时不预取
+    """
+    max_tabs = TRIAGE_TABS if max_tabs is None else max_tabs
+    timeout = TRIAGE_TIMEOUT if timeout is None else timeout
+    results = {}
+    if not urls or max_tabs < 2:
+        return results
+
+    start = clock.now()
+    main_handle = driver.current_window_handle
+    pending = list(urls)
+    tabs = {}  # 标签页句柄 -> (url, 开始加载时间)
+    try:
+        while pending or tabs:
+            while pending and len(tabs) < max_tabs:
+                url = pending.pop(0)
+                tabs[_open_tab(driver, url)] = (url, clock.now())
+            for handle, (url, started) in list(tabs.items()):
+                driver.switch_to.window(handle)
+                try:
+                    loaded = _loaded(driver)
+                except Exception:
+                    loaded = False
+                if not loaded and clock.now() - started < timeout:
+                    continue
+                if loaded:
+                    observe(PAGE_LOAD, clock.now() - started, page="post")
+                record = extract_post(driver, timeout=2) if loaded else None
+                if record and record["ready"]:
+                    results[url] = record
+                    TRIAGE_STATS["fetched"] += 1
+                else:
+                    print(f"预取帖子 {url} 超时或提取失败")
+                    TRIAGE_STATS["failed"] += 1
+                driver.close()
+                del tabs[handle]
+            clock.sleep(POLL_INTERVAL)
+    except Exception as e:
+        print(f"并行预取帖子出错：{str(e)}")
+    finally:
+        for handle in tabs:
+            try:
+                driver.switch_to.window(handle)
+                driver.close()
+            except Exception:
+                pass
+        driver.switch_to.window(main_handle)
+    elapsed = clock.now() - start
+    TRIAGE_STATS["seconds"] += elapsed
+    print(f"并行预取 {len(urls)} 个帖子（{max_tabs} 个标签页），成功 {len(results)} 个，用时 {elapsed:.1f} 秒")
+    return results
+
+
+def triage_stats_summary():
+    """返回并行预取的统计"""
+    return (
+        f"并行预取：成功 {TRIAGE_STATS['fetched']} 个，失败 {TRIAGE_STATS['failed']} 个，"
+        f"用时 {TRIAGE_STATS['seconds']:.1f} 秒"
+    )
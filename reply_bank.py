@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+每日预生成的分类回复库
+每次运行只用一次批量 Gemini 请求生成各类帖子（技术、交易、求助、分享、抽奖）的通用回复，
+Gemini 失败时作为零延迟的兜底，通用帖子也可直接从回复库取用，减少逐帖 API 调用
+"""
+import json
+import os
+import random
+import re
+
+import clock
+from llm_providers import generate_text, llm_available
+from reply_history import find_similar_reply
+
+BANK_PATH = os.environ.get("NS_REPLY_BANK", "reply_bank.json")
+# 每个分类生成的回复数量
+BANK_SIZE_PER_CATEGORY = int(os.environ.get("NS_REPLY_BANK_SIZE", "15"))
+# 正文短于该长度的普通帖子视为通用帖子，直接使用回复库
+GENERIC_CONTENT_LEN = int(os.environ.get("NS_REPLY_BANK_GENERIC_LEN", "60"))
+
+# 分类及其关键词，按命中数选择分类
+CATEGORIES = {
+    "lottery": ("抽奖", "抽", "奖", "送", "福利", "赠送", "免费", "开奖", "白嫖"),
+    "trade": ("出", "收", "出售", "求购", "价格", "元", "刀", "续费", "转让", "包月", "年付", "月付", "¥", "$"),
+    "help": ("求助", "请教", "问", "怎么", "如何", "为什么", "报错", "失败", "无法", "解决", "？", "?"),
+    "tech": ("教程", "脚本", "docker", "linux", "代码", "部署", "配置", "测速", "vps", "服务器", "github", "api"),
+    "share": ("分享", "推荐", "发现", "记录", "体验", "日常", "晒"),
+}
+DEFAULT_CATEGORY = "share"
+
+CATEGORY_NAMES = {
+    "tech": "技术/教程",
+    "trade": "出售/交易",
+    "help": "求助/提问",
+    "share": "分享/日常",
+    "lottery": "抽奖/送福利",
+}
+
+MIN_REPLY_LEN = 4
+MAX_REPLY_LEN = 20
+
+_bank = None
+
+
+def classify_post(post_title, post_content):
+    """根据关键词命中数为帖子选择分类，标题权重更高"""
+    title = (post_title or "").lower()
+    content = (post_content or "")[:500].lower()
+    best, best_score = DEFAULT_CATEGORY, 0
+    for category, keywords in CATEGORIES.items():
+        score = sum(2 * title.count(k) + content.count(k) for k in keywords)
+        if score > best_score:
+            best, best_score = category, score
+    return best
+
+
+def is_generic_post(post_content):
+    """正文过短的帖子没有足够信息生成针对性回复"""
+    return len((post_content or "").strip()) < GENERIC_CONTENT_LEN
+
+
+def _clean(reply):
+    return str(reply).strip().replace("\n", " ").strip('"\'“”‘’「」')
+
+
+def _parse_bank(text):
+    """解析 Gemini 返回的 JSON，兼容 ```json 代码块包裹"""
+    match = re.search(r'\{.*\}', text, re.S)
+    if not match:
+        return None
+    data = json.loads(match.group(0))
+    bank = {}
+    for category in CATEGORIES:
+        replies = [_clean(r) for r in data.get(category, [])]
+        bank[category] = [r for r in replies if MIN_REPLY_LEN <= len(r) <= MAX_REPLY_LEN]
+    return bank
+
+
+def _request_bank():
+    """一次批量请求生成所有分类的回复"""
+    category_lines = "\n".join(f'- "{key}"：{name}帖子' for key, name in CATEGORY_NAMES.items())
+    prompt = f"""
+你是论坛老用户，需要为不同类型的帖子准备一些通用回复。
+
+分类：
+{category_lines}
+
+规则：
+1. 每个分类生成 {BANK_SIZE_PER_CATEGORY} 条回复，互不重复
+2. 每条 4-15 个字，自然流畅，像正常人类交流
+3. 回复要通用，不依赖具体帖子内容也说得通
+4. 避免AI痕迹词汇，不要单字回复
+
+只输出 JSON 对象，键为分类英文名，值为回复字符串数组，不要其他内容。
+"""
+    return _parse_bank(generate_text("batch", prompt, timeout=30))
+
+
+def prepare_reply_bank():
+    """
+    准备当天的回复库：优先复用当天已生成的文件，否则发起一次批量请求
+    返回回复总数
+    """
+    global _bank
+    today = clock.today()
+    if os.path.exists(BANK_PATH):
+        try:
+            with open(BANK_PATH, encoding='utf-8') as f:
+                saved = json.load(f)
+            if saved.get("date") == today:
+                _bank = saved["bank"]
+        except Exception as e:
+            print(f"加载回复库出错：{str(e)}")
+    if _bank is None and llm_available("batch"):
+        try:
+            _bank = _request_bank()
+            if _bank:
+                with open(BANK_PATH, 'w', encoding='utf-8') as f:
+                    json.dump({"date": today, "bank": _bank}, f, ensure_ascii=False)
+        except Exception as e:
+            print(f"生成回复库出错：{str(e)}")
+    if not _bank:
+        _bank = {}
+    total = sum(len(v) for v in _bank.values())
+    print(f"回复库已就绪，共 {total} 条回复")
+    return total
+
+
+def reply_bank_size():
+    """回复库中的回复总数"""
+    return sum(len(v) for v in (_bank or {}).values())
+
+
+def pick_bank_reply(post_title, post_content, category=None):
+    """
+    按帖子分类从回复库中挑选一条未与历史回复重复的回复，没有可用回复时返回 None
+    """
+    if not _bank:
+        return None
+    category = category or classify_post(post_title, post_content)
+    candidates = list(_bank.get(category, []))
+    random.shuffle(candidates)
+    for reply in candidates:
+        if not find_similar_reply(reply):
+            return reply
+    return None
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+跨天持久化的回复历史与近似重复检测
+对回复做字符 shingle 的 MinHash，并用 LSH 分桶索引，查询时只比对同桶候选，
+数千条历史回复下也无需逐条比较
+"""
+import json
+import os
+import random
+import re
+import zlib
+
+import clock
+
+HISTORY_PATH = os.environ.get("NS_REPLY_HISTORY", "reply_history.jsonl")
+# 字符 shingle 的 Jaccard 相似度达到该值即视为重复，如“感谢楼主”与“感谢楼主分享”为 0.6
+SIMILARITY_THRESHOLD = float(os.environ.get("NS_REPLY_SIMILARITY", "0.5"))
+# 历史回复保留天数
+HISTORY_DAYS = float(os.environ.get("NS_REPLY_HISTORY_DAYS", "30"))
+
+SHINGLE_SIZE = 2
+# MinHash 签名长度 = 分桶数 × 每桶行数；每桶 2 行时相似度 0.5 的回复约 99% 概率进入同一桶
+LSH_BANDS = 16
+LSH_ROWS = 2
+NUM_PERM = LSH_BANDS * LSH_ROWS
+
+_PRIME = (1 << 61) - 1
+_rng = random.Random(20240101)
+_HASH_PARAMS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+
+# 去掉标点和空白后再比较
+_NORMALIZE_RE = re.compile(r'[\s\W_]+', re.UNICODE)
+
+_history = None
+
+
+def _normalize(text):
+    return _NORMALIZE_RE.sub("", text or "").lower()
+
+
+def _shingles(text):
+    text = _normalize(text)
+    if len(text) <= SHINGLE_SIZE:
+        return {text} if text else set()
+    return {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+
+def _minhash(shingles):
+    hashes = [zlib.crc32(s.encode('utf-8')) for s in shingles]
+    return [min((a * h + b) % _PRIME for h in hashes) for a, b in _HASH_PARAMS]
+
+
+def _band_keys(signature):
+    return [(band, tuple(signature[band * LSH_ROWS:(band + 1) * LSH_ROWS])) for band in range(LSH_BANDS)]
+
+
+def _jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def _index(history, entry):
+    shingles = _shingles(entry["reply"])
+    if not shingles:
+        return
+    idx = len(history["entries"])
+    history["entries"].append(entry)
+    history["shingles"].append(shingles)
+    for key in _band_keys(_minhash(shingles)):
+        history["buckets"].setdefault(key, []).append(idx)
+
+
+def _load():
+    """加载历史回复并重建索引，超出保留窗口的记录会从文件中清理"""
+    global _history
+    if _history is not None:
+        return _history
+    _history = {"entries": [], "shingles": [], "buckets": {}}
+    if not os.path.exists(HISTORY_PATH):
+        return _history
+    cutoff = clock.now() - HISTORY_DAYS * 86400
+    expired = 0
+    try:
+        with open(HISTORY_PATH, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if entry.get("time", 0) >= cutoff:
+                    _index(_history, entry)
+                else:
+                    expired += 1
+    except Exception as e:
+        print(f"加载回复历史出错：{str(e)}")
+        return _history
+    if expired:
+        try:
+            with open(HISTORY_PATH, 'w', encoding='utf-8') as f:
+                for entry in _history["entries"]:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        except Exception as e:
+            print(f"清理回复历史出错：{str(e)}")
+    return _history
+
+
+def find_similar_reply(reply):
+    """
+    在历史回复中查找与 reply 近似重复的内容
+    返回 (历史回复, 相似度)，没有近似重复时返回 None
+    """
+    history = _load()
+    shingles = _shingles(reply)
+    if not shingles:
+        return None
+    candidates = set()
+    for key in _band_keys(_minhash(shingles)):
+        candidates.update(history["buckets"].get(key, ()))
+    best = None
+    for idx in candidates:
+        score = _jaccard(shingles, history["shingles"][idx])
+        if score >= SIMILARITY_THRESHOLD and (best is None or score > best[1]):
+            best = (history["entries"][idx]["reply"], score)
+    return best
+
+
+def remember_reply(reply, post_url=None):
+    """记录一条已发布的回复并追加到历史文件"""
+    history = _load()
+    entry = {"reply": reply, "url": post_url, "time": clock.now()}
+    _index(history, entry)
+    try:
+        with open(HISTORY_PATH, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    except Exception as e:
+        print(f"保存回复历史出错：{str(e)}")
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+登录状态快速探测
+启动浏览器前用一次轻量 HTTP 请求确认 Cookie 仍然有效，Cookie 过期时直接退出，
+不再启动 Chrome 后在 30 秒的等待超时上耗费几分钟；运行过程中也定期探测，及时发现会话失效。
+请求优先使用 curl_cffi 模拟浏览器指纹，未安装时使用 requests。
+"""
+import json
+import os
+import re
+
+import clock
+from network_capture import current_user
+
+PROBE_URL = os.environ.get("NS_SESSION_PROBE_URL", "https://www.nodeseek.com/api/notification/unread-count")
+# 探测地址返回 HTML 时，用于判断已登录的正则
+LOGGED_IN_MARKER = re.compile(os.environ.get("NS_SESSION_MARKER", r'href="/space/\d+"'))
+# 未登录页面的标记（登录入口）；两种标记都没有时无法判断
+LOGGED_OUT_MARKER = re.compile(os.environ.get("NS_SESSION_LOGGED_OUT_MARKER", r'href="/signIn\.html'))
+# success 为 false 时，提示或状态码表明未登录的才算失效，限流、服务端错误等仍按无法判断处理
+AUTH_FAILURE_MARKER = re.compile(
+    os.environ.get("NS_SESSION_AUTH_FAILURE", r'登录|登陆|未授权|认证|会话|login|sign.?in|auth|session|unauthori[sz]ed|token'),
+    re.I,
+)
+AUTH_FAILURE_STATUS = (401, 403)
+# 自己的用户名，接口返回的用户信息与之一致时才算已登录
+USERNAME = os.environ.get("NS_USERNAME", "")
+PROBE_INTERVAL = float(os.environ.get("NS_SESSION_PROBE_INTERVAL", "600"))
+PROBE_TIMEOUT = 10
+
+# 探测结果
+VALID, EXPIRED, UNKNOWN = "valid", "expired", "unknown"
+
+_last_probe = 0.0
+
+
+def fetch(url, cookie_header, extra_headers=None):
+    """带 Cookie 的 GET 请求，extra_headers 可附加条件请求头等"""
+    headers = {
+        "Cookie": cookie_header,
+        "Accept": "application/json, text/html;q=0.9",
+        "Referer": "https://www.nodeseek.com/",
+        **(extra_headers or {}),
+    }
+    try:
+        from curl_cffi import requests as cffi_requests
+        return cffi_requests.get(url, headers=headers, timeout=PROBE_TIMEOUT, impersonate="chrome")
+    except ImportError:
+        import requests
+        headers["User-Agent"] = (
+            "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 "
+            "(KHTML, like Gecko) Chrome/144.0.0.0 Safari/537.36"
+        )
+        return requests.get(url, headers=headers, timeout=PROBE_TIMEOUT)
+
+
+def probe_session(cookie_header, url=None):
+    """
+    返回 (状态, 说明)，状态为 valid / expired / unknown
+    网络错误或被防护页面拦截时返回 unknown，由调用方继续按原流程运行
+    """
+    global _last_probe
+    _last_probe = clock.now()
+    if not cookie_header:
+        return EXPIRED, "未配置 Cookie"
+    try:
+        response = fetch(url or PROBE_URL, cookie_header)
+    except Exception as e:
+        return UNKNOWN, f"请求失败：{str(e)}"
+    if response.status_code in (401, 403) and "cf-" not in response.text[:2000].lower():
+        return EXPIRED, f"HTTP {response.status_code}"
+    if response.status_code != 200:
+        return UNKNOWN, f"HTTP {response.status_code}"
+    if "json" in response.headers.get("Content-Type", ""):
+        try:
+            data = json.loads(response.text)
+        except ValueError:
+            return UNKNOWN, "返回内容不是有效的 JSON"
+        if not isinstance(data, dict):
+            return UNKNOWN, "接口返回的不是对象"
+        if data.get("success") is False:
+            message = str(data.get("message") or data.get("msg") or "")
+            status = data.get("status") or data.get("code")
+            if status in AUTH_FAILURE_STATUS or AUTH_FAILURE_MARKER.search(message):
+                return EXPIRED, message or "接口返回未登录"
+            return UNKNOWN, f"接口返回失败：{message or status or '无说明'}"
+        if data.get("success") is True:
+            return VALID, "接口返回已登录"
+        # 通知等接口中可能包含其他用户的信息，只有与自己的用户名一致时才算已登录
+        user = current_user(data)
+        if user and USERNAME and user[1] == USERNAME:
+            return VALID, f"接口返回当前用户 {user[1]}"
+        return UNKNOWN, "接口返回中没有登录信息"
+    if LOGGED_IN_MARKER.search(response.text):
+        return VALID, "页面包含登录标记"
+    if "just a moment" in response.text[:2000].lower():
+        return UNKNOWN, "被防护页面拦截"
+    if LOGGED_OUT_MARKER.search(response.text):
+        return EXPIRED, "页面显示未登录"
+    return UNKNOWN, "页面没有登录标记"
+
+
+def cookie_header_from_driver(driver):
+    """用浏览器当前的 Cookie 生成请求头，运行中浏览器可能刷新过 Cookie"""
+    return "; ".join(f"{c['name']}={c['value']}" for c in driver.get_cookies())
+
+
+def session_check_due():
+    """距离上次探测是否已超过探测间隔"""
+    return PROBE_INTERVAL > 0 and clock.now() - _last_probe >= PROBE_INTERVAL
+
+
+def check_session_midrun(driver):
+    """
+    运行中按间隔探测会话，确定已失效时返回 False，其余情况返回 True
+    """
+    if not session_check_due():
+        return True
+    try:
+        cookie_header = cookie_header_from_driver(driver)
+    except Exception as e:
+        print(f"读取浏览器 Cookie 出错：{str(e)}")
+        return True
+    status, reason = probe_session(cookie_header)
+    if status == EXPIRED:
+        print(f"✗ 登录状态已失效（{reason}），停止评论")
+        return False
+    print(f"登录状态探测：{status}（{reason}）")
+    return True
@@ -0,0 +1,540 @@
+# -*- coding: utf-8 -*-
+"""
+虚拟时钟下的全天模拟运行
+安装 VirtualClock 后所有等待立即返回并推进虚拟时间，用进程内的替身论坛代替浏览器、
+用假的大模型服务代替真实接口，完整执行一次评论和签到流程，几秒钟内跑完一整天（最多 25 条评论）。
+运行结束后输出虚拟时间线、配额和大模型用量，并检查调度约束，任一检查失败时退出码为 1。
+
+状态文件（节奏系数、回复历史、token 用量、评论日志等）全部写入独立的工作目录，不影响真实运行。
+
+用法：
+    python simulate.py                        # 默认 60 个帖子，其中 10 个抽奖候选
+    python simulate.py --seed 7 --verbose     # 指定随机种子，输出完整运行日志
+    python simulate.py --server-min-gap 400   # 替身论坛拒绝间隔小于 400 秒的评论，检验限流退避
+"""
+import argparse
+import contextlib
+import http.server
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+
+import clock
+
+SIM_USERNAME = "sim_user"
+LISTING_URL = "https://www.nodeseek.com/"
+
+# (分类, 标题, 正文)，正文短于回复库阈值的帖子会直接使用回复库
+NORMAL_POSTS = (
+    ("tech", "分享一个 Docker 一键部署脚本", "整理了一个一键部署 docker 的脚本，支持 debian 和 ubuntu，配置好环境变量后直接运行即可，欢迎测试反馈问题。"),
+    ("tech", "Linux 内核参数调优记录", "记录一下最近给小内存 VPS 调整 sysctl 的过程，包括 swap、tcp 缓冲区和文件句柄数量，附上测速前后的对比数据。"),
+    ("tech", "GitHub Actions 定时任务踩坑", "定时任务的 cron 是 UTC 时间，而且高峰期会延迟十几分钟执行，依赖准点运行的脚本需要自己做好补偿。"),
+    ("trade", "出一台香港 VPS 年付", "配置 2C2G，年付 30 刀，续费同价，可以 push，有意私聊。"),
+    ("trade", "收一个 .com 四字母域名", "预算 200 元以内，要求无历史违规记录，可以走中介交易，有的朋友直接回帖报价。"),
+    ("trade", "转让日本 NAT 小鸡", "月付 5 元，剩余 8 个月，线路还可以，晚高峰 YouTube 4K 没问题，价格可以小刀。"),
+    ("help", "求助：SSH 连接一直超时", "新买的服务器 ssh 一直连接超时，防火墙已经放行 22 端口，安全组也检查过了，请问还有什么可能的原因？"),
+    ("help", "请教 nginx 反代 websocket 的配置", "按网上的教程加了 upgrade 头，但是连接还是一分钟左右就断开，是不是还需要调整超时时间？"),
+    ("help", "为什么我的 VPS 晚上这么卡", "白天延迟 50ms，晚上就到 300ms 还丢包，换了几个节点都一样，是线路问题还是被限速了？"),
+    ("share", "今天的日常", "天气不错，出门走走"),
+    ("share", "推荐一个好用的笔记软件", "用了大半年，支持本地存储和多端同步，插件也很丰富，写技术笔记体验很好，分享给大家。"),
+    ("share", "记录第一次自建邮局", "折腾了一个周末，总算把收发信和反垃圾都配置好了，顺手记录一下遇到的问题，希望对大家有帮助。"),
+    ("share", "晒一下新到的机器", "开箱了"),
+)
+
+# (标题, 正文, 是否真的抽奖, 是否已开奖)
+LOTTERY_POSTS = (
+    ("抽奖送 3 个月 VPS", "回复本帖参与抽奖，周五晚上开奖，送出 3 台 1C1G 的 VPS，每台 3 个月，感谢大家一直以来的支持。", True, False),
+    ("周年福利抽奖，送域名", "论坛周年，随机抽 5 位朋友送 .xyz 域名一年，回复“祝 NodeSeek 越来越好”参与，周日开奖。", True, False),
+    ("小抽奖一下，送流量包", "送出 10 个 100G 流量包，楼层抽奖，明天中午开奖，每人限回复一次。", True, False),
+    ("【已开奖】抽奖送闲置硬盘", "已开奖，恭喜 12 楼和 35 楼，请私信我地址，感谢大家参与。", True, True),
+    ("抽奖活动结束，感谢参与", "活动已截止，中奖名单见楼下，没中的朋友下次再来。", True, True),
+    ("今年年终奖发了多少", "大家今年年终奖都发了多少？我们公司今年直接取消了，有点难受。", False, False),
+    ("奖金和期权怎么选", "新公司给了两个方案，一个年终奖高一些，一个期权多一些，各位会怎么选？", False, False),
+)
+
+# 假的大模型服务按分类返回的回复
+FAKE_REPLIES = {
+    "tech": ("学到了，感谢分享", "这个脚本收藏了", "回头试试这个配置", "教程写得很清楚", "正好用得上", "马克一下慢慢看"),
+    "trade": ("价格挺合适的", "配置还可以", "帮顶一下", "续费价格怎么样", "线路怎么样呢", "祝早日出掉"),
+    "help": ("我之前也遇到过", "检查下防火墙规则", "可以换个端口试试", "看看系统日志", "同问，蹲一个答案", "重启一下服务试试"),
+    "share": ("挺好的，支持一下", "有意思的分享", "看起来不错", "日常打卡", "感谢分享经验", "这个确实好用"),
+    "lottery": ("参与一下，试试运气", "感谢楼主的福利", "分母来了", "支持一下活动", "重在参与", "谢谢楼主，参与"),
+}
+
+
+class SimForum:
+    """进程内的替身论坛：生成帖子列表，接收评论并按配置的最小间隔拒绝过快的提交"""
+
+    def __init__(self, rng, posts=60, lotteries=10, min_gap=0):
+        self.rng = rng
+        self.min_gap = min_gap
+        self.posts = {}
+        self.comments = []  # (虚拟时间, 帖子 ID, 内容, 是否未开奖的真实抽奖)
+        self.rejected = []
+        self.signed_in = False
+        self.last_accepted = None
+        next_id = 400000
+        for i in range(posts):
+            next_id += rng.randint(1, 9)
+            if i < lotteries:
+                title, content, real, ended = LOTTERY_POSTS[i % len(LOTTERY_POSTS)]
+                category = "lottery"
+            else:
+                category, title, content = NORMAL_POSTS[i % len(NORMAL_POSTS)]
+                real = ended = False
+            round_no = i // (len(LOTTERY_POSTS) if i < lotteries else len(NORMAL_POSTS))
+            self.posts[next_id] = {
+                "id": next_id,
+                "title": f"{title}（第 {round_no + 1} 期）" if round_no else title,
+                "content": content,
+                "category": category,
+                "lottery": real,
+                "ended": ended,
+                "pinned": i in (lotteries, lotteries + 1),
+                "locked": rng.random() < 0.05,
+                "replies": [(f"user{rng.randint(1, 999)}", "前排") for _ in range(rng.randint(0, 6))],
+            }
+        ids = list(self.posts)
+        rng.shuffle(ids)
+        self.order = ids
+
+    def url(self, post_id):
+        return f"https://www.nodeseek.com/post-{post_id}-1"
+
+    def post_for(self, url):
+        match = re.search(r'/post-(\d+)', url or "")
+        return self.posts.get(int(match.group(1))) if match else None
+
+    def post_by_title(self, title):
+        for post in self.posts.values():
+            if post["title"] == title:
+                return post
+        return None
+
+    def listing(self):
+        return [
+            {
+                "href": self.url(post_id),
+                "title": self.posts[post_id]["title"],
+                "pinned": self.posts[post_id]["pinned"],
+                "reply_count": len(self.posts[post_id]["replies"]),
+                "timestamp": "",
+            }
+            for post_id in self.order
+        ]
+
+    def submit(self, post, text):
+        """返回 (状态, 错误提示, HTTP 状态码)"""
+        now = clock.now()
+        if self.min_gap and self.last_accepted is not None and now - self.last_accepted < self.min_gap:
+            self.rejected.append((now, post["id"], text))
+            clock.mark("rejected", f"post-{post['id']} 评论太快")
+            return "error", "评论太快，请稍后再试", 429
+        self.last_accepted = now
+        post["replies"].append((SIM_USERNAME, text))
+        open_lottery = post["lottery"] and not post["ended"]
+        self.comments.append((now, post["id"], text, open_lottery))
+        clock.mark("comment", f"post-{post['id']} {'抽奖' if open_lottery else '普通'}：{text}")
+        return "confirmed", "", 200
+
+
+class SimElement:
+    def __init__(self, driver, locator):
+        self.driver = driver
+        self.locator = locator
+
+    def click(self):
+        self.driver._click(self.locator)
+
+    def is_displayed(self):
+        return True
+
+    def is_enabled(self):
+        return True
+
+
+class _SwitchTo:
+    def __init__(self, driver):
+        self.driver = driver
+
+    def new_window(self, kind='tab'):
+        self.driver._open_handle()
+
+    def window(self, handle):
+        self.driver.current_window_handle = handle
+
+
+class SimDriver:
+    """
+    实现评论流程用到的 WebDriver 接口，页面脚本按脚本常量分派到替身论坛
+    页面加载、评论确认和打字都按随机耗时推进虚拟时钟
+    """
+
+    def __init__(self, forum, rng):
+        import comment_confirm
+        import diagnostics
+        import post_extract
+        import post_listing
+
+        self.forum = forum
+        self.rng = rng
+        self.scripts = {
+            post_listing.LISTING_SCRIPT: self._listing,
+            comment_confirm.INSTALL_SCRIPT: self._install_confirmation,
+            comment_confirm.PRESENT_SCRIPT: self._comment_present,
+            diagnostics.DOM_SCRIPT: lambda *args: f"<html><!-- {self.current_url} --></html>",
+            "return [document.readyState, location.href];": lambda: ['complete', self.current_url],
+            "window.location.href = arguments[0];": self._navigate_tab,
+        }
+        self.async_scripts = {
+            post_extract.EXTRACT_SCRIPT: self._extract,
+            comment_confirm.WAIT_SCRIPT: self._wait_confirmation,
+        }
+        self.switch_to = _SwitchTo(self)
+        self._tabs = {}
+        self._handles = 0
+        self.current_window_handle = None
+        self._open_handle()
+        self._typed = ""
+        self._confirmation = None
+
+    # 标签页
+    def _open_handle(self):
+        self._handles += 1
+        handle = f"tab-{self._handles}"
+        self._tabs[handle] = "about:blank"
+        self.current_window_handle = handle
+
+    @property
+    def window_handles(self):
+        return list(self._tabs)
+
+    @property
+    def current_url(self):
+        return self._tabs[self.current_window_handle]
+
+    def close(self):
+        del self._tabs[self.current_window_handle]
+
+    def quit(self):
+        self._tabs.clear()
+
+    # 导航
+    def get(self, url):
+        self._tabs[self.current_window_handle] = url
+        self._typed = ""
+        if url != "about:blank":
+            clock.current().advance(self.rng.uniform(0.5, 2.5))
+        if url == LISTING_URL:
+            clock.mark("listing", f"{len(self.forum.posts)} 个帖子")
+
+    def refresh(self):
+        self.get(self.current_url)
+
+    def _navigate_tab(self, url):
+        # 后台标签页并行加载，不单独占用虚拟时间
+        self._tabs[self.current_window_handle] = url
+
+    # 浏览器杂项
+    def set_window_size(self, width, height):
+        pass
+
+    def set_script_timeout(self, seconds):
+        pass
+
+    def add_cookie(self, cookie):
+        pass
+
+    def get_cookies(self):
+        return [{"name": "session", "value": "sim"}]
+
+    def get_log(self, kind):
+        return []
+
+    def execute_cdp_cmd(self, command, params):
+        return {"metrics": []} if command == "Performance.getMetrics" else {}
+
+    # 脚本
+    def execute_script(self, script, *args):
+        handler = self.scripts.get(script)
+        return handler(*args) if handler else None
+
+    def execute_async_script(self, script, *args):
+        handler = self.async_scripts.get(script)
+        return handler(*args) if handler else None
+
+    def _listing(self):
+        return self.forum.listing()
+
+    def _extract(self, timeout_ms, username, max_len):
+        post = self.forum.post_for(self.current_url)
+        if post is None:
+            return {"ready": False}
+        return {
+            "ready": True,
+            "title": post["title"],
+            "content": post["content"][:max_len],
+            "author": "楼主",
+            "post_time": "",
+            "reply_count": len(post["replies"]),
+            "comments_open": not post["locked"],
+            "editor_present": True,
+            "already_replied": any(author == SIM_USERNAME for author, _ in post["replies"]),
+        }
+
+    def _install_confirmation(self, expected, error_source, endpoint):
+        self._confirmation = {"expected": expected, "status": None}
+        post = self.forum.post_for(self.current_url)
+        return 1 + len(post["replies"]) if post else 0
+
+    def _wait_confirmation(self, timeout_ms):
+        state = self._confirmation
+        if not state or not state["status"]:
+            return {"status": "timeout", "detail": "", "http_status": None, "latency": timeout_ms}
+        return {key: state[key] for key in ("status", "detail", "http_status", "latency")}
+
+    def _comment_present(self, expected, before_count):
+        post = self.forum.post_for(self.current_url)
+        return bool(post) and any(text == expected for _, text in post["replies"][max(before_count - 1, 0):])
+
+    # 元素与输入
+    def find_element(self, by, value):
+        return SimElement(self, value)
+
+    def execute(self, command, params=None):
+        """ActionChains.perform 发送的 W3C actions：取出按键内容，按各输入源的暂停时长推进虚拟时间"""
+        if command == "actions":
+            longest = 0
+            for source in (params or {}).get("actions", []):
+                paused = 0
+                for action in source.get("actions", []):
+                    if action.get("type") == "pause":
+                        paused += action.get("duration") or 0
+                    elif source.get("type") == "key" and action.get("type") == "keyDown":
+                        self._typed += action.get("value", "")
+                longest = max(longest, paused)
+            clock.current().advance(longest / 1000)
+        return {"value": None}
+
+    def _click(self, locator):
+        if "发布评论" in locator:
+            post = self.forum.post_for(self.current_url)
+            latency = self.rng.uniform(0.3, 1.5)
+            clock.current().advance(latency)
+            status, detail, http_status = self.forum.submit(post, self._typed) if post else ("error", "帖子不存在", 404)
+            if self._confirmation is not None:
+                self._confirmation.update(
+                    status=status, detail=detail, http_status=http_status, latency=int(latency * 1000)
+                )
+            self._typed = ""
+        elif "试试手气" in locator or "鸡腿" in locator:
+            self.forum.signed_in = True
+            clock.mark("sign_in", "签到完成")
+
+
+def make_fake_provider(forum, rng):
+    """按替身论坛的真实标注回答分类问题的假大模型服务，回复优先从帖子分类的语料中选取未用过的"""
+    from llm_providers import LLMProvider
+    from reply_bank import BANK_SIZE_PER_CATEGORY
+
+    class FakeProvider(LLMProvider):
+        name = "sim"
+        default_model = "sim"
+
+        def __init__(self):
+            super().__init__()
+            self.used = set()
+
+        def available(self):
+            return True
+
+        def generate(self, prompt, model, timeout, profile):
+            clock.current().advance(rng.uniform(0.3, 1.5))
+            match = re.search(r'标题：(.*)', prompt)
+            post = forum.post_by_title(match.group(1).strip()) if match else None
+            if "是否已经开奖" in prompt:
+                text = "是" if post and post["ended"] else "否"
+            elif "是否真的是抽奖" in prompt:
+                text = "是" if post and post["lottery"] else "否"
+            elif "通用回复" in prompt:
+                text = json.dumps(
+                    {category: list(replies[:BANK_SIZE_PER_CATEGORY]) for category, replies in FAKE_REPLIES.items()},
+                    ensure_ascii=False,
+                )
+            else:
+                own = FAKE_REPLIES[post["category"] if post else "share"]
+                others = [reply for replies in FAKE_REPLIES.values() for reply in replies]
+                text = next((reply for reply in (*own, *others) if reply not in self.used), own[0])
+                self.used.add(text)
+            return text, len(prompt) // 2, max(1, len(text) // 2), 0
+
+    return FakeProvider()
+
+
+class _ProbeHandler(http.server.BaseHTTPRequestHandler):
+    """替身论坛的会话探测接口，始终返回已登录"""
+
+    def do_GET(self):
+        data = b'{"success": true, "unreadCount": 0}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def _prepare_environment(workdir):
+    """在导入评论脚本前把状态文件和外部依赖都指向模拟环境"""
+    os.chdir(workdir)
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _ProbeHandler)
+    threading.Thread(target=server.serve_forever, daemon=True, name="sim-forum").start()
+    for name in ("GEMINI_API_KEY", "NS_OPENAI_BASE_URL", "NS_LOCAL_LLM_URL", "NS_METRICS_TEXTFILE",
+                 "NS_LLM_CLASSIFY_PROVIDER", "NS_LLM_REPLY_PROVIDER", "NS_LLM_BATCH_PROVIDER"):
+        os.environ.pop(name, None)
+    os.environ.update({
+        "NS_COOKIE": "session=sim",
+        "NS_USERNAME": SIM_USERNAME,
+        "NS_LLM_PROVIDER": "sim",
+        "NS_NETWORK_CAPTURE": "false",
+        "NS_SESSION_PROBE_URL": f"http://127.0.0.1:{server.server_address[1]}/api/notification/unread-count",
+        "NS_PACING_STATE": "pacing_state.json",
+        "NS_COMMENT_LEDGER": "comment_ledger.json",
+        "NS_REPLY_HISTORY": "reply_history.jsonl",
+        "NS_REPLY_BANK": "reply_bank.json",
+        "NS_TOKEN_USAGE": "token_usage.json",
+        "NS_VERDICT_LOG": "lottery_verdicts.jsonl",
+        "NS_CLASSIFIER_MODEL": "lottery_classifier.json",
+        "NS_DIAG_DIR": "diagnostics",
+    })
+    return server
+
+
+def _format_offset(seconds):
+    seconds = int(seconds)
+    return f"+{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+def _checks(forum, min_gap):
+    """调度约束检查，返回 [(说明, 是否通过)]"""
+    commented = [post_id for _, post_id, _, _ in forum.comments]
+    kinds = [open_lottery for _, _, _, open_lottery in forum.comments]
+    gaps = [b[0] - a[0] for a, b in zip(forum.comments, forum.comments[1:])]
+    missed = [
+        post for post in forum.posts.values()
+        if post["lottery"] and not post["ended"] and not post["locked"] and post["id"] not in commented
+    ]
+    return [
+        ("没有重复评论同一帖子", len(commented) == len(set(commented))),
+        ("评论数不超过每日上限 25 条", len(commented) <= 25),
+        ("未开奖的抽奖帖子先于其他帖子评论", kinds == sorted(kinds, reverse=True)),
+        (f"相邻评论间隔不小于 {min_gap:.0f} 秒", not gaps or min(gaps) >= min_gap),
+        ("未开奖且可评论的抽奖帖子全部参与", not missed),
+        ("没有评论置顶或已关闭评论的帖子", not any(
+            forum.posts[post_id]["pinned"] or forum.posts[post_id]["locked"] for post_id in commented
+        )),
+        ("完成签到", forum.signed_in),
+    ]
+
+
+def simulate(seed=1, posts=60, lotteries=10, min_gap=0, workdir=None, verbose=False):
+    """执行一次模拟运行，返回报告字典"""
+    workdir = workdir or tempfile.mkdtemp(prefix="nodeseek_sim_")
+    os.makedirs(workdir, exist_ok=True)
+    server = _prepare_environment(workdir)
+    virtual_clock = clock.VirtualClock(start=time.mktime(time.strptime("2026-01-01 00:00:00", "%Y-%m-%d %H:%M:%S")))
+    previous = clock.install(virtual_clock)
+    rng = random.Random(seed)
+    random.seed(seed)
+    started = time.perf_counter()
+    log_path = os.path.join(workdir, "run.log")
+    try:
+        with open(log_path, 'w', encoding='utf-8') as log, \
+                contextlib.redirect_stdout(sys.stdout if verbose else log):
+            # 延迟导入，确保评论脚本读取的是模拟环境的配置
+            import llm_providers
+            import nodeseek_daily
+            from pacing import current_factor
+            from token_budget import RUN_USAGE
+
+            forum = SimForum(rng, posts=posts, lotteries=lotteries, min_gap=min_gap)
+            provider = make_fake_provider(forum, rng)
+            llm_providers.PROVIDERS[provider.name] = provider
+            llm_providers.PROVIDER_STATS[provider.name] = {
+                "calls": 0, "requests": 0, "errors": 0, "latency": 0.0, "input_tokens": 0, "output_tokens": 0, "cost": 0.0
+            }
+            driver = SimDriver(forum, rng)
+            driver = nodeseek_daily.nodeseek_comment(driver)
+            nodeseek_daily.click_sign_icon(driver)
+    finally:
+        clock.install(previous)
+        server.shutdown()
+
+    elapsed = virtual_clock.now - virtual_clock.start
+    quota = next((detail for _, event, detail in virtual_clock.timeline if event == "quota"), None)
+    # 抽奖帖子评论的原有间隔下限，节奏系数不应让间隔低于它
+    checks = _checks(forum, 300)
+    report = {
+        "seed": seed,
+        "workdir": workdir,
+        "virtual_seconds": round(elapsed, 1),
+        "waited_seconds": round(virtual_clock.slept, 1),
+        "wall_seconds": round(time.perf_counter() - started, 2),
+        "quota": quota,
+        "comments": len(forum.comments),
+        "lottery_comments": sum(1 for c in forum.comments if c[3]),
+        "rejected": len(forum.rejected),
+        "pacing_factor": round(current_factor(), 3),
+        "llm_usage": RUN_USAGE,
+        "timeline": [
+            {"offset": round(offset, 1), "event": event, "detail": detail}
+            for offset, event, detail in virtual_clock.timeline
+        ],
+        "checks": {name: ok for name, ok in checks},
+    }
+    with open(os.path.join(workdir, "simulation_report.json"), 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    return report
+
+
+def print_report(report):
+    print("=== 模拟运行结果 ===")
+    print(f"工作目录: {report['workdir']}")
+    print(
+        f"虚拟时长 {report['virtual_seconds'] / 3600:.2f} 小时（其中等待 {report['waited_seconds'] / 3600:.2f} 小时），"
+        f"实际用时 {report['wall_seconds']:.2f} 秒"
+    )
+    print(
+        f"评论 {report['comments']}/{report['quota']} 条（抽奖 {report['lottery_comments']} 条），"
+        f"被拒绝 {report['rejected']} 次，当前间隔系数 {report['pacing_factor']}"
+    )
+    print("\n大模型用量:")
+    for prompt_type, usage in report["llm_usage"].items():
+        print(f"  {prompt_type}: {usage['requests']} 次，输入 {usage['prompt']}，输出 {usage['output']}")
+    print("\n时间线:")
+    for entry in report["timeline"]:
+        print(f"  {_format_offset(entry['offset'])}  {entry['event']:<8} {entry['detail']}")
+    print("\n检查:")
+    for name, ok in report["checks"].items():
+        print(f"  {'✓' if ok else '✗'} {name}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="虚拟时钟下的全天模拟运行")
+    parser.add_argument("--seed", type=int, default=1, help="随机种子")
+    parser.add_argument("--posts", type=int, default=60, help="替身论坛的帖子数量")
+    parser.add_argument("--lotteries", type=int, default=10, help="其中抽奖候选帖子的数量")
+    parser.add_argument("--server-min-gap", type=float, default=0, help="替身论坛拒绝间隔小于该秒数的评论，0 为不限制")
+    parser.add_argument("--workdir", help="状态文件和日志目录，默认新建临时目录")
+    parser.add_argument("--verbose", action="store_true", help="输出完整运行日志，默认写入工作目录的 run.log")
+    args = parser.parse_args()
+    result = simulate(args.seed, args.posts, args.lotteries, args.server_min_gap, args.workdir, args.verbose)
+    print_report(result)
+    sys.exit(0 if all(result["checks"].values()) else 1)
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+大模型 token 用量统计与每日预算
+按提示词类型记录每次调用的输入、输出和思考 token，按天持久化；
+预算紧张时只保留抽奖相关调用，其余走本地规则、分类器和回复库，预算用完后停止调用
+"""
+import json
+import os
+import threading
+
+import clock
+
+USAGE_PATH = os.environ.get("NS_TOKEN_USAGE", "token_usage.json")
+# 每日 token / 请求数上限，0 表示不限制
+DAILY_TOKEN_BUDGET = int(os.environ.get("NS_DAILY_TOKEN_BUDGET", "0"))
+DAILY_REQUEST_BUDGET = int(os.environ.get("NS_DAILY_REQUEST_BUDGET", "0"))
+# 剩余预算低于该比例时进入节省模式，只保留抽奖相关调用
+BUDGET_RESERVE = float(os.environ.get("NS_BUDGET_RESERVE", "0.2"))
+# 用量记录保留天数
+USAGE_KEEP_DAYS = 30
+
+# 节省模式下仍允许的提示词类型
+PRIORITY_PROMPT_TYPES = ("is_real", "ended", "reply_lottery")
+
+RUN_USAGE = {}
+
+_daily = None
+# 对冲请求在后台线程中完成，记录用量时加锁
+_lock = threading.Lock()
+
+
+def _empty():
+    return {"requests": 0, "prompt": 0, "output": 0, "thinking": 0}
+
+
+def _today():
+    return clock.today()
+
+
+def _load():
+    global _daily
+    if _daily is None:
+        _daily = {}
+        if os.path.exists(USAGE_PATH):
+            try:
+                with open(USAGE_PATH, encoding='utf-8') as f:
+                    _daily = json.load(f)
+            except Exception as e:
+                print(f"加载 token 用量记录出错：{str(e)}")
+    return _daily
+
+
+def _save():
+    days = sorted(_daily)
+    for day in days[:-USAGE_KEEP_DAYS]:
+        del _daily[day]
+    try:
+        with open(USAGE_PATH, 'w', encoding='utf-8') as f:
+            json.dump(_daily, f, ensure_ascii=False, indent=2)
+    except Exception as e:
+        print(f"保存 token 用量记录出错：{str(e)}")
+
+
+def record_usage(prompt_type, prompt_tokens, output_tokens, thinking_tokens):
+    """记录一次请求的 token 用量，失败的请求按 0 token 计入请求数"""
+    with _lock:
+        today = _load().setdefault(_today(), {})
+        for usage in (RUN_USAGE.setdefault(prompt_type, _empty()), today.setdefault(prompt_type, _empty())):
+            usage["requests"] += 1
+            usage["prompt"] += prompt_tokens
+            usage["output"] += output_tokens
+            usage["thinking"] += thinking_tokens
+        _save()
+
+
+def _totals(usage_by_type):
+    tokens = sum(u["prompt"] + u["output"] + u["thinking"] for u in usage_by_type.values())
+    requests = sum(u["requests"] for u in usage_by_type.values())
+    return tokens, requests
+
+
+def remaining_ratio():
+    """今日剩余预算比例（token 与请求数中较紧的一项），未设置预算时返回 1"""
+    tokens, requests = _totals(_load().get(_today(), {}))
+    ratios = [1.0]
+    if DAILY_TOKEN_BUDGET > 0:
+        ratios.append(1 - tokens / DAILY_TOKEN_BUDGET)
+    if DAILY_REQUEST_BUDGET > 0:
+        ratios.append(1 - requests / DAILY_REQUEST_BUDGET)
+    return max(0.0, min(ratios))
+
+
+def budget_allows(prompt_type):
+    """当前预算是否允许该类型的调用"""
+    ratio = remaining_ratio()
+    if ratio <= 0:
+        return False
+    if ratio < BUDGET_RESERVE:
+        return prompt_type in PRIORITY_PROMPT_TYPES
+    return True
+
+
+def usage_summary():
+    """返回本次运行按提示词类型的用量以及今日预算使用情况"""
+    lines = []
+    for prompt_type, usage in RUN_USAGE.items():
+        lines.append(
+            f"{prompt_type}: {usage['requests']} 次，输入 {usage['prompt']}，输出 {usage['output']}，思考 {usage['thinking']}"
+        )
+    tokens, requests = _totals(_load().get(_today(), {}))
+    token_limit = DAILY_TOKEN_BUDGET if DAILY_TOKEN_BUDGET > 0 else "不限"
+    request_limit = DAILY_REQUEST_BUDGET if DAILY_REQUEST_BUDGET > 0 else "不限"
+    lines.append(f"今日累计: token {tokens}/{token_limit}，请求 {requests}/{request_limit}")
+    return "token 用量统计：\n  " + "\n  ".join(lines)